@@ -0,0 +1,249 @@
+#!/usr/bin/python2.5
+#
+# Resolves the aliases and subjects of webfinger descriptions into
+# merged identities.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import crawler
+import scheduler
+import webfinger
+import xrd_pb2
+import xrdcache
+
+# The default number of alias hops followed from each id
+DEFAULT_MAX_DEPTH = 2
+
+
+def canonicalize(uri):
+  """Puts an account id or http(s) URL into a canonical form.
+
+  Args:
+    uri: An account id, with or without 'acct:', or a URL
+  Returns:
+    An 'acct:' URI or normalized URL, or None for anything else.
+  """
+  if not uri:
+    return None
+  uri = uri.strip()
+  scheme = uri.split(':', 1)[0].lower()
+  if scheme in ['http', 'https']:
+    return crawler.normalize_url(uri)
+  if ':' in uri and scheme != 'acct':
+    return None
+  try:
+    return 'acct:%s@%s' % webfinger.parse_id(uri)
+  except webfinger.ParseError:
+    return None
+
+
+class _Clusters(object):
+  """A union-find forest grouping URIs known to name the same identity."""
+
+  def __init__(self):
+    self._parents = dict()
+
+  def find(self, uri):
+    parent = self._parents.setdefault(uri, uri)
+    if parent == uri:
+      return uri
+    root = self.find(parent)
+    self._parents[uri] = root
+    return root
+
+  def union(self, a, b):
+    root_a, root_b = self.find(a), self.find(b)
+    if root_a != root_b:
+      # Keep the smaller root so results don't depend on completion order
+      if root_b < root_a:
+        root_a, root_b = root_b, root_a
+      self._parents[root_b] = root_a
+
+  def members(self):
+    """Returns a dict from each root to the sorted URIs in its cluster."""
+    clusters = dict()
+    for uri in self._parents:
+      clusters.setdefault(self.find(uri), list()).append(uri)
+    for uris in clusters.values():
+      uris.sort()
+    return clusters
+
+
+def merge(descriptions, uris):
+  """Combines the descriptions of one identity into a single Xrd.
+
+  The subject is the one most descriptions declare, preferring accounts
+  and then the first in sorted order; every other name becomes an alias.
+  Links and properties are deduplicated, keeping their first appearance.
+  The earliest expiry wins.
+
+  Args:
+    descriptions: A list of xrd_pb2.Xrd instances
+    uris: The canonical URIs known to name the identity
+  Returns:
+    An xrd_pb2.Xrd instance.
+  """
+  names = set(uris)
+  votes = dict()
+  for description in descriptions:
+    subject = canonicalize(description.subject)
+    if subject:
+      votes[subject] = votes.get(subject, 0) + 1
+    for alias in description.aliases:
+      names.add(canonicalize(alias) or alias)
+  def rank(uri):
+    return (-votes.get(uri, 0), not uri.startswith('acct:'), uri)
+  merged = xrd_pb2.Xrd()
+  candidates = sorted(names | set(votes), key=rank)
+  if candidates:
+    merged.subject = candidates[0]
+    merged.aliases.extend(sorted(candidates[1:]))
+  seen = set()
+  expires = None
+  for description in descriptions:
+    for link in description.links:
+      key = ('link', link.SerializeToString())
+      if key not in seen:
+        seen.add(key)
+        merged.links.add().CopyFrom(link)
+    for property in description.properties:
+      key = ('property', property.SerializeToString())
+      if key not in seen:
+        seen.add(key)
+        merged.properties.add().CopyFrom(property)
+    when = xrdcache.parse_datetime(description.expires)
+    if when is not None and (expires is None or when < expires[0]):
+      expires = (when, description.expires)
+  if expires is not None:
+    merged.expires = expires[1]
+  return merged
+
+
+class AliasResolver(object):
+  """Follows aliases and subjects between webfinger descriptions.
+
+  Resolving a batch looks up every id, then every account or URL named as
+  a subject or alias, level by level and concurrently, up to a depth
+  limit. Each URI is looked up at most once per batch, which also breaks
+  cycles. URIs whose descriptions name each other are grouped into one
+  identity whose descriptions are merged, so ids in the same cluster share
+  one traversal and one result. A name claimed by only one side, or whose
+  description was not fetched, is kept as an alias but not merged.
+  """
+
+  def __init__(self, client=None, max_depth=DEFAULT_MAX_DEPTH,
+               max_workers=webfinger.DEFAULT_MAX_WORKERS):
+    """Constructs a new resolver.
+
+    Args:
+      client: A webfinger.Client, by default one whose requests to each
+        host are limited by a scheduler.HostScheduler [optional]
+      max_depth: The number of alias hops followed from each id [optional]
+      max_workers: The maximum number of concurrent lookups [optional]
+    """
+    if client is None:
+      client = webfinger.Client(scheduler=scheduler.HostScheduler())
+    self._client = client
+    self._max_depth = max_depth
+    self._max_workers = max_workers
+    self.lookups = 0
+
+  def resolve(self, id):
+    """Resolves a single id.
+
+    Returns:
+      A merged xrd_pb2.Xrd instance.
+    Raises:
+      FetchError, ParseError as for webfinger.Client.lookup
+    """
+    id, merged, error = self.resolve_many([id])[0]
+    if error is not None:
+      raise error
+    return merged
+
+  def resolve_many(self, ids):
+    """Resolves a batch of ids, sharing lookups between them.
+
+    Args:
+      ids: An iterable of account ids or URLs
+    Returns:
+      A list with an (id, merged xrd_pb2.Xrd, error) tuple for each id,
+      in order, where exactly one of the description and error is None.
+      Ids naming the same identity share one merged instance.
+    """
+    roots = list()
+    depths = dict()
+    frontier = list()
+    for id in ids:
+      uri = canonicalize(id)
+      roots.append((id, uri))
+      if uri is not None and uri not in depths:
+        depths[uri] = 0
+        frontier.append(uri)
+    memo = dict()
+    claims = dict()
+    clusters = _Clusters()
+    depth = 0
+    while frontier:
+      next_frontier = list()
+      for uri, descriptions, error in webfinger.map_concurrently(
+          self._client.lookup_uri, frontier, self._max_workers):
+        self.lookups += 1
+        memo[uri] = (descriptions, error)
+        clusters.find(uri)
+        if error is not None:
+          continue
+        names = claims.setdefault(uri, set())
+        for description in descriptions:
+          for name in [description.subject] + list(description.aliases):
+            related = canonicalize(name)
+            if related is None:
+              continue
+            names.add(related)
+            if related not in depths:
+              depths[related] = depth + 1
+              if depth < self._max_depth:
+                next_frontier.append(related)
+      frontier = next_frontier
+      depth += 1
+    # Anyone can claim a name, so only names that claim each other merge
+    for uri, names in claims.items():
+      for related in names:
+        if uri in claims.get(related, ()):
+          clusters.union(uri, related)
+    merged = dict()
+    for root, uris in clusters.members().items():
+      descriptions = list()
+      for uri in uris:
+        if uri in memo and memo[uri][1] is None:
+          descriptions.extend(memo[uri][0])
+      if descriptions:
+        merged[root] = merge(descriptions, uris)
+    results = list()
+    for id, uri in roots:
+      if uri is None:
+        results.append(
+            (id, None, webfinger.ParseError('Could not parse %s' % id)))
+        continue
+      identity = merged.get(clusters.find(uri))
+      if identity is None:
+        error = memo[uri][1]
+        if error is None:
+          # Such as a host-meta without lrdd links
+          error = webfinger.FetchError('No descriptions for %s' % id)
+        results.append((id, None, error))
+      else:
+        results.append((id, identity, None))
+    return results
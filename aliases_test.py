@@ -0,0 +1,151 @@
+#!/usr/bin/python2.5
+#
+# Tests alias and subject resolution.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import aliases
+import unittest
+import urllib
+import webfinger
+import webfinger_test
+import xrd_pb2
+
+HOST_META = '''<XRD xmlns="http://docs.oasis-open.org/ns/xri/xrd-1.0">
+                 <Link rel="lrdd"
+                       template="http://example.com/describe?uri={uri}" />
+               </XRD>'''
+
+
+def description(subject, names, link, expires=None):
+  parts = ['<XRD xmlns="http://docs.oasis-open.org/ns/xri/xrd-1.0">']
+  if expires:
+    parts.append('<Expires>%s</Expires>' % expires)
+  parts.append('<Subject>%s</Subject>' % subject)
+  for name in names:
+    parts.append('<Alias>%s</Alias>' % name)
+  parts.append('<Link rel="%s" href="http://example.com/" />' % link)
+  parts.append('</XRD>')
+  return ''.join(parts)
+
+
+def describe_url(uri):
+  return 'http://example.com/describe?uri=%s' % urllib.quote(uri, safe='~')
+
+
+DOCUMENTS = {
+  'http://example.com/.well-known/host-meta': HOST_META,
+  'http://example.net/.well-known/host-meta':
+      '<XRD xmlns="http://docs.oasis-open.org/ns/xri/xrd-1.0" />',
+  # bob and robert name each other; robert also names a profile page
+  describe_url('acct:bob@example.com'): description(
+      'acct:bob@example.com', ['acct:robert@example.com'], 'bob',
+      '2009-11-05T12:00:00Z'),
+  describe_url('acct:robert@example.com'): description(
+      'acct:bob@example.com',
+      ['acct:bob@example.com', 'http://example.com/~bob'], 'robert',
+      '2009-11-05T10:00:00Z'),
+  describe_url('http://example.com/~bob'): description(
+      'http://example.com/~bob',
+      ['acct:robert@example.com', 'acct:deep@example.com'], 'profile'),
+  describe_url('acct:alice@example.com'): description(
+      'acct:alice@example.com', ['mailto:alice@example.com'], 'alice'),
+  # mallory claims to be alice, who doesn't name mallory back
+  describe_url('acct:mallory@example.com'): description(
+      'acct:mallory@example.com', ['acct:alice@example.com'], 'mallory'),
+}
+
+
+class CanonicalizeTest(unittest.TestCase):
+
+  def testCanonicalize(self):
+    self.assertEquals('acct:bob@example.com',
+                      aliases.canonicalize('bob@Example.COM'))
+    self.assertEquals('acct:bob@example.com',
+                      aliases.canonicalize('acct:bob@example.com'))
+    self.assertEquals('http://example.com/',
+                      aliases.canonicalize('HTTP://example.com:80'))
+    self.assertEquals(None, aliases.canonicalize('mailto:bob@example.com'))
+    self.assertEquals(None, aliases.canonicalize(''))
+
+
+class AliasResolverTest(unittest.TestCase):
+
+  def new_resolver(self, **kwargs):
+    self.http = webfinger_test.FakeHttp(DOCUMENTS)
+    client = webfinger.Client(http_client=self.http)
+    return aliases.AliasResolver(client, **kwargs)
+
+  def testClusterSharesOneTraversal(self):
+    resolver = self.new_resolver()
+    results = resolver.resolve_many(
+        ['bob@example.com', 'acct:robert@example.com', 'bob@example.com'])
+    merged = results[0][1]
+    for id, identity, error in results:
+      self.assertEquals(None, error)
+      self.assert_(identity is merged)
+    self.assertEquals('acct:bob@example.com', merged.subject)
+    self.assertEquals(['acct:deep@example.com', 'acct:robert@example.com',
+                       'http://example.com/~bob'], list(merged.aliases))
+    self.assertEquals(['bob', 'robert', 'profile'],
+                      [link.rel for link in merged.links])
+    self.assertEquals('2009-11-05T10:00:00Z', merged.expires)
+    # bob, robert, the profile page and deep (which fails), each once
+    self.assertEquals(4, resolver.lookups)
+
+  def testDepthLimit(self):
+    resolver = self.new_resolver(max_depth=0)
+    merged = resolver.resolve('bob@example.com')
+    self.assertEquals(['bob'], [link.rel for link in merged.links])
+    self.assertEquals(1, resolver.lookups)
+
+  def testUnresolvableAliasesAreKept(self):
+    merged = self.new_resolver().resolve('alice@example.com')
+    self.assertEquals(['mailto:alice@example.com'], list(merged.aliases))
+
+  def testOneWayClaimsAreNotMerged(self):
+    resolver = self.new_resolver()
+    results = resolver.resolve_many(['mallory@example.com',
+                                     'alice@example.com'])
+    mallory, alice = results[0][1], results[1][1]
+    self.assertEquals('acct:mallory@example.com', mallory.subject)
+    self.assertEquals(['mallory'], [link.rel for link in mallory.links])
+    self.assertEquals(['alice'], [link.rel for link in alice.links])
+
+  def testErrors(self):
+    resolver = self.new_resolver()
+    results = resolver.resolve_many(['nobody@example.org', 'not an id'])
+    self.assert_(isinstance(results[0][2], webfinger.FetchError))
+    self.assert_(isinstance(results[1][2], webfinger.ParseError))
+    self.assertRaises(webfinger.FetchError, resolver.resolve,
+                      'nobody@example.org')
+
+  def testNoDescriptions(self):
+    resolver = self.new_resolver()
+    id, merged, error = resolver.resolve_many(['bob@example.net'])[0]
+    self.assertEquals(None, merged)
+    self.assert_(isinstance(error, webfinger.FetchError))
+    self.assertRaises(webfinger.FetchError, resolver.resolve,
+                      'bob@example.net')
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(CanonicalizeTest))
+  suite.addTests(unittest.makeSuite(AliasResolverTest))
+  return suite
+
+if __name__ == '__main__':
+  unittest.main()
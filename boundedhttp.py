@@ -0,0 +1,236 @@
+#!/usr/bin/python2.5
+#
+# An HTTP client that bounds the size of the documents it downloads.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import imports
+
+import httplib
+import httplib2
+import socket
+import threading
+import zlib
+
+# The default largest body accepted on the wire, in bytes
+DEFAULT_MAX_WIRE_SIZE = 256 * 1024
+
+# The default largest body accepted after decompression, in bytes
+DEFAULT_MAX_SIZE = 1024 * 1024
+
+# The number of bytes read from the socket at a time
+CHUNK_SIZE = 16 * 1024
+
+# The Accept-Encoding sent when compression is negotiated
+ACCEPT_ENCODING = 'gzip, deflate'
+
+# zlib window sizes for each supported Content-Encoding
+WINDOW_BITS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+
+class ContentTooLarge(httplib2.HttpLib2Error):
+  """Raised when a response body exceeds a size limit."""
+  pass
+
+
+class TransferStats(object):
+  """Thread-safe counters of bytes transferred, shared between clients."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.responses = 0
+    self.compressed_responses = 0
+    self.wire_bytes = 0
+    self.decoded_bytes = 0
+    self.aborted = 0
+
+  def record(self, wire_bytes, decoded_bytes, compressed):
+    """Counts one completed response body."""
+    self._lock.acquire()
+    try:
+      self.responses += 1
+      self.wire_bytes += wire_bytes
+      self.decoded_bytes += decoded_bytes
+      if compressed:
+        self.compressed_responses += 1
+    finally:
+      self._lock.release()
+
+  def record_abort(self):
+    """Counts one response abandoned for exceeding a limit."""
+    self._lock.acquire()
+    try:
+      self.aborted += 1
+    finally:
+      self._lock.release()
+
+  def stats(self):
+    """Returns a dict of transfer counters and the bytes saved."""
+    stats = {'responses': self.responses,
+             'compressed_responses': self.compressed_responses,
+             'wire_bytes': self.wire_bytes,
+             'decoded_bytes': self.decoded_bytes,
+             'bytes_saved': self.decoded_bytes - self.wire_bytes,
+             'aborted': self.aborted,
+             'compression_ratio': 1.0}
+    if self.decoded_bytes:
+      stats['compression_ratio'] = (
+          float(self.wire_bytes) / self.decoded_bytes)
+    return stats
+
+
+def read_body(response, max_wire_size=DEFAULT_MAX_WIRE_SIZE,
+              max_size=DEFAULT_MAX_SIZE):
+  """Reads and decodes a response body without exceeding the size limits.
+
+  The body is inflated as it arrives, and each step produces at most the
+  remaining allowance, so a small compressed body can not expand into a
+  large one in memory.
+
+  Args:
+    response: An httplib.HTTPResponse whose body has not been read
+    max_wire_size: The most bytes to read from the connection, or None
+    max_size: The most bytes to decode, or None
+  Returns:
+    A tuple of (decoded body, bytes read, whether the body was compressed)
+  Raises:
+    ContentTooLarge if a limit is exceeded
+    zlib.error if the body can not be decoded
+  """
+  encoding = (response.getheader('content-encoding') or '').strip().lower()
+  declared = response.getheader('content-length')
+  if max_wire_size is not None and declared and declared.isdigit():
+    if int(declared) > max_wire_size:
+      raise ContentTooLarge('Content-Length %s exceeds %d bytes' %
+                            (declared, max_wire_size))
+  decompressor = None
+  if encoding in WINDOW_BITS:
+    decompressor = zlib.decompressobj(WINDOW_BITS[encoding])
+  chunks = list()
+  wire_bytes = decoded_bytes = 0
+  while True:
+    chunk = response.read(CHUNK_SIZE)
+    if not chunk:
+      break
+    wire_bytes += len(chunk)
+    if max_wire_size is not None and wire_bytes > max_wire_size:
+      raise ContentTooLarge('Body exceeds %d bytes on the wire' %
+                            max_wire_size)
+    while chunk:
+      if decompressor is None:
+        decoded, chunk = chunk, ''
+      elif max_size is None:
+        decoded, chunk = decompressor.decompress(chunk), ''
+      else:
+        # Ask for one byte more than allowed to detect an overflow
+        decoded = decompressor.decompress(chunk, max_size - decoded_bytes + 1)
+        chunk = decompressor.unconsumed_tail
+      decoded_bytes += len(decoded)
+      if max_size is not None and decoded_bytes > max_size:
+        raise ContentTooLarge('Body exceeds %d bytes decoded' % max_size)
+      chunks.append(decoded)
+  if decompressor is not None:
+    decoded = decompressor.flush()
+    decoded_bytes += len(decoded)
+    if max_size is not None and decoded_bytes > max_size:
+      raise ContentTooLarge('Body exceeds %d bytes decoded' % max_size)
+    chunks.append(decoded)
+  return ''.join(chunks), wire_bytes, decompressor is not None
+
+
+class Http(httplib2.Http):
+  """An httplib2.Http that decodes bodies incrementally within limits.
+
+  Replaces httplib2's read-then-inflate handling of response bodies, which
+  holds the whole compressed and decompressed body in memory and accepts
+  bodies of any size.
+  """
+
+  def __init__(self, cache=None, timeout=None, proxy_info=None,
+               max_wire_size=DEFAULT_MAX_WIRE_SIZE, max_size=DEFAULT_MAX_SIZE,
+               compress=True, stats=None):
+    """Constructs a new HTTP client.
+
+    Args:
+      cache: As for httplib2.Http [optional]
+      timeout: As for httplib2.Http [optional]
+      proxy_info: As for httplib2.Http [optional]
+      max_wire_size: The largest body read, or None [optional]
+      max_size: The largest body after decompression, or None [optional]
+      compress: Whether to ask for gzip or deflate bodies [optional]
+      stats: A TransferStats, usually shared between clients [optional]
+    """
+    httplib2.Http.__init__(self, cache, timeout, proxy_info)
+    self.max_wire_size = max_wire_size
+    self.max_size = max_size
+    self.compress = compress
+    if stats is None:
+      stats = TransferStats()
+    self.transfer_stats = stats
+
+  def _conn_request(self, conn, request_uri, method, body, headers):
+    # The timeout may have changed since the connection was opened
+    conn.timeout = self.timeout
+    if conn.sock is not None and httplib2.has_timeout(self.timeout):
+      conn.sock.settimeout(self.timeout)
+    headers = dict(headers)
+    if self.compress:
+      headers['accept-encoding'] = ACCEPT_ENCODING
+    else:
+      headers['accept-encoding'] = 'identity'
+    for i in range(2):
+      try:
+        conn.request(method, request_uri, body, headers)
+      except socket.gaierror:
+        conn.close()
+        raise httplib2.ServerNotFoundError(
+            'Unable to find the server at %s' % conn.host)
+      except (socket.error, httplib.HTTPException):
+        # The server may have answered before closing the connection
+        pass
+      try:
+        response = conn.getresponse()
+      except (socket.error, httplib.HTTPException):
+        if i == 0:
+          conn.close()
+          conn.connect()
+          continue
+        raise
+      break
+    content = ''
+    compressed = False
+    if method != 'HEAD':
+      try:
+        content, wire_bytes, compressed = read_body(
+            response, self.max_wire_size, self.max_size)
+      except ContentTooLarge:
+        # The rest of the body is unread, so the connection is unusable
+        conn.close()
+        self.transfer_stats.record_abort()
+        raise
+      except zlib.error:
+        conn.close()
+        raise httplib2.FailedToDecompressContent(
+            'Content purported to be compressed with %s but failed to '
+            'decompress.' % response.getheader('content-encoding'),
+            httplib2.Response(response), '')
+      self.transfer_stats.record(wire_bytes, len(content), compressed)
+    response = httplib2.Response(response)
+    if compressed:
+      # As httplib2 does, keep a record of the encoding that won't interfere
+      response['content-length'] = str(len(content))
+      response['-content-encoding'] = response['content-encoding']
+      del response['content-encoding']
+    return response, content
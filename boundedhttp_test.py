@@ -0,0 +1,169 @@
+#!/usr/bin/python2.5
+#
+# Tests the size-bounded HTTP client.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import BaseHTTPServer
+import StringIO
+import boundedhttp
+import gzip
+import threading
+import unittest
+import zlib
+
+DOCUMENT = '<XRD>' + 'x' * 10000 + '</XRD>'
+
+
+def gzip_compress(data):
+  buffer = StringIO.StringIO()
+  stream = gzip.GzipFile(fileobj=buffer, mode='wb')
+  stream.write(data)
+  stream.close()
+  return buffer.getvalue()
+
+
+BODIES = {
+  '/plain': ('', DOCUMENT),
+  '/gzip': ('gzip', gzip_compress(DOCUMENT)),
+  '/deflate': ('deflate', zlib.compress(DOCUMENT)),
+  '/bomb': ('gzip', gzip_compress('\0' * (4 * 1024 * 1024))),
+  '/broken': ('gzip', 'not gzip at all'),
+}
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+  def do_GET(self):
+    self.server.accept_encodings.append(self.headers.get('accept-encoding'))
+    encoding, body = BODIES[self.path]
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/xrd+xml')
+    self.send_header('Content-Length', str(len(body)))
+    if encoding:
+      self.send_header('Content-Encoding', encoding)
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+
+class Server(BaseHTTPServer.HTTPServer):
+  def handle_error(self, request, client_address):
+    pass  # Clients abort oversized bodies by closing the connection
+
+
+class HttpTest(unittest.TestCase):
+
+  def setUp(self):
+    self.server = Server(('127.0.0.1', 0), Handler)
+    self.server.accept_encodings = list()
+    thread = threading.Thread(target=self.server.serve_forever)
+    thread.setDaemon(True)
+    thread.start()
+    self.stats = boundedhttp.TransferStats()
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def url(self, path):
+    return 'http://127.0.0.1:%d%s' % (self.server.server_address[1], path)
+
+  def fetch(self, path, **kwargs):
+    http = boundedhttp.Http(stats=self.stats, **kwargs)
+    return http.request(self.url(path))
+
+  def testPlain(self):
+    response, content = self.fetch('/plain')
+    self.assertEquals(DOCUMENT, content)
+    stats = self.stats.stats()
+    self.assertEquals(len(DOCUMENT), stats['wire_bytes'])
+    self.assertEquals(len(DOCUMENT), stats['decoded_bytes'])
+    self.assertEquals(0, stats['compressed_responses'])
+
+  def testTimeoutChangesApplyToOpenConnections(self):
+    http = boundedhttp.Http(timeout=5)
+    http.request(self.url('/plain'))
+    http.timeout = 2
+    http.request(self.url('/plain'))
+    self.assertEquals([2], [conn.timeout for conn in http.connections.values()])
+
+  def testGzip(self):
+    response, content = self.fetch('/gzip')
+    self.assertEquals(DOCUMENT, content)
+    self.assertEquals('gzip', response['-content-encoding'])
+    self.failIf('content-encoding' in response)
+    self.assertEquals(str(len(DOCUMENT)), response['content-length'])
+    stats = self.stats.stats()
+    self.assertEquals(len(BODIES['/gzip'][1]), stats['wire_bytes'])
+    self.assertEquals(len(DOCUMENT), stats['decoded_bytes'])
+    self.assertEquals(1, stats['compressed_responses'])
+    self.assert_(stats['bytes_saved'] > 0)
+
+  def testDeflate(self):
+    response, content = self.fetch('/deflate')
+    self.assertEquals(DOCUMENT, content)
+
+  def testNegotiatesCompression(self):
+    self.fetch('/plain')
+    self.fetch('/plain', compress=False)
+    self.assertEquals([boundedhttp.ACCEPT_ENCODING, 'identity'],
+                      self.server.accept_encodings)
+
+  def testWireLimit(self):
+    self.assertRaises(boundedhttp.ContentTooLarge,
+                      self.fetch, '/plain', max_wire_size=1000)
+    self.assertEquals(1, self.stats.stats()['aborted'])
+
+  def testDecodedLimit(self):
+    self.assertRaises(boundedhttp.ContentTooLarge,
+                      self.fetch, '/bomb', max_size=64 * 1024)
+    self.assertEquals(1, self.stats.stats()['aborted'])
+
+  def testBrokenEncoding(self):
+    self.assertRaises(boundedhttp.httplib2.FailedToDecompressContent,
+                      self.fetch, '/broken')
+
+
+class ReadBodyTest(unittest.TestCase):
+
+  def testDecodedLimitExact(self):
+    class FakeResponse(object):
+      def __init__(self, body, encoding):
+        self.stream = StringIO.StringIO(body)
+        self.headers = {'content-encoding': encoding}
+      def getheader(self, name):
+        return self.headers.get(name)
+      def read(self, size):
+        return self.stream.read(size)
+    body = gzip_compress(DOCUMENT)
+    content, wire_bytes, compressed = boundedhttp.read_body(
+        FakeResponse(body, 'gzip'), None, len(DOCUMENT))
+    self.assertEquals(DOCUMENT, content)
+    self.assertEquals(len(body), wire_bytes)
+    self.assert_(compressed)
+    self.assertRaises(boundedhttp.ContentTooLarge, boundedhttp.read_body,
+                      FakeResponse(body, 'gzip'), None, len(DOCUMENT) - 1)
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(HttpTest))
+  suite.addTests(unittest.makeSuite(ReadBodyTest))
+  return suite
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/python2.5
+#
+# Builds a precompiled zip bundle of the third_party modules the app uses.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Usage:
+#
+#   build_bundle.py          Writes third_party.zip next to imports.py
+#   build_bundle.py --time   Also compares cold import times with and
+#                            without the bundle
+#
+# imports.py puts the bundle ahead of third_party/ on sys.path whenever it
+# exists, so it must be rebuilt (or deleted) after third_party/ changes.
+# The bundle holds every module of each package the app imports, as
+# source and bytecode. Bytecode from another Python version is ignored
+# by zipimport, which then compiles the bundled source instead.
+
+import imports
+
+import modulefinder
+import os
+import py_compile
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+# The scripts whose imports are bundled
+ENTRY_POINTS = ['main.py', 'webfinger.py']
+
+# The statement timed for a cold start
+COLD_START_IMPORTS = ('import imports, webfinger, xfn, xrd, html5lib, '
+                      'html5lib.treebuilders, simplejson')
+
+# The number of cold starts timed with and without the bundle
+TIMING_RUNS = 10
+
+
+class UsageError(Exception):
+  """Raised on command-line usage errors."""
+  pass
+
+
+def find_modules():
+  """Returns the source files of the third_party packages the app imports.
+
+  modulefinder can't see modules imported by name at run time, such as
+  html5lib's tree walkers, so every module of each package it finds is
+  bundled, not only the ones it saw imported.
+
+  Returns:
+    A sorted list of (archive name, source path) tuples.
+  """
+  path = [imports.APP_DIR, imports.THIRD_PARTY] + sys.path
+  finder = modulefinder.ModuleFinder(path)
+  for entry_point in ENTRY_POINTS:
+    finder.run_script(os.path.join(imports.APP_DIR, entry_point))
+  prefix = imports.THIRD_PARTY + os.sep
+  tops = set()
+  for module in finder.modules.values():
+    filename = module.__file__
+    if filename and filename.startswith(prefix):
+      tops.add(filename[len(prefix):].split(os.sep)[0])
+  modules = list()
+  for top in tops:
+    top_path = os.path.join(imports.THIRD_PARTY, top)
+    if os.path.isfile(top_path):
+      if top.endswith('.py'):
+        modules.append((top, top_path))
+      continue
+    for directory, subdirectories, filenames in os.walk(top_path):
+      for filename in filenames:
+        if filename.endswith('.py'):
+          source_path = os.path.join(directory, filename)
+          archive_name = source_path[len(prefix):].replace(os.sep, '/')
+          modules.append((archive_name, source_path))
+  modules.sort()
+  return modules
+
+
+def build(bundle_path=imports.BUNDLE):
+  """Compiles the imported third_party packages into a zip file.
+
+  Each module is stored as source as well as bytecode, so that a bundle
+  built by another Python version still imports, only more slowly.
+
+  Args:
+    bundle_path: The zip file to write [optional]
+  Returns:
+    The number of modules bundled.
+  """
+  modules = find_modules()
+  directory = tempfile.mkdtemp()
+  temporary_path = bundle_path + '.tmp'
+  bundle = zipfile.ZipFile(temporary_path, 'w', zipfile.ZIP_DEFLATED)
+  try:
+    for archive_name, source_path in modules:
+      compiled_path = os.path.join(directory, 'module.pyc')
+      py_compile.compile(source_path, compiled_path, doraise=True)
+      bundle.write(source_path, archive_name)
+      bundle.write(compiled_path, archive_name + 'c')
+      os.remove(compiled_path)
+  finally:
+    bundle.close()
+    os.rmdir(directory)
+  os.rename(temporary_path, bundle_path)
+  return len(modules)
+
+
+def time_cold_starts(use_bundle):
+  """Returns the fastest and median times to import the app in a new process.
+
+  Args:
+    use_bundle: Whether imports.py may use the bundle
+  """
+  environment = dict(os.environ)
+  if use_bundle:
+    environment.pop('WEBFINGER_NO_BUNDLE', None)
+  else:
+    environment['WEBFINGER_NO_BUNDLE'] = '1'
+  command = [sys.executable, '-c', COLD_START_IMPORTS]
+  times = list()
+  for i in range(TIMING_RUNS):
+    start = time.time()
+    subprocess.check_call(command, cwd=imports.APP_DIR, env=environment)
+    times.append(time.time() - start)
+  times.sort()
+  return times[0], times[len(times) // 2]
+
+
+def main(argv):
+  if len(argv) > 2 or (len(argv) == 2 and argv[1] != '--time'):
+    raise UsageError('Usage build_bundle.py [--time]')
+  count = build()
+  print 'Bundled %d modules into %s (%d bytes)' % (
+      count, imports.BUNDLE, os.path.getsize(imports.BUNDLE))
+  if len(argv) == 2:
+    for name, use_bundle in [('third_party/', False), ('bundle', True)]:
+      fastest, median = time_cold_starts(use_bundle)
+      print '%-12s fastest %6.1f ms  median %6.1f ms' % (
+          name, fastest * 1000, median * 1000)
+
+if __name__ == "__main__":
+  main(sys.argv)
@@ -0,0 +1,251 @@
+#!/usr/bin/python2.5
+#
+# Stores httplib2 cache entries in a compact, compressed binary format.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# httplib2 caches a response as its status, every header and the body, as
+# text. An encoded entry is instead PREFIX, a version byte and a flags
+# byte, followed by delimited records (see delimited.py): the status, then
+# the name and value of each header kept, then the body, which is zlib
+# compressed if FLAG_COMPRESSED is set.
+
+import StringIO
+import delimited
+import logging
+import threading
+import time
+import zlib
+
+# The first bytes of every encoded entry; httplib2's own entries start
+# with 'status:', so the two can not be confused
+PREFIX = '\xffWC'
+
+# The version of the encoding written
+VERSION = 1
+
+# Set in the flags byte when the body is compressed
+FLAG_COMPRESSED = 1
+
+# The headers httplib2, boundedhttp and the client read from a cached
+# response; httplib2 and boundedhttp also keep their own, '-' prefixed
+KEPT_HEADERS = frozenset([
+    'age', 'cache-control', 'content-length', 'content-location',
+    'content-type', 'date', 'etag', 'expires', 'last-modified', 'location',
+    'pragma', 'vary'])
+
+# The default smallest body, in bytes, that is compressed
+DEFAULT_MIN_COMPRESS_SIZE = 512
+
+# The default largest entry, in bytes, that is stored; memcache refuses
+# items of 1 MB or more, key included
+DEFAULT_MAX_ITEM_SIZE = 1000 * 1000
+
+# The zlib compression level
+DEFAULT_LEVEL = 6
+
+
+class FormatError(Exception):
+  """Raised when an encoded entry can not be decoded."""
+  pass
+
+
+def encode(value, min_compress_size=DEFAULT_MIN_COMPRESS_SIZE,
+           level=DEFAULT_LEVEL):
+  """Encodes an httplib2 cache entry compactly.
+
+  Args:
+    value: The entry as httplib2 writes it
+    min_compress_size: The smallest body that is compressed [optional]
+    level: The zlib compression level [optional]
+  Returns:
+    The encoded entry, or None if value is not in httplib2's format.
+  """
+  head, separator, body = value.partition('\r\n\r\n')
+  if not separator:
+    return None
+  status = None
+  headers = list()
+  for line in head.split('\r\n'):
+    if line[:1] in (' ', '\t'):
+      # A folded continuation of the previous header
+      if not headers:
+        return None
+      name, previous = headers[-1]
+      headers[-1] = (name, '%s %s' % (previous, line.strip()))
+      continue
+    name, colon, header_value = line.partition(':')
+    if not colon:
+      return None
+    name = name.strip().lower()
+    if name == 'status':
+      status = header_value.strip()
+    elif name in KEPT_HEADERS or name.startswith('-'):
+      headers.append((name, header_value.strip()))
+  if status is None:
+    return None
+  flags = 0
+  if len(body) >= min_compress_size:
+    compressed = zlib.compress(body, level)
+    if len(compressed) < len(body):
+      flags |= FLAG_COMPRESSED
+      body = compressed
+  output = StringIO.StringIO()
+  output.write(PREFIX + chr(VERSION) + chr(flags))
+  delimited.write(output, status)
+  for name, header_value in headers:
+    delimited.write(output, name)
+    delimited.write(output, header_value)
+  delimited.write(output, body)
+  return output.getvalue()
+
+
+def decode(data):
+  """Rebuilds the httplib2 cache entry from an encoded one.
+
+  Args:
+    data: An entry returned by encode
+  Returns:
+    The entry in httplib2's format.
+  Raises:
+    FormatError if data is not a version of the encoding understood
+  """
+  if not data.startswith(PREFIX) or len(data) < len(PREFIX) + 2:
+    raise FormatError('Not an encoded entry')
+  version = ord(data[len(PREFIX)])
+  if version != VERSION:
+    raise FormatError('Unsupported version %d' % version)
+  flags = ord(data[len(PREFIX) + 1])
+  try:
+    records = list(delimited.read(
+        StringIO.StringIO(data[len(PREFIX) + 2:])))
+  except delimited.DecodeError, e:
+    raise FormatError('Corrupt entry: %s' % e)
+  if len(records) < 2 or len(records) % 2:
+    raise FormatError('Corrupt entry: %d records' % len(records))
+  body = records[-1]
+  if flags & FLAG_COMPRESSED:
+    try:
+      body = zlib.decompress(body)
+    except zlib.error, e:
+      raise FormatError('Corrupt body: %s' % e)
+  lines = ['status: %s' % records[0]]
+  for i in range(1, len(records) - 1, 2):
+    lines.append('%s: %s' % (records[i], records[i + 1]))
+  return '\r\n'.join(lines) + '\r\n\r\n' + body
+
+
+class CompactCache(object):
+  """Stores httplib2 cache entries compactly in a backend such as memcache.
+
+  Implements the get/set/delete interface of httplib2.FileCache on top of
+  any backend with the same interface. Only the headers that are read
+  back are kept, and large bodies are compressed. Entries still too large
+  for the backend are not stored, and any older copy is deleted so that
+  it is not served instead. Entries in httplib2's own format, written
+  before this wrapper was used, are read as they are; entries of an
+  unknown version are treated as misses.
+  """
+
+  def __init__(self, backend, min_compress_size=DEFAULT_MIN_COMPRESS_SIZE,
+               max_item_size=DEFAULT_MAX_ITEM_SIZE, level=DEFAULT_LEVEL):
+    """Constructs a new compact cache.
+
+    Args:
+      backend: An object with get, set and delete methods
+      min_compress_size: The smallest body that is compressed [optional]
+      max_item_size: The largest encoded entry stored, or None [optional]
+      level: The zlib compression level [optional]
+    """
+    self._backend = backend
+    self._min_compress_size = min_compress_size
+    self._max_item_size = max_item_size
+    self._level = level
+    self._lock = threading.Lock()
+    self.writes = 0
+    self.oversize = 0
+    self.write_failures = 0
+    self.raw_bytes = 0
+    self.stored_bytes = 0
+    self.decodes = 0
+    self.decode_failures = 0
+    self.decode_seconds = 0.0
+
+  def get(self, key):
+    """Returns the cached value for key, or None."""
+    data = self._backend.get(key)
+    if data is None or not data.startswith(PREFIX):
+      return data
+    start = time.time()
+    try:
+      value = decode(data)
+    except FormatError, e:
+      logging.warning('Discarding cache entry %s: %s' % (key, e))
+      self._add(decode_failures=1)
+      self._backend.delete(key)
+      return None
+    self._add(decodes=1, decode_seconds=time.time() - start)
+    return value
+
+  def set(self, key, value):
+    """Stores value for key, unless it is too large even when encoded."""
+    data = encode(value, self._min_compress_size, self._level)
+    if data is None:
+      data = value
+    if self._max_item_size is not None and (
+        len(key) + len(data) > self._max_item_size):
+      self._add(oversize=1)
+      self._backend.delete(key)
+      return
+    try:
+      self._backend.set(key, data)
+    except Exception, e:
+      # Such as a ValueError from memcache for an item over its limit
+      logging.warning('Could not cache %s: %s' % (key, e))
+      self._add(write_failures=1)
+      self._backend.delete(key)
+      return
+    self._add(writes=1, raw_bytes=len(value), stored_bytes=len(data))
+
+  def delete(self, key):
+    """Removes key."""
+    self._backend.delete(key)
+
+  def stats(self):
+    """Returns a dict of counters, the compression ratio and decode time."""
+    stats = {'writes': self.writes,
+             'oversize': self.oversize,
+             'write_failures': self.write_failures,
+             'raw_bytes': self.raw_bytes,
+             'stored_bytes': self.stored_bytes,
+             'bytes_saved': self.raw_bytes - self.stored_bytes,
+             'compression_ratio': 1.0,
+             'decodes': self.decodes,
+             'decode_failures': self.decode_failures,
+             'decode_seconds': self.decode_seconds,
+             'mean_decode_seconds': 0.0}
+    if self.raw_bytes:
+      stats['compression_ratio'] = float(self.stored_bytes) / self.raw_bytes
+    if self.decodes:
+      stats['mean_decode_seconds'] = self.decode_seconds / self.decodes
+    return stats
+
+  def _add(self, **amounts):
+    self._lock.acquire()
+    try:
+      for counter, amount in amounts.items():
+        setattr(self, counter, getattr(self, counter) + amount)
+    finally:
+      self._lock.release()
@@ -0,0 +1,170 @@
+#!/usr/bin/python2.5
+#
+# Tests the compact cache encoding.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import imports
+
+import compactcache
+import email.utils
+import httplib2
+import random
+import unittest
+
+BODY = '''<XRD xmlns="http://docs.oasis-open.org/ns/xri/xrd-1.0">
+  <Link rel="lrdd" template="http://example.com/describe?uri={uri}" />
+</XRD>''' * 20
+
+
+class FakeResponse(dict):
+
+  def __init__(self, status, headers):
+    dict.__init__(self, headers)
+    self.status = status
+
+
+def httplib2_entry(body, **headers):
+  """Returns an entry as httplib2 writes it to its cache."""
+  cache = DictCache()
+  response = FakeResponse(200, headers)
+  httplib2._updateCache({}, response, body, cache, 'key')
+  return cache['key']
+
+
+class DictCache(dict):
+  """A backend with the httplib2 cache interface."""
+
+  def __init__(self, max_item_size=None):
+    self.max_item_size = max_item_size
+
+  def get(self, key):
+    return dict.get(self, key)
+
+  def set(self, key, value):
+    if self.max_item_size is not None and len(value) > self.max_item_size:
+      raise ValueError('Values may not be more than %d bytes' %
+                       self.max_item_size)
+    self[key] = value
+
+  def delete(self, key):
+    self.pop(key, None)
+
+
+class EncodingTest(unittest.TestCase):
+
+  def testRoundTripKeepsNeededHeaders(self):
+    entry = httplib2_entry(BODY, etag='"abc"', server='Apache',
+                           **{'content-type': 'application/xrd+xml',
+                              '-content-encoding': 'gzip',
+                              'set-cookie': 'a=b'})
+    encoded = compactcache.encode(entry)
+    self.assertTrue(len(encoded) < len(entry) / 4)
+    decoded = compactcache.decode(encoded)
+    head, body = decoded.split('\r\n\r\n', 1)
+    self.assertEquals(BODY, body)
+    lines = head.split('\r\n')
+    self.assertEquals('status: 200', lines[0])
+    self.assertEquals(['-content-encoding: gzip',
+                       'content-type: application/xrd+xml', 'etag: "abc"'],
+                      sorted(lines[1:]))
+
+  def testSmallBodiesAreNotCompressed(self):
+    encoded = compactcache.encode(httplib2_entry('tiny'))
+    self.assertFalse(ord(encoded[len(compactcache.PREFIX) + 1]) &
+                     compactcache.FLAG_COMPRESSED)
+    self.assertTrue(compactcache.decode(encoded).endswith('\r\n\r\ntiny'))
+
+  def testOtherFormatsAreNotEncoded(self):
+    self.assertEquals(None, compactcache.encode('no headers'))
+    self.assertEquals(None, compactcache.encode('a: b\r\n\r\nno status'))
+
+  def testUnknownVersion(self):
+    encoded = compactcache.encode(httplib2_entry(BODY))
+    newer = (compactcache.PREFIX + chr(compactcache.VERSION + 1) +
+             encoded[len(compactcache.PREFIX) + 1:])
+    self.assertRaises(compactcache.FormatError, compactcache.decode, newer)
+    self.assertRaises(compactcache.FormatError, compactcache.decode,
+                      encoded[:-5])
+
+
+class CompactCacheTest(unittest.TestCase):
+
+  def testStoresEncodedEntries(self):
+    backend = DictCache()
+    cache = compactcache.CompactCache(backend)
+    entry = httplib2_entry(BODY, etag='"abc"')
+    cache.set('key', entry)
+    self.assertTrue(backend['key'].startswith(compactcache.PREFIX))
+    self.assertEquals(BODY, cache.get('key').split('\r\n\r\n', 1)[1])
+    self.assertEquals(None, cache.get('missing'))
+    stats = cache.stats()
+    self.assertEquals(1, stats['writes'])
+    self.assertEquals(1, stats['decodes'])
+    self.assertTrue(stats['compression_ratio'] < 0.25)
+
+  def testReadsLegacyEntries(self):
+    backend = DictCache()
+    entry = httplib2_entry(BODY)
+    backend.set('key', entry)
+    self.assertEquals(entry, compactcache.CompactCache(backend).get('key'))
+
+  def testDiscardsUndecodableEntries(self):
+    backend = DictCache()
+    backend.set('key', compactcache.PREFIX + '\x63\x00')
+    cache = compactcache.CompactCache(backend)
+    self.assertEquals(None, cache.get('key'))
+    self.assertFalse('key' in backend)
+    self.assertEquals(1, cache.stats()['decode_failures'])
+
+  def testOversizeEntriesAreDropped(self):
+    backend = DictCache()
+    cache = compactcache.CompactCache(backend, max_item_size=1000)
+    cache.set('key', httplib2_entry('small'))
+    # Random bytes don't compress
+    noise = ''.join([chr(random.randrange(256)) for i in range(2000)])
+    cache.set('key', httplib2_entry(noise))
+    self.assertFalse('key' in backend)
+    self.assertEquals(1, cache.stats()['oversize'])
+
+  def testBackendRefusals(self):
+    backend = DictCache(max_item_size=100)
+    cache = compactcache.CompactCache(backend)
+    noise = ''.join([chr(random.randrange(256)) for i in range(200)])
+    cache.set('key', httplib2_entry(noise))
+    self.assertFalse('key' in backend)
+    self.assertEquals(1, cache.stats()['write_failures'])
+
+  def testHttplib2ReadsDecodedEntries(self):
+    backend = DictCache()
+    cache = compactcache.CompactCache(backend)
+    cache.set('http://example.com/', httplib2_entry(
+        BODY, date=email.utils.formatdate(usegmt=True),
+        **{'cache-control': 'max-age=3600',
+           'content-location': 'http://example.com/'}))
+    http = httplib2.Http(cache)
+    response, content = http.request('http://example.com/')
+    self.assertTrue(response.fromcache)
+    self.assertEquals(BODY, content)
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(EncodingTest))
+  suite.addTests(unittest.makeSuite(CompactCacheTest))
+  return suite
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,196 @@
+#!/usr/bin/python2.5
+#
+# Compact, immutable in-memory representations of XRD documents.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# The classes here mirror the xrd_pb2 messages field for field, so code
+# that only reads descriptions (xrd.JsonMarshaller, the templates) accepts
+# either. Each is a tuple subclass without a __dict__, and rel, type, lang
+# and property type strings, which repeat across documents, are interned.
+
+import imports
+import operator
+import threading
+import xrd_pb2
+
+# The maximum number of distinct strings interned, so that hostile
+# documents can not grow the table without bound
+MAX_INTERNED_STRINGS = 10000
+
+_interned = dict()
+_interned_lock = threading.Lock()
+
+
+def intern_string(string):
+  """Returns a shared copy of a str or unicode string.
+
+  Args:
+    string: The string to intern
+  Returns:
+    An equal string, shared with earlier callers where possible.
+  """
+  shared = _interned.get(string)
+  if shared is not None:
+    return shared
+  _interned_lock.acquire()
+  try:
+    if len(_interned) >= MAX_INTERNED_STRINGS:
+      return string
+    return _interned.setdefault(string, string)
+  finally:
+    _interned_lock.release()
+
+
+class Title(tuple):
+  """An immutable xrd_pb2.Title."""
+
+  __slots__ = ()
+
+  lang = property(operator.itemgetter(0))
+  value = property(operator.itemgetter(1))
+
+  def __new__(cls, lang='', value=''):
+    return tuple.__new__(cls, (intern_string(lang), value))
+
+  @classmethod
+  def from_pb(cls, title_pb):
+    return cls(title_pb.lang, title_pb.value)
+
+  def to_pb(self, title_pb):
+    """Copies this title into an empty xrd_pb2.Title."""
+    if self.lang:
+      title_pb.lang = self.lang
+    if self.value:
+      title_pb.value = self.value
+
+
+class Property(tuple):
+  """An immutable xrd_pb2.Property."""
+
+  __slots__ = ()
+
+  nil = property(operator.itemgetter(0))
+  type = property(operator.itemgetter(1))
+  value = property(operator.itemgetter(2))
+
+  def __new__(cls, nil=False, type='', value=''):
+    return tuple.__new__(cls, (bool(nil), intern_string(type), value))
+
+  @classmethod
+  def from_pb(cls, property_pb):
+    return cls(property_pb.nil, property_pb.type, property_pb.value)
+
+  def to_pb(self, property_pb):
+    """Copies this property into an empty xrd_pb2.Property."""
+    property_pb.nil = self.nil
+    if self.type:
+      property_pb.type = self.type
+    if self.value:
+      property_pb.value = self.value
+
+
+class Link(tuple):
+  """An immutable xrd_pb2.Link."""
+
+  __slots__ = ()
+
+  rel = property(operator.itemgetter(0))
+  type = property(operator.itemgetter(1))
+  href = property(operator.itemgetter(2))
+  template = property(operator.itemgetter(3))
+  titles = property(operator.itemgetter(4))
+  properties = property(operator.itemgetter(5))
+
+  def __new__(cls, rel='', type='', href='', template='', titles=(),
+              properties=()):
+    return tuple.__new__(cls, (intern_string(rel), intern_string(type), href,
+                               template, tuple(titles), tuple(properties)))
+
+  @classmethod
+  def from_pb(cls, link_pb):
+    return cls(link_pb.rel, link_pb.type, link_pb.href, link_pb.template,
+               [Title.from_pb(t) for t in link_pb.titles],
+               [Property.from_pb(p) for p in link_pb.properties])
+
+  def to_pb(self, link_pb):
+    """Copies this link into an empty xrd_pb2.Link."""
+    if self.rel:
+      link_pb.rel = self.rel
+    if self.type:
+      link_pb.type = self.type
+    if self.href:
+      link_pb.href = self.href
+    if self.template:
+      link_pb.template = self.template
+    for title in self.titles:
+      title.to_pb(link_pb.titles.add())
+    for property in self.properties:
+      property.to_pb(link_pb.properties.add())
+
+
+class Xrd(tuple):
+  """An immutable xrd_pb2.Xrd."""
+
+  __slots__ = ()
+
+  id = property(operator.itemgetter(0))
+  expires = property(operator.itemgetter(1))
+  subject = property(operator.itemgetter(2))
+  aliases = property(operator.itemgetter(3))
+  properties = property(operator.itemgetter(4))
+  links = property(operator.itemgetter(5))
+
+  def __new__(cls, id='', expires='', subject='', aliases=(), properties=(),
+              links=()):
+    return tuple.__new__(cls, (id, expires, subject, tuple(aliases),
+                               tuple(properties), tuple(links)))
+
+  @classmethod
+  def from_pb(cls, xrd_pb):
+    """Converts an xrd_pb2.Xrd instance.
+
+    Args:
+      xrd_pb: An xrd_pb2.Xrd instance
+    Returns:
+      An equivalent compactxrd.Xrd instance.
+    """
+    return cls(xrd_pb.id, xrd_pb.expires, xrd_pb.subject, xrd_pb.aliases,
+               [Property.from_pb(p) for p in xrd_pb.properties],
+               [Link.from_pb(l) for l in xrd_pb.links])
+
+  def to_pb(self, xrd_pb=None):
+    """Converts back into an xrd_pb2.Xrd instance.
+
+    Args:
+      xrd_pb: An empty xrd_pb2.Xrd to fill in [optional]
+    Returns:
+      An equivalent xrd_pb2.Xrd instance.
+    """
+    if xrd_pb is None:
+      xrd_pb = xrd_pb2.Xrd()
+    if self.id:
+      xrd_pb.id = self.id
+    if self.expires:
+      xrd_pb.expires = self.expires
+    if self.subject:
+      xrd_pb.subject = self.subject
+    for alias in self.aliases:
+      xrd_pb.aliases.append(alias)
+    for property in self.properties:
+      property.to_pb(xrd_pb.properties.add())
+    for link in self.links:
+      link.to_pb(xrd_pb.links.add())
+    return xrd_pb
@@ -0,0 +1,87 @@
+#!/usr/bin/python2.5
+#
+# Compares the memory held by cached xrd_pb2.Xrd and compactxrd.Xrd.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Requires Python 2.6 or later for sys.getsizeof.
+
+import compactxrd
+import sys
+import types
+import xrd
+
+DOCUMENT = '''<XRD xmlns="http://docs.oasis-open.org/ns/xri/xrd-1.0">
+  <Subject>acct:user%(n)d@example.com</Subject>
+  <Alias>http://example.com/profile/user%(n)d</Alias>
+  <Link rel="http://webfinger.net/rel/profile-page" type="text/html"
+        href="http://example.com/profile/user%(n)d" />
+  <Link rel="http://microformats.org/profile/hcard" type="text/html"
+        href="http://example.com/hcard/user%(n)d" />
+  <Link rel="http://portablecontacts.net/spec/1.0"
+        href="http://example.com/poco/user%(n)d" />
+  <Link rel="http://gmpg.org/xfn/11" type="text/html"
+        href="http://example.com/xfn/user%(n)d">
+    <Title xml:lang="en">Social graph</Title>
+  </Link>
+  <Link rel="describedby" type="application/rdf+xml"
+        href="http://example.com/foaf/user%(n)d" />
+</XRD>'''
+
+# Objects shared by every instance rather than owned by any one document
+SHARED_TYPES = (type, types.ModuleType, types.FunctionType,
+                types.BuiltinFunctionType, types.MethodType)
+
+
+def deep_size(root, seen):
+  """Returns the bytes reachable from root and not already in seen."""
+  total = 0
+  stack = [root]
+  while stack:
+    obj = stack.pop()
+    if id(obj) in seen or isinstance(obj, SHARED_TYPES):
+      continue
+    seen.add(id(obj))
+    total += sys.getsizeof(obj)
+    if isinstance(obj, dict):
+      stack.extend(obj.keys())
+      stack.extend(obj.values())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+      stack.extend(obj)
+    if hasattr(obj, '__dict__'):
+      stack.append(obj.__dict__)
+    for cls in type(obj).__mro__:
+      for slot in cls.__dict__.get('__slots__', ()):
+        if hasattr(obj, slot):
+          stack.append(getattr(obj, slot))
+  return total
+
+
+def main(argv):
+  count = 2000
+  if len(argv) > 1:
+    count = int(argv[1])
+  parser = xrd.Parser()
+  descriptions = [parser.parse(DOCUMENT % {'n': n}) for n in range(count)]
+  compacts = [compactxrd.Xrd.from_pb(d) for d in descriptions]
+  # Share a seen set across documents so interned strings count once
+  for name, documents in [('xrd_pb2.Xrd', descriptions),
+                          ('compactxrd.Xrd', compacts)]:
+    seen = set()
+    total = sum([deep_size(d, seen) for d in documents])
+    print '%-15s %7d bytes per cached document' % (name, total / count)
+
+if __name__ == "__main__":
+  main(sys.argv)
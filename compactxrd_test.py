@@ -0,0 +1,76 @@
+#!/usr/bin/python2.5
+#
+# Tests the compact XRD representation.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import compactxrd
+import unittest
+import xrd
+
+DOCUMENT = '''<XRD xmlns="http://docs.oasis-open.org/ns/xri/xrd-1.0"
+                   xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+                   xml:id="foo">
+                <Expires>1970-01-01T00:00:00Z</Expires>
+                <Subject>http://example.com/gpburdell</Subject>
+                <Alias>acct:gpburdell@example.com</Alias>
+                <Property type="http://spec.example.net/version">1.0</Property>
+                <Property type="http://spec.example.net/type/person"
+                    xsi:nil="true" />
+                <Link rel="http://spec.example.net/photo/1.0" type="image/jpeg"
+                  href="http://photos.example.com/gpburdell.jpg">
+                  <Title xml:lang="en">User Photo</Title>
+                  <Property type="http://spec.example.net/created/1.0">1970-01-01</Property>
+                </Link>
+                <Link rel="lrdd" template="http://example.com/{uri}" />
+              </XRD>'''
+
+class CompactXrdTest(unittest.TestCase):
+
+  def testRoundTrip(self):
+    description = xrd.Parser().parse(DOCUMENT)
+    compact = compactxrd.Xrd.from_pb(description)
+    self.assertEquals(description, compact.to_pb())
+
+  def testFields(self):
+    compact = compactxrd.Xrd.from_pb(xrd.Parser().parse(DOCUMENT))
+    self.assertEquals('foo', compact.id)
+    self.assertEquals(('acct:gpburdell@example.com',), compact.aliases)
+    self.assertEquals(True, compact.properties[1].nil)
+    self.assertEquals('lrdd', compact.links[1].rel)
+    self.assertEquals('User Photo', compact.links[0].titles[0].value)
+    self.assertRaises(AttributeError, setattr, compact, 'id', 'bar')
+
+  def testStringsAreInterned(self):
+    first = compactxrd.Xrd.from_pb(xrd.Parser().parse(DOCUMENT))
+    second = compactxrd.Xrd.from_pb(xrd.Parser().parse(DOCUMENT))
+    self.assertTrue(first.links[0].rel is second.links[0].rel)
+    self.assertTrue(first.links[0].type is second.links[0].type)
+
+  def testJsonMarshaller(self):
+    description = xrd.Parser().parse(DOCUMENT)
+    compact = compactxrd.Xrd.from_pb(description)
+    marshaller = xrd.JsonMarshaller()
+    self.assertEquals(marshaller.to_json(description),
+                      marshaller.to_json(compact))
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(CompactXrdTest))
+  return suite
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,378 @@
+#!/usr/bin/python2.5
+#
+# Maps identity graphs by following rel="me" links between pages.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Usage:
+#
+#   crawler.py [--depth N] [--workers N] ID_OR_URL
+#
+# Prints each rel="me" edge found as a tab-separated pair of URLs,
+# followed by a summary of the reciprocal links.
+
+import imports
+
+import array
+import boundedhttp
+import hashlib
+import logging
+import math
+import optparse
+import scheduler
+import stats
+import struct
+import sys
+import threading
+import urlparse
+import webfinger
+import xfn
+
+# The rel value of webfinger links to profile pages
+PROFILE_PAGE_REL_VALUE = 'http://webfinger.net/rel/profile-page'
+
+# The default number of links followed from the starting pages
+DEFAULT_MAX_DEPTH = 2
+
+# The default number of concurrent fetches
+DEFAULT_MAX_WORKERS = 10
+
+# The default most pages fetched in one crawl
+DEFAULT_MAX_PAGES = 1000
+
+# The default number of URLs remembered exactly before the Bloom filter
+# takes over
+DEFAULT_MAX_EXACT = 10000
+
+# The default false positive rate of the Bloom filter
+DEFAULT_ERROR_RATE = 0.001
+
+# Ports that are dropped from normalized URLs
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+class UsageError(Exception):
+  """Raised on command-line usage errors."""
+  pass
+
+
+def normalize_url(url, base=None):
+  """Puts a URL into a canonical form so that duplicates can be found.
+
+  Resolves it against base, lowercases the scheme and host, drops default
+  ports and the fragment, and gives an empty path as '/'.
+
+  Args:
+    url: An absolute or relative URL
+    base: The URL of the page url was found on [optional]
+  Returns:
+    The normalized URL, or None if it is not an http or https URL.
+  """
+  if base:
+    url = urlparse.urljoin(base, url.strip())
+  scheme, netloc, path, params, query, fragment = urlparse.urlparse(
+      url.strip())
+  scheme = scheme.lower()
+  if scheme not in DEFAULT_PORTS:
+    return None
+  netloc = netloc.lower()
+  if '@' in netloc:
+    netloc = netloc.split('@', 1)[1]
+  host, colon, port = netloc.partition(':')
+  if not host:
+    return None
+  if port and port.isdigit() and int(port) != DEFAULT_PORTS[scheme]:
+    netloc = '%s:%s' % (host, port)
+  else:
+    netloc = host
+  return urlparse.urlunparse(
+      (scheme, netloc, path or '/', params, query, ''))
+
+
+class BloomFilter(object):
+  """A fixed-size set that may report false positives, but never negatives."""
+
+  def __init__(self, capacity, error_rate=DEFAULT_ERROR_RATE):
+    """Constructs a new Bloom filter.
+
+    Args:
+      capacity: The number of keys it is sized for
+      error_rate: The false positive rate at capacity [optional]
+    """
+    bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+    self._bits = max(bits, 8)
+    self._hashes = max(1, int(round(self._bits * math.log(2) / capacity)))
+    self._array = array.array('B', [0]) * ((self._bits + 7) // 8)
+
+  def add(self, key):
+    """Adds key to the filter."""
+    for position in self._positions(key):
+      self._array[position >> 3] |= 1 << (position & 7)
+
+  def __contains__(self, key):
+    for position in self._positions(key):
+      if not self._array[position >> 3] & (1 << (position & 7)):
+        return False
+    return True
+
+  def _positions(self, key):
+    """Yields the bit positions of key, by double hashing one MD5 digest."""
+    if isinstance(key, unicode):
+      key = key.encode('utf-8')
+    first, second = struct.unpack('<QQ', hashlib.md5(key).digest())
+    for i in range(self._hashes):
+      yield (first + i * second) % self._bits
+
+
+class VisitedSet(object):
+  """Remembers URLs exactly up to a limit, then in a Bloom filter.
+
+  Small crawls never lose a URL. Large ones use bounded memory, at the
+  cost of occasionally treating a new URL as already visited.
+  """
+
+  def __init__(self, max_exact=DEFAULT_MAX_EXACT, capacity=1000000,
+               error_rate=DEFAULT_ERROR_RATE):
+    """Constructs a new visited set.
+
+    Args:
+      max_exact: The number of URLs held exactly [optional]
+      capacity: The number of further URLs the Bloom filter is sized
+        for [optional]
+      error_rate: The Bloom filter's false positive rate [optional]
+    """
+    self._max_exact = max_exact
+    self._exact = set()
+    self._bloom = None
+    self._capacity = capacity
+    self._error_rate = error_rate
+    self._lock = threading.Lock()
+
+  def add(self, url):
+    """Adds url, returning True if it was not (apparently) already present."""
+    self._lock.acquire()
+    try:
+      if url in self._exact:
+        return False
+      if self._bloom is not None and url in self._bloom:
+        return False
+      if len(self._exact) < self._max_exact:
+        self._exact.add(url)
+      else:
+        if self._bloom is None:
+          self._bloom = BloomFilter(self._capacity, self._error_rate)
+        self._bloom.add(url)
+      return True
+    finally:
+      self._lock.release()
+
+  def __contains__(self, url):
+    return url in self._exact or (
+        self._bloom is not None and url in self._bloom)
+
+
+class Graph(object):
+  """The rel="me" edges found by a crawl."""
+
+  def __init__(self):
+    self.edges = set()
+    self.pages = 0
+    self.failures = dict()
+
+  def reciprocal(self):
+    """Returns the sorted (a, b) pairs, a < b, that link to each other."""
+    pairs = list()
+    for source, target in self.edges:
+      if source < target and (target, source) in self.edges:
+        pairs.append((source, target))
+    pairs.sort()
+    return pairs
+
+  def summary(self):
+    """Returns a dict of counts describing the crawl."""
+    return {'pages': self.pages,
+            'edges': len(self.edges),
+            'reciprocal': len(self.reciprocal()),
+            'failures': len(self.failures)}
+
+
+def profile_urls(descriptions):
+  """Returns the profile page URLs in webfinger descriptions.
+
+  Args:
+    descriptions: A list of xrd_pb2.Xrd instances
+  """
+  urls = list()
+  for description in descriptions:
+    for link in description.links:
+      if link.rel == PROFILE_PAGE_REL_VALUE and link.href:
+        urls.append(link.href)
+  return urls
+
+
+class Crawler(object):
+  """Follows rel="me" links breadth first, fetching each level concurrently."""
+
+  def __init__(self, http_client=None, parser_factory=xfn.Parser,
+               host_scheduler=None,
+               max_depth=DEFAULT_MAX_DEPTH, max_workers=DEFAULT_MAX_WORKERS,
+               max_pages=DEFAULT_MAX_PAGES, visited=None):
+    """Constructs a new crawler.
+
+    Args:
+      http_client: A thread-safe httplib2-like instance [optional]
+      parser_factory: A callable returning a new xfn.Parser; html5lib
+        parsers are not thread-safe, so each thread gets its own [optional]
+      host_scheduler: A scheduler.HostScheduler limiting the load on each
+        host [optional]
+      max_depth: The number of links followed from the start [optional]
+      max_workers: The number of concurrent fetches [optional]
+      max_pages: The most pages fetched in one crawl [optional]
+      visited: A VisitedSet, to share across crawls [optional]
+    """
+    if http_client is None:
+      http_client = webfinger.ThreadLocalHttp(boundedhttp.Http)
+    self._http_client = http_client
+    self._parser_factory = parser_factory
+    self._local = threading.local()
+    if host_scheduler is None:
+      host_scheduler = scheduler.HostScheduler()
+    self._scheduler = host_scheduler
+    self._max_depth = max_depth
+    self._max_workers = max_workers
+    self._max_pages = max_pages
+    self._visited = visited
+
+  def crawl(self, urls):
+    """Crawls the identity graph reachable from some pages.
+
+    Args:
+      urls: A list of starting page URLs
+    Returns:
+      A Graph.
+    """
+    graph = Graph()
+    visited = self._visited
+    if visited is None:
+      visited = VisitedSet()
+    frontier = list()
+    for url in urls:
+      url = normalize_url(url)
+      if url and visited.add(url):
+        frontier.append(url)
+    depth = 0
+    while frontier and graph.pages < self._max_pages:
+      frontier = frontier[:self._max_pages - graph.pages]
+      next_frontier = list()
+      for url, targets, error in webfinger.map_concurrently(
+          self._links, frontier, self._max_workers):
+        graph.pages += 1
+        if error is not None:
+          graph.failures[url] = str(error)
+          continue
+        for target in targets:
+          graph.edges.add((url, target))
+          if depth < self._max_depth and visited.add(target):
+            next_frontier.append(target)
+      frontier = next_frontier
+      depth += 1
+    return graph
+
+  def crawl_id(self, id, client=None):
+    """Crawls the identity graph reachable from an account's profile pages.
+
+    Args:
+      id: An account identifier
+      client: A webfinger.Client [optional]
+    Returns:
+      A Graph.
+    Raises:
+      webfinger.FetchError or webfinger.ParseError if the lookup fails
+    """
+    if client is None:
+      client = webfinger.Client()
+    return self.crawl(profile_urls(client.lookup(id)))
+
+  def _links(self, url):
+    """Fetches a page and returns the normalized URLs of its rel="me" links.
+
+    Raises:
+      webfinger.FetchError if the page can not be retrieved
+      xfn.ParseError if the page can not be parsed
+    """
+    host = urlparse.urlparse(url)[1]
+    self._scheduler.acquire(host)
+    response = None
+    try:
+      try:
+        response, content = self._http_client.request(url)
+      except Exception, e:
+        raise webfinger.FetchError('Could not fetch %s: %s' % (url, e))
+    finally:
+      if response is None:
+        self._scheduler.release(host)
+      else:
+        self._scheduler.release(host, response.status,
+                                response.get('retry-after'))
+    if response.status != 200:
+      raise webfinger.FetchError(
+          'Could not fetch %s. Status %d.' % (url, response.status))
+    # Relative links are relative to the page after any redirects
+    base = response.get('content-location', url)
+    targets = list()
+    parser = getattr(self._local, 'parser', None)
+    if parser is None:
+      parser = self._local.parser = self._parser_factory()
+    stop = stats.timer('parse_seconds', parser='xfn')
+    try:
+      links = parser.parse(content).links
+    finally:
+      stop()
+    for link in links:
+      target = normalize_url(link.href, base)
+      if target and target != url and target not in targets:
+        targets.append(target)
+    return targets
+
+
+def main(argv):
+  usage = 'Usage crawler.py [--depth N] [--workers N] ID_OR_URL'
+  parser = optparse.OptionParser(usage=usage)
+  parser.add_option('--depth', type='int', default=DEFAULT_MAX_DEPTH,
+                    help='links followed from the start [default: %default]')
+  parser.add_option('--workers', type='int', default=DEFAULT_MAX_WORKERS,
+                    help='concurrent fetches [default: %default]')
+  parser.add_option('--max-pages', type='int', default=DEFAULT_MAX_PAGES,
+                    help='most pages fetched [default: %default]')
+  options, args = parser.parse_args(argv[1:])
+  if len(args) != 1:
+    raise UsageError(usage)
+  crawler = Crawler(max_depth=options.depth, max_workers=options.workers,
+                    max_pages=options.max_pages)
+  if normalize_url(args[0]):
+    graph = crawler.crawl([args[0]])
+  else:
+    graph = crawler.crawl_id(args[0])
+  for source, target in sorted(graph.edges):
+    print '%s\t%s' % (source, target)
+  for url, error in sorted(graph.failures.items()):
+    logging.warning(error)
+  print '# %(pages)d pages, %(edges)d edges, %(reciprocal)d reciprocal, ' \
+        '%(failures)d failures' % graph.summary()
+  for a, b in graph.reciprocal():
+    print '# %s <-> %s' % (a, b)
+
+if __name__ == "__main__":
+  main(sys.argv)
@@ -0,0 +1,134 @@
+#!/usr/bin/python2.5
+#
+# Tests the rel="me" crawler.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import crawler
+import unittest
+import webfinger_test
+import xrd_pb2
+
+
+def page(*links):
+  anchors = ''.join(['<a rel="me" href="%s">me</a>' % link for link in links])
+  other = '<a href="http://example.com/other">other</a>'
+  return '<html><body>%s%s</body></html>' % (anchors, other)
+
+
+PAGES = {
+  'http://a.example/': page('http://B.example:80/#top'),
+  'http://b.example/': page('http://a.example', '/c'),
+  'http://b.example/c': page('http://d.example/'),
+  'http://d.example/': page('http://e.example/'),
+}
+
+
+def new_http():
+  return webfinger_test.FakeHttp(PAGES)
+
+
+class NormalizeUrlTest(unittest.TestCase):
+
+  def testNormalize(self):
+    self.assertEquals('http://example.com/',
+                      crawler.normalize_url('HTTP://Example.COM'))
+    self.assertEquals('https://example.com/a?b=c',
+                      crawler.normalize_url('https://example.com:443/a?b=c#d'))
+    self.assertEquals('http://example.com:8080/',
+                      crawler.normalize_url('http://user@example.com:8080/'))
+
+  def testRelative(self):
+    self.assertEquals('http://example.com/b',
+                      crawler.normalize_url('b', 'http://example.com/a'))
+
+  def testRejectsOtherSchemes(self):
+    self.assertEquals(None, crawler.normalize_url('mailto:bob@example.com'))
+    self.assertEquals(None, crawler.normalize_url('javascript:void(0)'))
+
+
+class VisitedSetTest(unittest.TestCase):
+
+  def testBloomFilter(self):
+    bloom = crawler.BloomFilter(1000)
+    for i in range(1000):
+      bloom.add('http://example.com/%d' % i)
+    for i in range(1000):
+      self.assert_('http://example.com/%d' % i in bloom)
+    false_positives = len([i for i in range(1000, 11000)
+                           if 'http://example.com/%d' % i in bloom])
+    self.assert_(false_positives < 50, false_positives)
+
+  def testSpillsIntoBloomFilter(self):
+    visited = crawler.VisitedSet(max_exact=2, capacity=100)
+    self.assert_(visited.add('a'))
+    self.assert_(visited.add(u'b'))
+    self.assert_(visited.add('c'))
+    self.failIf(visited.add('a'))
+    self.failIf(visited.add('c'))
+    self.assert_('c' in visited)
+    self.failIf('d' in visited)
+
+
+class CrawlerTest(unittest.TestCase):
+
+  def testCrawl(self):
+    http = new_http()
+    graph = crawler.Crawler(http_client=http, max_depth=2).crawl(
+        ['http://a.example'])
+    self.assertEquals(
+        set([('http://a.example/', 'http://b.example/'),
+             ('http://b.example/', 'http://a.example/'),
+             ('http://b.example/', 'http://b.example/c'),
+             ('http://b.example/c', 'http://d.example/')]),
+        graph.edges)
+    self.assertEquals([('http://a.example/', 'http://b.example/')],
+                      graph.reciprocal())
+    # Each page is fetched once, and d.example is beyond the depth limit
+    self.assertEquals(3, len(http.requested))
+    self.assertEquals({'pages': 3, 'edges': 4, 'reciprocal': 1,
+                       'failures': 0}, graph.summary())
+
+  def testFailures(self):
+    graph = crawler.Crawler(http_client=new_http()).crawl(
+        ['http://b.example/c'])
+    self.assertEquals(['http://e.example/'], graph.failures.keys())
+
+  def testMaxPages(self):
+    http = new_http()
+    graph = crawler.Crawler(http_client=http, max_depth=10,
+                            max_pages=2).crawl(['http://a.example/'])
+    self.assertEquals(2, graph.pages)
+    self.assertEquals(2, len(http.requested))
+
+  def testProfileUrls(self):
+    description = xrd_pb2.Xrd()
+    link = description.links.add()
+    link.rel = crawler.PROFILE_PAGE_REL_VALUE
+    link.href = 'http://a.example/'
+    description.links.add().rel = 'http://example.com/rel/other'
+    self.assertEquals(['http://a.example/'],
+                      crawler.profile_urls([description]))
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(NormalizeUrlTest))
+  suite.addTests(unittest.makeSuite(VisitedSetTest))
+  suite.addTests(unittest.makeSuite(CrawlerTest))
+  return suite
+
+if __name__ == '__main__':
+  unittest.main()
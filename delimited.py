@@ -0,0 +1,89 @@
+#!/usr/bin/python2.5
+#
+# Reads and writes streams of length-delimited protocol buffers.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Each record is a base 128 varint length followed by that many bytes, the
+# framing used by the Java protobuf writeDelimitedTo/parseDelimitedFrom.
+
+
+class DecodeError(Exception):
+  """Raised in the event a delimited stream is truncated or corrupt."""
+  pass
+
+
+def encode_varint(value):
+  """Returns the base 128 varint encoding of a non-negative integer."""
+  bytes = list()
+  while True:
+    bits = value & 0x7f
+    value >>= 7
+    if value:
+      bytes.append(chr(bits | 0x80))
+    else:
+      bytes.append(chr(bits))
+      return ''.join(bytes)
+
+
+def write(stream, data):
+  """Writes one length-delimited record.
+
+  Args:
+    stream: A file-like object open for binary writing
+    data: A string, typically a serialized protocol buffer
+  """
+  stream.write(encode_varint(len(data)))
+  stream.write(data)
+
+
+def read(stream):
+  """Reads length-delimited records until the end of the stream.
+
+  Args:
+    stream: A file-like object open for binary reading
+  Returns:
+    A generator of record strings.
+  Raises:
+    DecodeError if the stream ends partway through a record
+  """
+  while True:
+    length = _read_varint(stream)
+    if length is None:
+      return
+    data = stream.read(length)
+    if len(data) != length:
+      raise DecodeError('Truncated record: wanted %d bytes, got %d' %
+                        (length, len(data)))
+    yield data
+
+
+def _read_varint(stream):
+  """Returns the next varint, or None at a clean end of stream."""
+  value = 0
+  shift = 0
+  while True:
+    byte = stream.read(1)
+    if not byte:
+      if shift:
+        raise DecodeError('Truncated length prefix')
+      return None
+    byte = ord(byte)
+    value |= (byte & 0x7f) << shift
+    if not byte & 0x80:
+      return value
+    shift += 7
+    if shift > 63:
+      raise DecodeError('Length prefix too long')
@@ -0,0 +1,51 @@
+#!/usr/bin/python2.5
+#
+# Tests length-delimited record streams.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import StringIO
+import delimited
+import unittest
+
+class DelimitedTest(unittest.TestCase):
+
+  def testEncodeVarint(self):
+    self.assertEquals('\x00', delimited.encode_varint(0))
+    self.assertEquals('\x7f', delimited.encode_varint(127))
+    self.assertEquals('\xac\x02', delimited.encode_varint(300))
+
+  def testRoundTrip(self):
+    records = ['', 'a', 'x' * 300]
+    stream = StringIO.StringIO()
+    for record in records:
+      delimited.write(stream, record)
+    stream.seek(0)
+    self.assertEquals(records, list(delimited.read(stream)))
+
+  def testTruncated(self):
+    stream = StringIO.StringIO()
+    delimited.write(stream, 'abc')
+    stream = StringIO.StringIO(stream.getvalue()[:-1])
+    self.assertRaises(delimited.DecodeError, list, delimited.read(stream))
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(DelimitedTest))
+  return suite
+
+if __name__ == '__main__':
+  unittest.main()
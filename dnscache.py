@@ -0,0 +1,289 @@
+#!/usr/bin/python2.5
+#
+# Caches DNS resolution for outbound HTTP connections.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import imports
+
+import Queue
+import functools
+import httplib2
+import lru
+import socket
+import threading
+import time
+
+# The number of seconds a successful resolution is reused
+DEFAULT_TTL = 300
+
+# The number of seconds a failed resolution is remembered
+DEFAULT_NEGATIVE_TTL = 30
+
+# The maximum number of resolutions remembered
+DEFAULT_MAX_ENTRIES = 10000
+
+# The seconds to wait on one address before racing the next, as suggested
+# by RFC 6555 for dual-stack hosts
+DEFAULT_ATTEMPT_DELAY = 0.25
+
+
+class Resolver(object):
+  """A thread-safe, caching front end to socket.getaddrinfo.
+
+  getaddrinfo does not report record TTLs, so results are reused for a
+  fixed time. Failures are remembered for a shorter time so that a dead
+  domain does not cost a DNS round trip on every attempt.
+  """
+
+  def __init__(self, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL,
+               max_entries=DEFAULT_MAX_ENTRIES, getaddrinfo=None):
+    """Constructs a new resolver.
+
+    Args:
+      ttl: Seconds a successful result is reused [optional]
+      negative_ttl: Seconds a failure is remembered [optional]
+      max_entries: The number of results remembered [optional]
+      getaddrinfo: The function doing the actual resolution [optional]
+    """
+    self._ttl = ttl
+    self._negative_ttl = negative_ttl
+    self._cache = lru.LruCache(max_entries)
+    self._getaddrinfo = getaddrinfo or socket.getaddrinfo
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.negative_hits = 0
+    self.misses = 0
+    self.failures = 0
+    self.resolve_seconds = 0.0
+
+  def getaddrinfo(self, host, port, family=0, socktype=0, proto=0, flags=0):
+    """Like socket.getaddrinfo, but cached.
+
+    Raises:
+      socket.gaierror if the host can not be resolved
+    """
+    key = (host, port, family, socktype, proto, flags)
+    entry = self._cache.get(key)
+    now = time.time()
+    if entry is not None and now < entry[0]:
+      expires, result, error = entry
+      if error is not None:
+        self._count('negative_hits')
+        raise error
+      self._count('hits')
+      return result
+    start = time.time()
+    try:
+      result = self._getaddrinfo(host, port, family, socktype, proto, flags)
+    except socket.gaierror, e:
+      self._count('failures', time.time() - start)
+      self._cache.set(key, (now + self._negative_ttl, None, e))
+      raise
+    self._count('misses', time.time() - start)
+    self._cache.set(key, (now + self._ttl, result, None))
+    return result
+
+  def stats(self):
+    """Returns a dict of resolution counters and times."""
+    resolutions = self.misses + self.failures
+    stats = {'hits': self.hits,
+             'negative_hits': self.negative_hits,
+             'misses': self.misses,
+             'failures': self.failures,
+             'resolve_seconds': self.resolve_seconds,
+             'mean_resolve_seconds': 0.0}
+    if resolutions:
+      stats['mean_resolve_seconds'] = self.resolve_seconds / resolutions
+    return stats
+
+  def _count(self, counter, seconds=None):
+    self._lock.acquire()
+    try:
+      setattr(self, counter, getattr(self, counter) + 1)
+      if seconds is not None:
+        self.resolve_seconds += seconds
+    finally:
+      self._lock.release()
+
+
+def create_connection(addresses, timeout=None, attempt_delay=None):
+  """Connects a socket to the first reachable address.
+
+  Args:
+    addresses: A list of getaddrinfo result tuples
+    timeout: The socket timeout, or None [optional]
+    attempt_delay: If set, the seconds to wait for an attempt before also
+      trying the next address in parallel, happy eyeballs style; otherwise
+      addresses are tried one after another [optional]
+  Returns:
+    A connected socket.
+  Raises:
+    socket.error if no address can be connected to
+  """
+  if not addresses:
+    raise socket.error('getaddrinfo returns an empty list')
+  if attempt_delay is None or len(addresses) == 1:
+    error = None
+    for address in addresses:
+      try:
+        return _connect(address, timeout)
+      except socket.error, e:
+        error = e
+    raise error
+  return _race(addresses, timeout, attempt_delay)
+
+
+def _connect(address, timeout):
+  family, socktype, proto, canonname, sockaddr = address
+  sock = socket.socket(family, socktype, proto)
+  try:
+    if httplib2.has_timeout(timeout):
+      sock.settimeout(timeout)
+    sock.connect(sockaddr)
+  except:
+    sock.close()
+    raise
+  return sock
+
+
+def _race(addresses, timeout, attempt_delay):
+  """Starts staggered connection attempts and keeps the first to succeed."""
+  results = Queue.Queue()
+  state = {'winner': None}
+  lock = threading.Lock()
+  def attempt(address):
+    try:
+      sock = _connect(address, timeout)
+    except socket.error, e:
+      results.put((None, e))
+      return
+    lock.acquire()
+    try:
+      if state['winner'] is None:
+        state['winner'] = sock
+        sock = None
+    finally:
+      lock.release()
+    if sock is not None:
+      sock.close()  # Lost the race
+    results.put((state['winner'], None))
+  pending = list(addresses)
+  outstanding = 0
+  error = None
+  while pending or outstanding:
+    if pending:
+      thread = threading.Thread(target=attempt, args=(pending.pop(0),))
+      thread.setDaemon(True)
+      thread.start()
+      outstanding += 1
+    try:
+      if pending:
+        winner, e = results.get(True, attempt_delay)
+      else:
+        winner, e = results.get()
+    except Queue.Empty:
+      continue
+    outstanding -= 1
+    if winner is not None:
+      return winner
+    error = e
+  raise error
+
+
+class HTTPConnection(httplib2.HTTPConnectionWithTimeout):
+  """An HTTP connection that resolves through a Resolver."""
+
+  def __init__(self, host, port=None, strict=None, timeout=None,
+               proxy_info=None, resolver=None, attempt_delay=None):
+    httplib2.HTTPConnectionWithTimeout.__init__(
+        self, host, port=port, strict=strict, timeout=timeout,
+        proxy_info=proxy_info)
+    self.resolver = resolver or Resolver()
+    self.attempt_delay = attempt_delay
+
+  def connect(self):
+    if self.proxy_info and self.proxy_info.isgood():
+      return httplib2.HTTPConnectionWithTimeout.connect(self)
+    addresses = self.resolver.getaddrinfo(self.host, self.port, 0,
+                                          socket.SOCK_STREAM)
+    self.sock = create_connection(addresses, self.timeout, self.attempt_delay)
+
+
+class HTTPSConnection(httplib2.HTTPSConnectionWithTimeout):
+  """An HTTPS connection that resolves through a Resolver."""
+
+  def __init__(self, host, port=None, key_file=None, cert_file=None,
+               strict=None, timeout=None, proxy_info=None, resolver=None,
+               attempt_delay=None):
+    httplib2.HTTPSConnectionWithTimeout.__init__(
+        self, host, port=port, key_file=key_file, cert_file=cert_file,
+        strict=strict, timeout=timeout, proxy_info=proxy_info)
+    self.resolver = resolver or Resolver()
+    self.attempt_delay = attempt_delay
+
+  def connect(self):
+    if self.proxy_info and self.proxy_info.isgood():
+      return httplib2.HTTPSConnectionWithTimeout.connect(self)
+    addresses = self.resolver.getaddrinfo(self.host, self.port, 0,
+                                          socket.SOCK_STREAM)
+    sock = create_connection(addresses, self.timeout, self.attempt_delay)
+    self.sock = httplib2._ssl_wrap_socket(sock, self.key_file, self.cert_file)
+
+
+class Http(httplib2.Http):
+  """An httplib2.Http whose connections resolve through a Resolver."""
+
+  def __init__(self, cache=None, timeout=None, proxy_info=None,
+               resolver=None, attempt_delay=None):
+    """Constructs a new HTTP client.
+
+    Args:
+      cache: As for httplib2.Http [optional]
+      timeout: As for httplib2.Http [optional]
+      proxy_info: As for httplib2.Http [optional]
+      resolver: A Resolver, usually shared between clients [optional]
+      attempt_delay: Seconds before racing the next address of a host,
+        or None to try addresses one at a time [optional]
+    """
+    httplib2.Http.__init__(self, cache, timeout, proxy_info)
+    self._use_resolver(resolver, attempt_delay)
+
+  def _use_resolver(self, resolver=None, attempt_delay=None):
+    """Makes new connections resolve through resolver.
+
+    Subclasses that also derive from another httplib2.Http subclass call
+    this instead of __init__, so httplib2.Http is initialized only once.
+    """
+    if resolver is None:
+      resolver = Resolver()
+    self.resolver = resolver
+    self._http_connection = functools.partial(
+        HTTPConnection, resolver=resolver, attempt_delay=attempt_delay)
+    self._https_connection = functools.partial(
+        HTTPSConnection, resolver=resolver, attempt_delay=attempt_delay)
+
+  def request(self, uri, method='GET', body=None, headers=None,
+              redirections=httplib2.DEFAULT_MAX_REDIRECTS,
+              connection_type=None):
+    if connection_type is None:
+      scheme, authority = httplib2.urlnorm(httplib2.iri2uri(uri))[:2]
+      # httplib2 treats http on port 443 as https
+      if scheme == 'https' or authority.split(':')[1:2] == ['443']:
+        connection_type = self._https_connection
+      else:
+        connection_type = self._http_connection
+    return httplib2.Http.request(self, uri, method, body, headers,
+                                 redirections, connection_type)
@@ -0,0 +1,154 @@
+#!/usr/bin/python2.5
+#
+# Tests the caching DNS resolver.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import BaseHTTPServer
+import dnscache
+import socket
+import threading
+import time
+import unittest
+
+
+class FakeGetaddrinfo(object):
+  def __init__(self, results):
+    self.results = results
+    self.calls = 0
+
+  def __call__(self, host, port, family=0, socktype=0, proto=0, flags=0):
+    self.calls += 1
+    result = self.results[host]
+    if isinstance(result, Exception):
+      raise result
+    return result
+
+
+LOCALHOST = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', 80))]
+
+
+class ResolverTest(unittest.TestCase):
+
+  def testCachesResults(self):
+    getaddrinfo = FakeGetaddrinfo({'example.com': LOCALHOST})
+    resolver = dnscache.Resolver(getaddrinfo=getaddrinfo)
+    self.assertEquals(LOCALHOST, resolver.getaddrinfo('example.com', 80))
+    self.assertEquals(LOCALHOST, resolver.getaddrinfo('example.com', 80))
+    self.assertEquals(1, getaddrinfo.calls)
+    stats = resolver.stats()
+    self.assertEquals(1, stats['hits'])
+    self.assertEquals(1, stats['misses'])
+
+  def testExpiresResults(self):
+    getaddrinfo = FakeGetaddrinfo({'example.com': LOCALHOST})
+    resolver = dnscache.Resolver(ttl=0, getaddrinfo=getaddrinfo)
+    resolver.getaddrinfo('example.com', 80)
+    time.sleep(0.01)
+    resolver.getaddrinfo('example.com', 80)
+    self.assertEquals(2, getaddrinfo.calls)
+
+  def testCachesFailures(self):
+    error = socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+    getaddrinfo = FakeGetaddrinfo({'nowhere.invalid': error})
+    resolver = dnscache.Resolver(getaddrinfo=getaddrinfo)
+    self.assertRaises(socket.gaierror,
+                      resolver.getaddrinfo, 'nowhere.invalid', 80)
+    self.assertRaises(socket.gaierror,
+                      resolver.getaddrinfo, 'nowhere.invalid', 80)
+    self.assertEquals(1, getaddrinfo.calls)
+    stats = resolver.stats()
+    self.assertEquals(1, stats['failures'])
+    self.assertEquals(1, stats['negative_hits'])
+
+
+class CreateConnectionTest(unittest.TestCase):
+
+  def setUp(self):
+    self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.server.bind(('127.0.0.1', 0))
+    self.server.listen(5)
+    self.address = (socket.AF_INET, socket.SOCK_STREAM, 6, '',
+                    self.server.getsockname())
+    # Nothing listens on the port of a closed socket
+    closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    closed.bind(('127.0.0.1', 0))
+    self.refused = (socket.AF_INET, socket.SOCK_STREAM, 6, '',
+                    closed.getsockname())
+    closed.close()
+
+  def tearDown(self):
+    self.server.close()
+
+  def testConnectsSequentially(self):
+    sock = dnscache.create_connection([self.refused, self.address], 5)
+    self.assertEquals(self.server.getsockname(), sock.getpeername())
+    sock.close()
+
+  def testRacesAddresses(self):
+    sock = dnscache.create_connection([self.refused, self.address], 5, 0.05)
+    self.assertEquals(self.server.getsockname(), sock.getpeername())
+    sock.close()
+
+  def testRaisesWhenNothingConnects(self):
+    self.assertRaises(socket.error, dnscache.create_connection,
+                      [self.refused, self.refused], 5, 0.05)
+    self.assertRaises(socket.error, dnscache.create_connection, [], 5)
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+  def do_GET(self):
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/plain')
+    self.send_header('Content-Length', '5')
+    self.end_headers()
+    self.wfile.write('hello')
+
+  def log_message(self, *args):
+    pass
+
+
+class HttpTest(unittest.TestCase):
+
+  def setUp(self):
+    self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=self.server.handle_request)
+    thread.setDaemon(True)
+    thread.start()
+
+  def tearDown(self):
+    self.server.server_close()
+
+  def testResolvesThroughResolver(self):
+    port = self.server.server_address[1]
+    address = (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', port))
+    getaddrinfo = FakeGetaddrinfo({'example.com': [address]})
+    resolver = dnscache.Resolver(getaddrinfo=getaddrinfo)
+    http = dnscache.Http(resolver=resolver, attempt_delay=0.05)
+    response, content = http.request('http://example.com:%d/' % port)
+    self.assertEquals(200, response.status)
+    self.assertEquals('hello', content)
+    self.assertEquals(1, getaddrinfo.calls)
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(ResolverTest))
+  suite.addTests(unittest.makeSuite(CreateConnectionTest))
+  suite.addTests(unittest.makeSuite(HttpTest))
+  return suite
+
+if __name__ == '__main__':
+  unittest.main()
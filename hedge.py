@@ -0,0 +1,176 @@
+#!/usr/bin/python2.5
+#
+# Issues hedged requests against redundant service endpoints.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import Queue
+import threading
+import time
+
+# The delay used before enough latencies have been observed
+DEFAULT_DELAY = 0.5
+
+# The percentile of observed primary latencies to wait before hedging
+DEFAULT_PERCENTILE = 95
+
+# The number of recent primary latencies kept
+DEFAULT_WINDOW = 100
+
+# The number of latencies required before the percentile is trusted
+MIN_SAMPLES = 10
+
+
+class Hedger(object):
+  """Races a primary call against a delayed secondary call.
+
+  The secondary call is only started if the primary has not answered
+  within a delay equal to a percentile of recently observed primary
+  latencies, so the extra load is bounded by (100 - percentile)%.
+  The first successful result wins and the other one is ignored.
+
+  A single Hedger may be shared by many Client instances so that the
+  latency history and the counters outlive any one lookup.
+  """
+
+  def __init__(self, delay=DEFAULT_DELAY, percentile=DEFAULT_PERCENTILE,
+               window=DEFAULT_WINDOW):
+    """Constructs a new Hedger.
+
+    Args:
+      delay: The hedge delay in seconds until enough samples exist [optional]
+      percentile: The percentile of primary latencies to wait [optional]
+      window: The number of recent latencies to keep [optional]
+    """
+    self._initial_delay = delay
+    self._percentile = percentile
+    self._window = window
+    self._latencies = list()
+    self._next = 0
+    self._lock = threading.Lock()
+    self.requests = 0
+    self.hedged = 0
+    self.fallbacks = 0
+    self.primary_wins = 0
+    self.secondary_wins = 0
+    self.failures = 0
+
+  def delay(self):
+    """Returns the number of seconds to wait before hedging."""
+    self._lock.acquire()
+    try:
+      if len(self._latencies) < MIN_SAMPLES:
+        return self._initial_delay
+      latencies = sorted(self._latencies)
+    finally:
+      self._lock.release()
+    index = int(len(latencies) * self._percentile / 100.0)
+    return latencies[min(index, len(latencies) - 1)]
+
+  def record_latency(self, seconds):
+    """Adds a primary latency to the history window.
+
+    Args:
+      seconds: The elapsed time of a successful primary call
+    """
+    self._lock.acquire()
+    try:
+      if len(self._latencies) < self._window:
+        self._latencies.append(seconds)
+      else:
+        self._latencies[self._next] = seconds
+        self._next = (self._next + 1) % self._window
+    finally:
+      self._lock.release()
+
+  def stats(self):
+    """Returns a dict of the hedging counters."""
+    return {'requests': self.requests,
+            'hedged': self.hedged,
+            'fallbacks': self.fallbacks,
+            'primary_wins': self.primary_wins,
+            'secondary_wins': self.secondary_wins,
+            'failures': self.failures,
+            'delay': self.delay()}
+
+  def run(self, primary, secondary):
+    """Calls primary, and secondary as well if primary is slow or fails.
+
+    Args:
+      primary: A callable returning the preferred result
+      secondary: A callable returning an equivalent result
+    Returns:
+      The first successful result.
+    Raises:
+      The last exception raised if neither call succeeds.
+    """
+    results = Queue.Queue()
+    self._increment('requests')
+    self._start('primary', primary, results)
+    outstanding = 1
+    hedged = False
+    last_error = None
+    while outstanding:
+      if hedged:
+        timeout = None
+      else:
+        timeout = self.delay()
+      try:
+        name, result, error = results.get(True, timeout)
+      except Queue.Empty:
+        # The primary is slower than usual; start the secondary as well
+        self._increment('hedged')
+        self._start('secondary', secondary, results)
+        outstanding += 1
+        hedged = True
+        continue
+      outstanding -= 1
+      if error is None:
+        self._increment('%s_wins' % name)
+        return result
+      last_error = error
+      if not hedged:
+        # The primary failed outright; fall back without waiting
+        self._increment('fallbacks')
+        self._start('secondary', secondary, results)
+        outstanding += 1
+        hedged = True
+    self._increment('failures')
+    raise last_error
+
+  def _start(self, name, function, results):
+    """Calls function on a daemon thread and posts its outcome to results."""
+    thread = threading.Thread(target=self._call,
+                              args=(name, function, results))
+    thread.setDaemon(True)
+    thread.start()
+
+  def _call(self, name, function, results):
+    start = time.time()
+    try:
+      result = function()
+    except Exception, e:
+      results.put((name, None, e))
+      return
+    if name == 'primary':
+      self.record_latency(time.time() - start)
+    results.put((name, result, None))
+
+  def _increment(self, counter):
+    self._lock.acquire()
+    try:
+      setattr(self, counter, getattr(self, counter) + 1)
+    finally:
+      self._lock.release()
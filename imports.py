@@ -23,8 +23,15 @@ APP_DIR = os.path.abspath(os.path.dirname(__file__))
 
 THIRD_PARTY = os.path.join(APP_DIR, 'third_party')
 
+# Precompiled third_party modules, as built by build_bundle.py
+BUNDLE = os.path.join(APP_DIR, 'third_party.zip')
+
 sys.path.insert(0, THIRD_PARTY)
 
+# Prefer the bundle; anything it lacks still loads from THIRD_PARTY
+if os.path.exists(BUNDLE) and not os.environ.get('WEBFINGER_NO_BUNDLE'):
+  sys.path.insert(0, BUNDLE)
+
 if 'google' in sys.modules:
   orig_google_module = sys.modules['google']
   del sys.modules['google']
@@ -0,0 +1,155 @@
+#!/usr/bin/python2.5
+#
+# A bounded, thread-safe least-recently-used cache.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import threading
+
+# Indexes into the [previous, next, key, value] entry lists
+_PREVIOUS, _NEXT, _KEY, _VALUE = 0, 1, 2, 3
+
+
+class LruCache(object):
+  """Maps keys to values, evicting the least recently used beyond a limit.
+
+  Entries live on a circular doubly linked list threaded through a dict,
+  so get, set and delete are all O(1).
+  """
+
+  def __init__(self, max_entries=1000):
+    """Constructs a new LRU cache.
+
+    Args:
+      max_entries: The maximum number of entries to keep [optional]
+    """
+    self._max_entries = max_entries
+    self._lock = threading.Lock()
+    self._map = dict()
+    self._root = root = list()
+    root[:] = [root, root, None, None]
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def __len__(self):
+    return len(self._map)
+
+  def __contains__(self, key):
+    return key in self._map
+
+  def get(self, key, default=None):
+    """Returns the value for key and marks it most recently used.
+
+    Args:
+      key: The key to look up
+      default: The value returned if key is absent [optional]
+    """
+    self._lock.acquire()
+    try:
+      entry = self._map.get(key)
+      if entry is None:
+        self.misses += 1
+        return default
+      self.hits += 1
+      self._unlink(entry)
+      self._append(entry)
+      return entry[_VALUE]
+    finally:
+      self._lock.release()
+
+  def set(self, key, value):
+    """Stores value for key, evicting the least recently used if full.
+
+    Args:
+      key: The key to store
+      value: The value to store
+    """
+    self._lock.acquire()
+    try:
+      entry = self._map.get(key)
+      if entry is not None:
+        entry[_VALUE] = value
+        self._unlink(entry)
+        self._append(entry)
+        return
+      entry = self._map[key] = [None, None, key, value]
+      self._append(entry)
+      while len(self._map) > self._max_entries:
+        oldest = self._root[_NEXT]
+        self._unlink(oldest)
+        del self._map[oldest[_KEY]]
+        self.evictions += 1
+    finally:
+      self._lock.release()
+
+  def delete(self, key):
+    """Removes key if present.
+
+    Args:
+      key: The key to remove
+    """
+    self._lock.acquire()
+    try:
+      entry = self._map.pop(key, None)
+      if entry is not None:
+        self._unlink(entry)
+    finally:
+      self._lock.release()
+
+  def items(self):
+    """Returns a list of (key, value) pairs, least recently used first.
+
+    Unlike get, this does not change how recently any entry was used.
+    """
+    self._lock.acquire()
+    try:
+      items = list()
+      entry = self._root[_NEXT]
+      while entry is not self._root:
+        items.append((entry[_KEY], entry[_VALUE]))
+        entry = entry[_NEXT]
+      return items
+    finally:
+      self._lock.release()
+
+  def clear(self):
+    """Removes every entry."""
+    self._lock.acquire()
+    try:
+      self._map.clear()
+      root = self._root
+      root[:] = [root, root, None, None]
+    finally:
+      self._lock.release()
+
+  def stats(self):
+    """Returns a dict of the cache counters."""
+    return {'entries': len(self._map),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions}
+
+  def _append(self, entry):
+    """Links entry in as the most recently used."""
+    root = self._root
+    last = root[_PREVIOUS]
+    entry[_PREVIOUS] = last
+    entry[_NEXT] = root
+    last[_NEXT] = root[_PREVIOUS] = entry
+
+  def _unlink(self, entry):
+    entry[_PREVIOUS][_NEXT] = entry[_NEXT]
+    entry[_NEXT][_PREVIOUS] = entry[_PREVIOUS]
@@ -0,0 +1,68 @@
+#!/usr/bin/python2.5
+#
+# Tests the LRU cache.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import lru
+import unittest
+
+class LruCacheTest(unittest.TestCase):
+
+  def testGetAndSet(self):
+    cache = lru.LruCache(2)
+    self.assertEquals(None, cache.get('a'))
+    cache.set('a', 1)
+    self.assertEquals(1, cache.get('a'))
+    cache.set('a', 2)
+    self.assertEquals(2, cache.get('a'))
+    self.assertEquals(1, len(cache))
+
+  def testEvictsLeastRecentlyUsed(self):
+    cache = lru.LruCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    self.assertEquals(1, cache.get('a'))
+    self.assertEquals(None, cache.get('b'))
+    self.assertEquals(3, cache.get('c'))
+    self.assertEquals(1, cache.evictions)
+
+  def testDelete(self):
+    cache = lru.LruCache(2)
+    cache.set('a', 1)
+    cache.delete('a')
+    cache.delete('a')
+    self.assertEquals(None, cache.get('a'))
+    self.assertEquals(0, len(cache))
+
+  def testItems(self):
+    cache = lru.LruCache(3)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.set('c', 3)
+    cache.get('a')
+    self.assertEquals([('b', 2), ('c', 3), ('a', 1)], cache.items())
+    self.assertEquals([('b', 2), ('c', 3), ('a', 1)], cache.items())
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(LruCacheTest))
+  return suite
+
+if __name__ == '__main__':
+  unittest.main()
@@ -18,32 +18,69 @@
 
 import imports  # Must be imported first to fix the third_party path
 
+import boundedhttp
+import compactcache
+import hashlib
 import html5lib
 import html5lib.treebuilders
-import httplib2
 import logging
+import lru
 import os
+import profiler
 import re
+import scheduler
 import simplejson
+import singleflight
+import snapshot
+import stats
 import sys
+import tieredcache
+import time
+import timeouts
 import urllib
 import webfinger
 import xrd
+import xrdcache
 
 from google.appengine.ext import webapp
 from google.appengine.ext.webapp.util import run_wsgi_app
 from google.appengine.ext.webapp import template
+from google.appengine.api import users
 from google.appengine.api.memcache import Client
 from xml.etree import cElementTree as etree
 
 TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), 'templates')
 
-template.register_template_library('templatefilters')
 
-
-# Enable a caching HTTP client
+# Enable a caching HTTP client, keeping hot entries in process memory,
+# compressing those in memcache, and refusing oversized documents
 MEMCACHE_CLIENT = Client()
-HTTP_CLIENT = httplib2.Http(MEMCACHE_CLIENT)
+COMPACT_CACHE = compactcache.CompactCache(MEMCACHE_CLIENT)
+HTTP_CACHE = tieredcache.TieredCache(COMPACT_CACHE)
+TRANSFER_STATS = boundedhttp.TransferStats()
+HTTP_CLIENT = webfinger.ThreadLocalHttp(
+    lambda: boundedhttp.Http(HTTP_CACHE, stats=TRANSFER_STATS))
+
+# Concurrent requests for the same identifier or URL share one fetch
+SINGLE_FLIGHT = singleflight.Group()
+
+# Parsed host-meta documents, revalidated when they expire. App Engine
+# doesn't let requests leave threads running, so there are no background
+# refreshes or scans.
+XRD_CACHE = xrdcache.RefreshAheadCache(max_concurrent=0, scan_interval=None)
+
+# Request timeouts for each host, from the latency of its past responses
+TIMEOUTS = timeouts.AdaptiveTimeouts()
+
+# Limits the load /lookup/batch puts on each host. Interactive lookups
+# fetch from one host at a time and are not held back.
+BATCH_SCHEDULER = scheduler.HostScheduler()
+
+# A snapshot of parsed documents (see snapshot.py), restored at startup
+SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), 'xrd_snapshot.bin')
+
+# The domains fetched by warmup requests, one per line
+TOP_DOMAINS_PATH = os.path.join(os.path.dirname(__file__), 'top_domains.txt')
 
 # Create a reusable HTML5 parser
 ETREE_BUILDER = html5lib.treebuilders.getTreeBuilder("etree", etree)
@@ -54,6 +91,23 @@ BINARY_PROTOBUF_MIMETYPE = 'application/x-protobuf'
 ASCII_PROTOBUF_MIMETYPE = 'text/plain'
 JSON_MIMETYPE = 'application/json'
 JSON_PRETTY_MIMETYPE = 'text/plain'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4'
+
+# The number of rendered description sections kept in memory
+MAX_CACHED_FRAGMENTS = 1000
+
+# Separates the page around the descriptions when streaming lookup.tmpl
+STREAM_MARKER = 'WEBFINGER_STREAM_MARKER'
+
+# Limits on /lookup/batch requests
+MAX_BATCH_SIZE = 100
+MAX_BATCH_WORKERS = 10
+
+# The max-age, in seconds, of responses whose descriptions don't expire,
+# and the most any response may be cached for
+DEFAULT_MAX_AGE = 300
+MAX_MAX_AGE = 24 * 60 * 60
 
 
 UNSAFE_HTML_CHARS = re.compile(r'[^\w\,\.\s\'\:\/\-\_\?]')
@@ -68,6 +122,68 @@ WELL_KNOWN_REL_VALUES = {
     'http://specs.openid.net/auth/2.0/provider': 'OpenID',
 }
 
+# Rendered xrd-html description sections, by content hash
+FRAGMENT_CACHE = lru.LruCache(MAX_CACHED_FRAGMENTS)
+
+# Template rendering counters, reported with the request metrics
+RENDER_STATS = {'renders': 0, 'render_seconds': 0.0}
+
+# Whether to record request, fetch and parse metrics and serve them, to
+# administrators only, at /_stats
+STATS_ENABLED = False
+
+# The routes and formats whose requests are counted, and the routes whose
+# requests are profiled, separately
+STATS_ROUTES = ['/', '/lookup', '/lookup/batch', '/xrd']
+STATS_FORMATS = ['web', 'html', 'json', 'proto', 'protoa']
+
+# Profile one request in this many (0 for none), and any request whose
+# 'profile' parameter was made by profiler.sign with this secret (None to
+# ignore it); administrators download the profiles from /_profile
+PROFILE_SAMPLE_RATE = 0
+PROFILE_SECRET = None
+PROFILER = profiler.Sampler(PROFILE_SAMPLE_RATE, PROFILE_SECRET)
+
+stats.REGISTRY.enabled = STATS_ENABLED
+stats.REGISTRY.register('render', lambda: RENDER_STATS)
+stats.REGISTRY.register('http_cache', HTTP_CACHE.stats)
+stats.REGISTRY.register('memcache_entries', COMPACT_CACHE.stats)
+stats.REGISTRY.register('transfer', TRANSFER_STATS.stats)
+stats.REGISTRY.register('single_flight', SINGLE_FLIGHT.stats)
+stats.REGISTRY.register('xrd_cache', XRD_CACHE.stats)
+stats.REGISTRY.register('fragment_cache', FRAGMENT_CACHE.stats)
+stats.REGISTRY.register('timeouts', TIMEOUTS.stats)
+stats.REGISTRY.register('batch_scheduler', BATCH_SCHEDULER.stats)
+
+def new_client(host_scheduler=None):
+  """Returns a webfinger.Client sharing this instance's caches.
+
+  Args:
+    host_scheduler: A scheduler.HostScheduler limiting the load on each
+      host [optional]
+  """
+  return webfinger.Client(http_client=HTTP_CLIENT,
+                          single_flight=SINGLE_FLIGHT,
+                          scheduler=host_scheduler,
+                          xrd_cache=XRD_CACHE,
+                          timeouts=TIMEOUTS)
+
+
+def restore_snapshot():
+  """Loads the deployed snapshot, if any, into XRD_CACHE."""
+  if not os.path.exists(SNAPSHOT_PATH):
+    return
+  stream = open(SNAPSHOT_PATH, 'rb')
+  try:
+    try:
+      count = snapshot.load(stream, XRD_CACHE, new_client().load_xrd)
+      logging.info('Restored %d documents from %s' % (count, SNAPSHOT_PATH))
+    except snapshot.SnapshotError, e:
+      logging.warning('Could not restore %s: %s' % (SNAPSHOT_PATH, e))
+  finally:
+    stream.close()
+
+
 def sanitize(string):
   """Allow only very safe chars through."""
   return UNSAFE_HTML_CHARS.sub('', string)
@@ -80,9 +196,44 @@ def sanitize_callback(string):
   else:
     return string
 
+def cache_control(descriptions, now=None):
+  """Returns a Cache-Control value lasting until the first Expires.
+
+  Args:
+    descriptions: A list of xrd_pb2.Xrd instances
+    now: The current time [optional]
+  """
+  if now is None:
+    now = time.time()
+  max_age = None
+  for description in descriptions:
+    expires = xrdcache.parse_datetime(description.expires)
+    if expires is not None:
+      seconds = int(max(0, expires - now))
+      if max_age is None or seconds < max_age:
+        max_age = seconds
+  if max_age is None:
+    max_age = DEFAULT_MAX_AGE
+  return 'public, max-age=%d' % min(max_age, MAX_MAX_AGE)
+
+def etag_matches(if_none_match, etag):
+  """Returns whether an If-None-Match header value matches an ETag."""
+  if not if_none_match:
+    return False
+  for candidate in if_none_match.split(','):
+    candidate = candidate.strip()
+    if candidate.startswith('W/'):
+      candidate = candidate[2:]
+    if candidate == '*' or candidate == etag:
+      return True
+  return False
+
+def is_pretty(page):
+  return page.request.get('pretty') in ['true', 'TRUE', 'pretty', '1']
+
 def output_xrd(page, xrd_data, format):
     if format == 'json':
-      pretty = page.request.get('pretty') in ['true', 'TRUE', 'pretty', '1']
+      pretty = is_pretty(page)
       if pretty:
         page.response.headers['Content-Type'] = JSON_PRETTY_MIMETYPE
       else:
@@ -92,16 +243,103 @@ def output_xrd(page, xrd_data, format):
       callback = sanitize_callback(page.request.get('callback'))
       if callback:
         output = '%s(%s)' % (callback, output)
-      page.response.out.write(output)
+      if not isinstance(xrd_data, list):
+        xrd_data = [xrd_data]
+      page._write_cacheable(output, xrd_data)
     else:
       page._error('Unsupported output format')
 
+def stream_xrd_json(page, descriptions):
+  """Writes a JSON array one description at a time.
+
+  If a description can not be fetched, the array still ends, with an
+  object holding the error in place of the remaining descriptions.
+
+  Args:
+    page: The RequestHandler to write to
+    descriptions: An iterable of xrd_pb2.Xrd instances
+  """
+  pretty = is_pretty(page)
+  if pretty:
+    page.response.headers['Content-Type'] = JSON_PRETTY_MIMETYPE
+    indent = 2
+  else:
+    page.response.headers['Content-Type'] = JSON_MIMETYPE
+    indent = None
+  marshaller = xrd.JsonMarshaller()
+  callback = sanitize_callback(page.request.get('callback'))
+  out = page.response.out
+  if callback:
+    out.write('%s(' % callback)
+  out.write('[')
+  separator = ''
+  try:
+    for description in descriptions:
+      out.write(separator)
+      out.write(simplejson.dumps(marshaller.to_object(description),
+                                 indent=indent))
+      separator = ','
+  except Exception, e:
+    # Headers may already be out, so end the document with the error
+    logging.warning('Stopped streaming descriptions: %s' % e)
+    out.write(separator)
+    out.write(simplejson.dumps({'error': str(e)}, indent=indent))
+  out.write(']')
+  if callback:
+    out.write(')')
+
 # Abstract base class for all page view classes
 class AbstractPage(webapp.RequestHandler):
 
   def _render_template(self, template_name, template_values={}):
+    self.response.out.write(
+        self._render_to_string(template_name, template_values))
+
+  def _render_to_string(self, template_name, template_values={}):
+    # template.render compiles each template once and caches it
     template_path = os.path.join(TEMPLATES_DIR, template_name)
-    self.response.out.write(template.render(template_path, template_values))
+    start = time.time()
+    output = template.render(template_path, template_values)
+    elapsed = time.time() - start
+    RENDER_STATS['renders'] += 1
+    RENDER_STATS['render_seconds'] += elapsed
+    logging.debug('Rendered %s in %.1f ms' % (template_name, elapsed * 1000))
+    return output
+
+  def _render_description_section(self, description):
+    """Renders (or reuses) the xrd-html section for a description."""
+    key = hashlib.md5(description.SerializeToString()).digest()
+    section = FRAGMENT_CACHE.get(key)
+    if section is None:
+      links = list()
+      for link in description.links:
+        links.append({'href': link.href,
+                      'rel': link.rel,
+                      'label': WELL_KNOWN_REL_VALUES.get(link.rel)})
+      section = self._render_to_string('xrd-html-description.tmpl',
+                                       {'description': description,
+                                        'links': links})
+      FRAGMENT_CACHE.set(key, section)
+    return section
+
+  def _write_cacheable(self, output, descriptions):
+    """Writes a response with validators, or a 304 if the client has it.
+
+    The ETag is a hash of the exact bytes sent, so it is a strong one.
+
+    Args:
+      output: The response body
+      descriptions: The xrd_pb2.Xrd instances output was made from
+    """
+    if isinstance(output, unicode):
+      output = output.encode('utf-8')
+    etag = '"%s"' % hashlib.md5(output).hexdigest()
+    self.response.headers['ETag'] = etag
+    self.response.headers['Cache-Control'] = cache_control(descriptions)
+    if etag_matches(self.request.headers.get('If-None-Match'), etag):
+      self.response.set_status(304)
+      return
+    self.response.out.write(output)
 
   def _error(self, message):
     self.redirect("/?error=%s" % urllib.quote(sanitize(message)))
@@ -124,7 +362,7 @@ class XrdPage(AbstractPage):
 
     format = self.request.get('format') or 'json'
 
-    client = webfinger.Client(http_client=HTTP_CLIENT)
+    client = new_client()
     xrd_data = client.fetch_and_parse_xrd(xrd_url)
     output_xrd(self, xrd_data, format)
 
@@ -135,37 +373,193 @@ class LookupPage(AbstractPage):
     identifier = self.request.get('identifier')
     if not identifier:
       return self._error('Please enter an address')
-    client = webfinger.Client(http_client=HTTP_CLIENT)
+    client = new_client()
+    format = self.request.get('format')
+    if self.request.get('stream') in ['true', 'TRUE', '1']:
+      if format == 'json' or self.request.get('callback'):
+        return self._stream(client, identifier, 'json')
+      elif not format or format == 'web':
+        return self._stream(client, identifier, 'web')
     try:
       descriptions = client.lookup(identifier)
     except Exception, e:
       return self._error(str(e))
-    format = self.request.get('format')
     template_values = dict()
     template_values['identifier'] = identifier
     template_values['descriptions'] = descriptions
-    template_values['relationships'] = WELL_KNOWN_REL_VALUES
     if format == 'html':  # A simple HTML-only response
+      template_values['sections'] = [
+          self._render_description_section(d) for d in descriptions]
       self._render_template('xrd-html.tmpl', template_values)
     elif format == 'protoa':  # ASCII protobufs
       self.response.headers['Content-Type'] = ASCII_PROTOBUF_MIMETYPE
       output = '\n'.join([str(p) for p in descriptions])
-      self.response.out.write(output)
+      self._write_cacheable(output, descriptions)
     elif format == 'proto':  # Binary protobufs
       self.response.headers['Content-Type'] = BINARY_PROTOBUF_MIMETYPE
       output = '\n'.join([p.SerializeToString() for p in descriptions])
-      self.response.out.write(output)
+      self._write_cacheable(output, descriptions)
     elif format == 'json' or self.request.get('callback'):  # JSON or JSONP
       output_xrd(self, descriptions, 'json')
     else:  # format == 'web'
       self._render_template('lookup.tmpl', template_values)
 
+  def _stream(self, client, identifier, format):
+    """Writes each description as soon as it is fetched.
+
+    The webapp framework buffers the response until the handler returns,
+    so this only lowers the time to first byte where the runtime streams
+    responses; elsewhere it saves holding the descriptions in a list.
+    """
+    try:
+      descriptions = client.iter_lookup(identifier)
+    except Exception, e:
+      return self._error(str(e))
+    if format == 'json':
+      stream_xrd_json(self, descriptions)
+    else:
+      self._stream_web(descriptions)
+
+  def _stream_web(self, descriptions):
+    """Writes lookup.tmpl with one section per description as it arrives."""
+    page_html = self._render_to_string(
+        'lookup.tmpl',
+        {'identifier': self.request.get('identifier'),
+         'descriptions': [],
+         'stream_marker': STREAM_MARKER})
+    head, tail = page_html.split(STREAM_MARKER, 1)
+    out = self.response.out
+    out.write(head)
+    try:
+      for description in descriptions:
+        out.write(self._render_to_string('lookup-description.tmpl',
+                                         {'description': description}))
+    except Exception, e:
+      logging.warning('Stopped streaming descriptions: %s' % e)
+      out.write('<p class="error">%s</p>' % sanitize(str(e)))
+    out.write(tail)
+
+# Looks up many identifiers, writing one JSON object per line as each
+# lookup completes
+class BatchLookupPage(AbstractPage):
+
+  def post(self):
+    identifiers = self.request.get_all('identifier')
+    if not identifiers:
+      identifiers = self.request.body.splitlines()
+    identifiers = [i.strip() for i in identifiers if i.strip()]
+    if not identifiers:
+      self.response.set_status(400)
+      self.response.out.write('Please post one or more identifiers')
+      return
+    if len(identifiers) > MAX_BATCH_SIZE:
+      self.response.set_status(413)
+      self.response.out.write(
+          'At most %d identifiers may be posted' % MAX_BATCH_SIZE)
+      return
+    self.response.headers['Content-Type'] = NDJSON_MIMETYPE
+    client = new_client(BATCH_SCHEDULER)
+    marshaller = xrd.JsonMarshaller()
+    workers = min(MAX_BATCH_WORKERS, len(identifiers))
+    for identifier, descriptions, error in client.lookup_many(
+        identifiers, max_workers=workers):
+      result = {'identifier': identifier}
+      if error is None:
+        result['descriptions'] = marshaller.to_object(descriptions)
+      else:
+        result['error'] = str(error)
+      self.response.out.write(simplejson.dumps(result))
+      self.response.out.write('\n')
+
+# Fetches the top domains before the instance takes traffic
+class WarmupPage(AbstractPage):
+
+  def get(self):
+    self.response.headers['Content-Type'] = 'text/plain'
+    if not os.path.exists(TOP_DOMAINS_PATH):
+      self.response.out.write('No top domains to warm')
+      return
+    domains = open(TOP_DOMAINS_PATH)
+    try:
+      count, failures = snapshot.prewarm(
+          new_client(), snapshot.read_domains(domains), MAX_BATCH_WORKERS)
+    finally:
+      domains.close()
+    self.response.out.write('Warmed %d domains, %d failed' % (count, failures))
+
+# Reports the process-wide metrics as JSON, or with format=prometheus in
+# the Prometheus text format
+class StatsPage(AbstractPage):
+
+  def get(self):
+    if not STATS_ENABLED:
+      return self.error(404)
+    if not users.is_current_user_admin():
+      return self.error(403)
+    self.response.headers['Cache-Control'] = 'no-cache'
+    current = stats.REGISTRY.snapshot()
+    if self.request.get('format') == 'prometheus':
+      self.response.headers['Content-Type'] = PROMETHEUS_MIMETYPE
+      self.response.out.write(stats.to_prometheus(current))
+    else:
+      self.response.headers['Content-Type'] = JSON_MIMETYPE
+      indent = None
+      if is_pretty(self):
+        indent = 2
+      self.response.out.write(
+          simplejson.dumps(stats.to_json_object(current), indent=indent))
+
+# Lists the profiled routes, or reports the most expensive functions of
+# one, as text or with format=pstats as a file for the pstats module
+class ProfilePage(AbstractPage):
+
+  def get(self):
+    if not PROFILE_SAMPLE_RATE and not PROFILE_SECRET:
+      return self.error(404)
+    if not users.is_current_user_admin():
+      return self.error(403)
+    self.response.headers['Cache-Control'] = 'no-cache'
+    self.response.headers['Content-Type'] = 'text/plain'
+    route = self.request.get('route')
+    if not route:
+      for route, count in sorted(PROFILER.routes().items()):
+        self.response.out.write('%s\t%d\n' % (route, count))
+      return
+    if self.request.get('format') == 'pstats':
+      output = PROFILER.dump(route)
+    else:
+      sort = self.request.get('sort') or 'cumulative'
+      try:
+        output = PROFILER.report(route, sort)
+      except KeyError:
+        self.response.set_status(400)
+        self.response.out.write('Unknown sort key %s' % sanitize(sort))
+        return
+    if output is None:
+      return self.error(404)
+    if self.request.get('format') == 'pstats':
+      self.response.headers['Content-Type'] = 'application/octet-stream'
+      self.response.headers['Content-Disposition'] = (
+          'attachment; filename="%s.pstats"' %
+          (re.sub(r'\W', '_', route).strip('_') or 'root'))
+    self.response.out.write(output)
+
+restore_snapshot()
+
 # Global application dispatcher
-application = webapp.WSGIApplication(
-  [('/', MainPage),
-   ('/lookup', LookupPage),
-   ('/xrd', XrdPage)],
-  debug=True)
+application = stats.WsgiMiddleware(
+  profiler.WsgiMiddleware(
+    webapp.WSGIApplication(
+      [('/', MainPage),
+       ('/lookup', LookupPage),
+       ('/lookup/batch', BatchLookupPage),
+       ('/xrd', XrdPage),
+       ('/_ah/warmup', WarmupPage),
+       ('/_stats', StatsPage),
+       ('/_profile', ProfilePage)],
+      debug=True),
+    PROFILER, STATS_ROUTES),
+  STATS_ROUTES, STATS_FORMATS)
 
 
 def main():
@@ -0,0 +1,265 @@
+#!/usr/bin/python2.5
+#
+# Profiles a sample of production requests, aggregated by route.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import StringIO
+import cProfile
+import cgi
+import hashlib
+import hmac
+import marshal
+import pstats
+import random
+import threading
+import time
+
+# The query parameter carrying a signed request to profile
+DEBUG_PARAMETER = 'profile'
+
+# The default seconds over which profiles are aggregated
+DEFAULT_WINDOW = 300
+
+# The default number of requests profiled at once
+DEFAULT_MAX_CONCURRENT = 1
+
+# The default number of functions in a report
+DEFAULT_LIMIT = 40
+
+
+def sign(secret, expires):
+  """Returns a debug parameter value that forces profiling until expires.
+
+  Args:
+    secret: The secret shared with the Sampler
+    expires: The time, in seconds since the epoch, the value stops working
+  """
+  expires = int(expires)
+  return '%d.%s' % (expires, _signature(secret, expires))
+
+
+def _signature(secret, expires):
+  return hmac.new(secret, str(expires), hashlib.sha1).hexdigest()
+
+
+def _equal(a, b):
+  """Compares two strings in time independent of where they differ."""
+  if len(a) != len(b):
+    return False
+  difference = 0
+  for x, y in zip(a, b):
+    difference |= ord(x) ^ ord(y)
+  return difference == 0
+
+
+class _Window(object):
+  """The aggregated profiles of each route over a period of time."""
+
+  def __init__(self, start):
+    self.start = start
+    self.end = None
+    self.profiles = dict()
+    self.requests = dict()
+
+
+class Sampler(object):
+  """Decides which requests to profile and aggregates their profiles.
+
+  One request in every rate is profiled, as is any request whose debug
+  parameter was made with sign and the shared secret. At most
+  max_concurrent requests are profiled at once, whatever was asked for,
+  which bounds the overhead. Profiles are summed per route over a window;
+  the previous complete window is kept for reports, so memory is bounded
+  by the number of routes and the functions they call.
+  """
+
+  def __init__(self, rate=0, secret=None, window=DEFAULT_WINDOW,
+               max_concurrent=DEFAULT_MAX_CONCURRENT):
+    """Constructs a new sampler.
+
+    Args:
+      rate: Profile one request in this many, or never if 0 [optional]
+      secret: The key debug parameters are signed with, or None to ignore
+        them [optional]
+      window: The seconds over which profiles are aggregated [optional]
+      max_concurrent: The most requests profiled at once [optional]
+    """
+    self._rate = rate
+    self._secret = secret
+    self._window = window
+    self._max_concurrent = max_concurrent
+    self._lock = threading.Lock()
+    self._active = 0
+    self._current = _Window(time.time())
+    self._previous = None
+
+  def should_profile(self, debug=None):
+    """Returns whether to profile a request.
+
+    Args:
+      debug: The value of the request's debug parameter [optional]
+    """
+    if debug and self._secret and self.verify(debug):
+      return True
+    return self._rate > 0 and random.random() * self._rate < 1
+
+  def verify(self, debug):
+    """Returns whether a debug parameter value is signed and unexpired."""
+    expires, dot, signature = debug.partition('.')
+    if not expires.isdigit() or int(expires) < time.time():
+      return False
+    return _equal(signature, _signature(self._secret, int(expires)))
+
+  def run(self, route, function, *args, **kwargs):
+    """Calls function under the profiler, adding its profile to route's.
+
+    If max_concurrent requests are already being profiled, function is
+    simply called.
+
+    Returns:
+      Whatever function returns.
+    """
+    self._lock.acquire()
+    try:
+      if self._active >= self._max_concurrent:
+        profile = None
+      else:
+        self._active += 1
+        profile = cProfile.Profile()
+    finally:
+      self._lock.release()
+    if profile is None:
+      return function(*args, **kwargs)
+    try:
+      return profile.runcall(function, *args, **kwargs)
+    finally:
+      self._add(route, profile)
+
+  def _add(self, route, profile):
+    profile_stats = pstats.Stats(profile)
+    self._lock.acquire()
+    try:
+      self._active -= 1
+      self._rotate(time.time())
+      window = self._current
+      if route in window.profiles:
+        window.profiles[route].add(profile_stats)
+      else:
+        window.profiles[route] = profile_stats
+      window.requests[route] = window.requests.get(route, 0) + 1
+    finally:
+      self._lock.release()
+
+  def _rotate(self, now):
+    """Starts a new window if the current one is over.
+
+    Must be called with the lock held.
+    """
+    if now - self._current.start >= self._window:
+      self._current.end = now
+      self._previous = self._current
+      self._current = _Window(now)
+
+  def routes(self):
+    """Returns a dict of the number of requests profiled for each route."""
+    window = self._report_window()
+    if window is None:
+      return dict()
+    return dict(window.requests)
+
+  def report(self, route, sort='cumulative', limit=DEFAULT_LIMIT):
+    """Returns the most expensive functions of a route as text.
+
+    Reports cover the last complete window, or the current one if there is
+    none yet.
+
+    Args:
+      route: The route
+      sort: A pstats sort key, such as 'cumulative' or 'time' [optional]
+      limit: The number of functions listed [optional]
+    Returns:
+      The report, or None if the route has not been profiled.
+    """
+    window = self._report_window()
+    if window is None or route not in window.profiles:
+      return None
+    output = StringIO.StringIO()
+    self._lock.acquire()
+    try:
+      output.write('%d requests to %s profiled since %s\n' % (
+          window.requests[route], route,
+          time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(window.start))))
+      profile_stats = window.profiles[route]
+      profile_stats.stream = output
+      profile_stats.sort_stats(sort).print_stats(limit)
+    finally:
+      self._lock.release()
+    return output.getvalue()
+
+  def dump(self, route):
+    """Returns a route's profile in the format read by pstats.Stats.
+
+    Returns:
+      The marshalled profile, or None if the route has not been profiled.
+    """
+    window = self._report_window()
+    if window is None or route not in window.profiles:
+      return None
+    self._lock.acquire()
+    try:
+      return marshal.dumps(window.profiles[route].stats)
+    finally:
+      self._lock.release()
+
+  def _report_window(self):
+    self._lock.acquire()
+    try:
+      self._rotate(time.time())
+      return self._previous or self._current
+    finally:
+      self._lock.release()
+
+
+class WsgiMiddleware(object):
+  """Profiles a sample of the requests to a WSGI application.
+
+  Paths not listed in routes are aggregated as 'other'.
+  """
+
+  def __init__(self, application, sampler, routes):
+    """Wraps an application.
+
+    Args:
+      application: A WSGI application
+      sampler: A Sampler
+      routes: The paths aggregated individually
+    """
+    self._application = application
+    self._sampler = sampler
+    self._routes = frozenset(routes)
+
+  def __call__(self, environ, start_response):
+    query = environ.get('QUERY_STRING')
+    debug = None
+    if query and DEBUG_PARAMETER in query:
+      debug = cgi.parse_qs(query).get(DEBUG_PARAMETER, [None])[0]
+    if not self._sampler.should_profile(debug):
+      return self._application(environ, start_response)
+    route = environ.get('PATH_INFO') or '/'
+    if route not in self._routes:
+      route = 'other'
+    return self._sampler.run(route, self._application, environ,
+                             start_response)
@@ -0,0 +1,112 @@
+#!/usr/bin/python2.5
+#
+# Tests the request profiler.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import marshal
+import profiler
+import time
+import unittest
+
+
+def expensive_function():
+  return sum(range(1000))
+
+
+def application(environ, start_response):
+  start_response('200 OK', [])
+  return [str(expensive_function())]
+
+
+def start_response(status, headers, exc_info=None):
+  pass
+
+
+class SamplerTest(unittest.TestCase):
+
+  def testRate(self):
+    self.assertFalse(profiler.Sampler().should_profile())
+    self.assertTrue(profiler.Sampler(rate=1).should_profile())
+
+  def testSignedDebugParameter(self):
+    sampler = profiler.Sampler(secret='secret')
+    self.assertTrue(sampler.should_profile(
+        profiler.sign('secret', time.time() + 60)))
+    self.assertFalse(sampler.should_profile(
+        profiler.sign('other', time.time() + 60)))
+    self.assertFalse(sampler.should_profile(
+        profiler.sign('secret', time.time() - 60)))
+    self.assertFalse(sampler.should_profile('garbage'))
+    # Without a secret, debug parameters are ignored
+    self.assertFalse(profiler.Sampler().should_profile(
+        profiler.sign('', time.time() + 60)))
+
+  def testReportAggregatesByRoute(self):
+    sampler = profiler.Sampler(rate=1)
+    for i in range(3):
+      self.assertEquals(499500, sampler.run('/lookup', expensive_function))
+    sampler.run('/xrd', expensive_function)
+    self.assertEquals({'/lookup': 3, '/xrd': 1}, sampler.routes())
+    report = sampler.report('/lookup')
+    self.assertTrue(report.startswith('3 requests to /lookup profiled'))
+    self.assertTrue('expensive_function' in report)
+    self.assertEquals(None, sampler.report('/missing'))
+    self.assertRaises(KeyError, sampler.report, '/lookup', 'nonsense')
+
+  def testDump(self):
+    sampler = profiler.Sampler(rate=1)
+    sampler.run('/lookup', expensive_function)
+    functions = [name for filename, line, name
+                 in marshal.loads(sampler.dump('/lookup'))]
+    self.assertTrue('expensive_function' in functions)
+
+  def testWindows(self):
+    sampler = profiler.Sampler(rate=1, window=0.05)
+    sampler.run('/lookup', expensive_function)
+    time.sleep(0.1)
+    sampler.run('/xrd', expensive_function)
+    # The report covers the last complete window
+    self.assertEquals({'/lookup': 1}, sampler.routes())
+
+  def testConcurrencyLimit(self):
+    sampler = profiler.Sampler(rate=1, max_concurrent=1)
+    def nested():
+      return sampler.run('/inner', expensive_function)
+    sampler.run('/outer', nested)
+    self.assertEquals({'/outer': 1}, sampler.routes())
+
+
+class WsgiMiddlewareTest(unittest.TestCase):
+
+  def testProfilesSampledRequests(self):
+    sampler = profiler.Sampler(secret='secret')
+    middleware = profiler.WsgiMiddleware(application, sampler, ['/lookup'])
+    debug = profiler.sign('secret', time.time() + 60)
+    for path, query in [('/lookup', ''), ('/lookup', 'profile=' + debug),
+                        ('/elsewhere', 'profile=' + debug)]:
+      self.assertEquals(['499500'], middleware(
+          {'PATH_INFO': path, 'QUERY_STRING': query}, start_response))
+    self.assertEquals({'/lookup': 1, 'other': 1}, sampler.routes())
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(SamplerTest))
+  suite.addTests(unittest.makeSuite(WsgiMiddlewareTest))
+  return suite
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,248 @@
+#!/usr/bin/python2.5
+#
+# Schedules outbound requests politely across many hosts.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import collections
+import email.utils
+import threading
+import time
+
+# The default number of concurrent requests per host
+DEFAULT_MAX_PER_HOST = 2
+
+# The default sustained requests per second per host
+DEFAULT_RATE = 5.0
+
+# The default number of requests a host may receive in a burst
+DEFAULT_BURST = 5
+
+# The default number of concurrent requests across all hosts
+DEFAULT_MAX_TOTAL = 32
+
+# The backoff after a 429 or 503 without a usable Retry-After header
+DEFAULT_BACKOFF = 1.0
+
+# The longest a host is ever backed off for, in seconds
+MAX_BACKOFF = 300.0
+
+# Responses that ask us to slow down
+THROTTLE_STATUSES = (429, 503)
+
+# The longest a waiting thread sleeps before checking again
+MAX_WAIT = 1.0
+
+
+def parse_retry_after(value, now=None):
+  """Converts a Retry-After header value to a number of seconds.
+
+  Args:
+    value: The header value, either delta-seconds or an HTTP-date
+    now: The current time [optional]
+  Returns:
+    The number of seconds to wait, or None if value can not be parsed.
+  """
+  if not value:
+    return None
+  value = value.strip()
+  if value.isdigit():
+    return float(value)
+  parsed = email.utils.parsedate_tz(value)
+  if parsed is None:
+    return None
+  if now is None:
+    now = time.time()
+  return max(0.0, email.utils.mktime_tz(parsed) - now)
+
+
+class _Host(object):
+  """The politeness state of one host."""
+
+  def __init__(self, burst, now):
+    self.active = 0
+    self.tokens = float(burst)
+    self.refilled = now
+    self.blocked_until = 0.0
+    self.backoff = 0.0
+    self.waiters = collections.deque()
+
+
+class HostScheduler(object):
+  """Bounds the load each host sees while keeping overall throughput high.
+
+  Each host has a concurrency limit and a token bucket rate limit, and is
+  backed off when it answers 429 or 503 (honoring Retry-After). When the
+  overall concurrency limit is the bottleneck, waiting hosts are served
+  round-robin so that one busy host can not starve the rest.
+
+  Callers bracket each request with acquire(host) and release(host, ...).
+  """
+
+  def __init__(self, max_per_host=DEFAULT_MAX_PER_HOST, rate=DEFAULT_RATE,
+               burst=DEFAULT_BURST, max_total=DEFAULT_MAX_TOTAL):
+    """Constructs a new scheduler.
+
+    Args:
+      max_per_host: Concurrent requests allowed per host [optional]
+      rate: Sustained requests per second allowed per host [optional]
+      burst: Requests a host may receive back to back [optional]
+      max_total: Concurrent requests allowed overall, or None [optional]
+    """
+    self._max_per_host = max_per_host
+    self._rate = rate
+    self._burst = burst
+    self._max_total = max_total
+    self._condition = threading.Condition()
+    self._hosts = dict()
+    self._ring = collections.deque()
+    self._active = 0
+    self._wakeup = None
+    self.granted = 0
+    self.throttled = 0
+
+  def acquire(self, host):
+    """Blocks until a request to host may start.
+
+    Args:
+      host: The host name (or authority) the request is for
+    """
+    ticket = [False]
+    self._condition.acquire()
+    try:
+      state = self._host(host)
+      if not state.waiters:
+        self._ring.append(host)
+      state.waiters.append(ticket)
+      self._dispatch()
+      while not ticket[0]:
+        timeout = MAX_WAIT
+        if self._wakeup is not None:
+          timeout = min(timeout, max(self._wakeup - time.time(), 0.001))
+        self._condition.wait(timeout)
+        if not ticket[0]:
+          self._dispatch()
+    finally:
+      self._condition.release()
+
+  def release(self, host, status=None, retry_after=None):
+    """Marks a request to host as finished.
+
+    Args:
+      host: The host passed to acquire
+      status: The HTTP status of the response, if any [optional]
+      retry_after: The Retry-After header of the response [optional]
+    """
+    self._condition.acquire()
+    try:
+      state = self._hosts[host]
+      state.active -= 1
+      self._active -= 1
+      now = time.time()
+      if status in THROTTLE_STATUSES:
+        self.throttled += 1
+        delay = parse_retry_after(retry_after, now)
+        if delay is None:
+          delay = max(DEFAULT_BACKOFF, state.backoff * 2)
+        state.backoff = min(delay, MAX_BACKOFF)
+        state.blocked_until = now + state.backoff
+      elif status is not None:
+        state.backoff = 0.0
+      self._dispatch()
+    finally:
+      self._condition.release()
+
+  def stats(self):
+    """Returns a dict of scheduler counters."""
+    self._condition.acquire()
+    try:
+      return {'active': self._active,
+              'hosts': len(self._hosts),
+              'waiting_hosts': len(self._ring),
+              'granted': self.granted,
+              'throttled': self.throttled}
+    finally:
+      self._condition.release()
+
+  def _host(self, host):
+    state = self._hosts.get(host)
+    if state is None:
+      state = self._hosts[host] = _Host(self._burst, time.time())
+    return state
+
+  def _dispatch(self):
+    """Grants waiting requests round-robin across hosts.
+
+    Must be called with the condition held.
+    """
+    now = time.time()
+    self._wakeup = None
+    granted = True
+    while granted and self._ring:
+      granted = False
+      for i in range(len(self._ring)):
+        if self._max_total is not None and self._active >= self._max_total:
+          break
+        if not self._ring:
+          break
+        host = self._ring[0]
+        self._ring.rotate(-1)
+        state = self._hosts[host]
+        if not self._ready(state, now):
+          continue
+        ticket = state.waiters.popleft()
+        ticket[0] = True
+        state.active += 1
+        state.tokens -= 1
+        self._active += 1
+        self.granted += 1
+        granted = True
+        if not state.waiters:
+          self._ring.remove(host)
+    self._forget_idle_hosts(now)
+    self._condition.notifyAll()
+
+  def _ready(self, state, now):
+    """Returns whether a host can take another request now.
+
+    Also records in self._wakeup when a host that is only waiting on time
+    (tokens or backoff) will next become ready.
+    """
+    if state.active >= self._max_per_host:
+      return False
+    if now < state.blocked_until:
+      self._wake_at(state.blocked_until)
+      return False
+    state.tokens = min(float(self._burst),
+                       state.tokens + (now - state.refilled) * self._rate)
+    state.refilled = now
+    if state.tokens < 1:
+      self._wake_at(now + (1 - state.tokens) / self._rate)
+      return False
+    return True
+
+  def _wake_at(self, when):
+    if self._wakeup is None or when < self._wakeup:
+      self._wakeup = when
+
+  def _forget_idle_hosts(self, now):
+    """Drops hosts whose state no longer matters, bounding memory."""
+    if len(self._hosts) <= len(self._ring) + self._active * 2 + 1000:
+      return
+    for host, state in self._hosts.items():
+      if state.active or state.waiters or now < state.blocked_until:
+        continue
+      if state.tokens + (now - state.refilled) * self._rate >= self._burst:
+        del self._hosts[host]
@@ -0,0 +1,103 @@
+#!/usr/bin/python2.5
+#
+# Tests the per-host politeness scheduler.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import scheduler
+import threading
+import time
+import unittest
+
+class HostSchedulerTest(unittest.TestCase):
+
+  def testPerHostConcurrency(self):
+    hosts = scheduler.HostScheduler(max_per_host=2, rate=1000, burst=1000)
+    peak = [0, 0]
+    lock = threading.Lock()
+    def request():
+      hosts.acquire('example.com')
+      lock.acquire()
+      peak[0] += 1
+      peak[1] = max(peak)
+      lock.release()
+      time.sleep(0.02)
+      lock.acquire()
+      peak[0] -= 1
+      lock.release()
+      hosts.release('example.com', 200)
+    threads = [threading.Thread(target=request) for i in range(6)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEquals(2, peak[1])
+    self.assertEquals(6, hosts.granted)
+
+  def testRateLimit(self):
+    hosts = scheduler.HostScheduler(rate=20, burst=1)
+    start = time.time()
+    for i in range(3):
+      hosts.acquire('example.com')
+      hosts.release('example.com', 200)
+    self.assertTrue(time.time() - start >= 0.09)
+
+  def testRetryAfter(self):
+    hosts = scheduler.HostScheduler(rate=1000, burst=1000)
+    hosts.acquire('example.com')
+    hosts.release('example.com', 503, '1')
+    start = time.time()
+    hosts.acquire('example.org')
+    hosts.release('example.org', 200)
+    self.assertTrue(time.time() - start < 0.5)
+    hosts.acquire('example.com')
+    self.assertTrue(time.time() - start >= 0.9)
+    self.assertEquals(1, hosts.throttled)
+
+  def testRoundRobin(self):
+    hosts = scheduler.HostScheduler(max_per_host=10, rate=1000, burst=1000,
+                                    max_total=1)
+    order = list()
+    hosts.acquire('busy.com')
+    def request(host):
+      hosts.acquire(host)
+      order.append(host)
+      hosts.release(host, 200)
+    threads = list()
+    for host in ['busy.com', 'busy.com', 'busy.com', 'quiet.com']:
+      thread = threading.Thread(target=request, args=(host,))
+      thread.start()
+      threads.append(thread)
+      time.sleep(0.01)
+    hosts.release('busy.com', 200)
+    for thread in threads:
+      thread.join()
+    self.assertEquals('quiet.com', order[1])
+
+  def testParseRetryAfter(self):
+    self.assertEquals(120.0, scheduler.parse_retry_after('120'))
+    self.assertEquals(
+        60.0, scheduler.parse_retry_after('Thu, 01 Jan 1970 00:02:00 GMT',
+                                          now=60))
+    self.assertEquals(None, scheduler.parse_retry_after('soon'))
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(HostSchedulerTest))
+  return suite
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/python2.5
+#
+# Collapses concurrent identical calls into a single call.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import threading
+
+
+class _Call(object):
+  """An in-flight call and its eventual outcome."""
+
+  def __init__(self):
+    self.done = threading.Event()
+    self.result = None
+    self.error = None
+
+
+class Group(object):
+  """Runs at most one call per key at a time.
+
+  Callers that arrive while a call for the same key is in flight wait for
+  it and share its result (or its exception) instead of repeating the
+  work. Results are shared, not copied, so callers must not mutate them.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._calls = dict()
+    self.calls = 0
+    self.shared = 0
+
+  def do(self, key, function, *args):
+    """Calls function(*args) unless a call for key is already in flight.
+
+    Args:
+      key: A hashable key identifying equivalent calls
+      function: The callable to run
+      args: The arguments to function
+    Returns:
+      The result of function, possibly computed by another thread.
+    Raises:
+      Whatever function raised, possibly in another thread.
+    """
+    self._lock.acquire()
+    try:
+      call = self._calls.get(key)
+      if call is not None:
+        self.shared += 1
+        leader = False
+      else:
+        call = self._calls[key] = _Call()
+        self.calls += 1
+        leader = True
+    finally:
+      self._lock.release()
+    if not leader:
+      call.done.wait()
+      if call.error is not None:
+        raise call.error
+      return call.result
+    try:
+      try:
+        call.result = function(*args)
+      except Exception, e:
+        call.error = e
+        raise
+    finally:
+      self._lock.acquire()
+      try:
+        del self._calls[key]
+      finally:
+        self._lock.release()
+      call.done.set()
+    return call.result
+
+  def stats(self):
+    """Returns a dict of the call counters."""
+    return {'calls': self.calls, 'shared': self.shared}
@@ -0,0 +1,180 @@
+#!/usr/bin/python2.5
+#
+# Saves, restores and pre-warms caches of parsed XRD documents.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Usage:
+#
+#   snapshot.py [--workers N] DOMAINS OUTPUT
+#
+# Fetches the host-meta document of each domain listed in DOMAINS, one per
+# line, and writes them to the snapshot file OUTPUT.
+#
+# A snapshot is a stream of length-delimited records. The first is MAGIC;
+# after that each cached document is a pair of records, a JSON object of
+# its url, etag, last_modified, expires (its own expiry, or null) and
+# loaded (when it was fetched), then the serialized xrd_pb2.Xrd.
+
+import imports
+
+import compactxrd
+import delimited
+import logging
+import optparse
+import sys
+import time
+import webfinger
+import xrd_pb2
+import xrdcache
+
+try:
+  import simplejson as json
+except ImportError:
+  import json
+
+# The first record of every snapshot, naming the format and its version
+MAGIC = 'webfinger-xrd-snapshot/2'
+
+
+class SnapshotError(Exception):
+  """Raised when a snapshot can not be read."""
+  pass
+
+
+class UsageError(Exception):
+  """Raised on command-line usage errors."""
+  pass
+
+
+def dump(cache, stream):
+  """Writes the entries of a cache to a snapshot.
+
+  Args:
+    cache: An xrdcache.RefreshAheadCache of compactxrd.Xrd instances
+    stream: A file-like object open for binary writing
+  Returns:
+    The number of documents written.
+  """
+  delimited.write(stream, MAGIC)
+  count = 0
+  for url, description, etag, last_modified, expires, loaded in (
+      cache.entries()):
+    metadata = {'url': url, 'etag': etag, 'last_modified': last_modified,
+                'expires': expires, 'loaded': loaded}
+    delimited.write(stream, json.dumps(metadata))
+    delimited.write(stream, description.to_pb().SerializeToString())
+    count += 1
+  return count
+
+
+def load(stream, cache, loader):
+  """Reads a snapshot into a cache.
+
+  Each document's lifetime is recomputed from when it was fetched. The
+  ones whose lifetime is over are restored as stale, to be revalidated by
+  their first read, unless they have no validators to revalidate with.
+
+  Args:
+    stream: A file-like object open for binary reading
+    cache: An xrdcache.RefreshAheadCache, filled with compactxrd.Xrd
+      instances
+    loader: The function that refreshes the documents, usually the
+      load_xrd method of a webfinger.Client
+  Returns:
+    The number of documents restored.
+  Raises:
+    SnapshotError if the stream is not a readable snapshot
+  """
+  records = delimited.read(stream)
+  try:
+    if records.next() != MAGIC:
+      raise SnapshotError('Not a snapshot, or an unsupported version')
+    count = 0
+    for record in records:
+      metadata = json.loads(record)
+      try:
+        data = records.next()
+      except StopIteration:
+        raise SnapshotError('Snapshot ends after metadata for %s' %
+                            metadata['url'])
+      description = xrd_pb2.Xrd()
+      description.ParseFromString(data)
+      if cache.put(metadata['url'], compactxrd.Xrd.from_pb(description),
+                   loader, metadata['etag'], metadata['last_modified'],
+                   metadata['expires'], metadata['loaded']):
+        count += 1
+    return count
+  except StopIteration:
+    raise SnapshotError('Empty snapshot')
+  except (delimited.DecodeError, ValueError, KeyError), e:
+    raise SnapshotError('Corrupt snapshot: %s' % e)
+
+
+def prewarm(client, domains, max_workers=webfinger.DEFAULT_MAX_WORKERS):
+  """Fetches the host-meta documents of many domains into a client's cache.
+
+  Args:
+    client: A webfinger.Client with an xrd_cache
+    domains: An iterable of domain names
+    max_workers: The maximum number of concurrent fetches [optional]
+  Returns:
+    A tuple of (domains fetched, domains that failed)
+  """
+  count = failures = 0
+  for domain, links, error in client.prewarm(domains, max_workers):
+    count += 1
+    if error is not None:
+      failures += 1
+      logging.warning('Could not prewarm %s: %s' % (domain, error))
+  return count, failures
+
+
+def read_domains(stream):
+  """Yields the non-blank, uncommented, lowercased domains in stream."""
+  for line in stream:
+    domain = line.strip().lower()
+    if domain and not domain.startswith('#'):
+      yield domain
+
+
+def main(argv):
+  parser = optparse.OptionParser(
+      usage='Usage snapshot.py [--workers N] DOMAINS OUTPUT')
+  parser.add_option('--workers', type='int',
+                    default=webfinger.DEFAULT_MAX_WORKERS,
+                    help='concurrent fetches [default: %default]')
+  options, args = parser.parse_args(argv[1:])
+  if len(args) != 2:
+    raise UsageError('Usage snapshot.py [--workers N] DOMAINS OUTPUT')
+  domains_path, output_path = args
+  cache = xrdcache.RefreshAheadCache(scan_interval=None)
+  client = webfinger.Client(xrd_cache=cache)
+  domains = open(domains_path)
+  try:
+    start = time.time()
+    count, failures = prewarm(client, read_domains(domains), options.workers)
+  finally:
+    domains.close()
+  output = open(output_path, 'wb')
+  try:
+    written = dump(cache, output)
+  finally:
+    output.close()
+  print 'Fetched %d domains (%d failed) in %.1f s, wrote %d documents' % (
+      count, failures, time.time() - start, written)
+
+if __name__ == "__main__":
+  main(sys.argv)
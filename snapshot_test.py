@@ -0,0 +1,134 @@
+#!/usr/bin/python2.5
+#
+# Tests saving, restoring and pre-warming XRD caches.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import StringIO
+import compactxrd
+import delimited
+import snapshot
+import time
+import unittest
+import webfinger
+import webfinger_test
+import xrdcache
+
+
+def new_description(subject):
+  return compactxrd.Xrd(subject=subject)
+
+
+def unused_loader(key, etag, last_modified):
+  raise AssertionError('Unexpected load of %s' % key)
+
+
+class SnapshotTest(unittest.TestCase):
+
+  def testRoundTrip(self):
+    cache = xrdcache.RefreshAheadCache(scan_interval=None)
+    now = time.time()
+    cache.put('http://a/', new_description('a'), unused_loader, '"1"', None,
+              now + 600)
+    cache.put('http://b/', new_description('b'), unused_loader, None,
+              'Thu, 05 Nov 2009 12:00:00 GMT', now + 600)
+    stream = StringIO.StringIO()
+    self.assertEquals(2, snapshot.dump(cache, stream))
+    stream.seek(0)
+    restored = xrdcache.RefreshAheadCache(scan_interval=None)
+    self.assertEquals(2, snapshot.load(stream, restored, unused_loader))
+    entries = dict((entry[0], entry) for entry in restored.entries())
+    self.assertEquals('a', entries['http://a/'][1].subject)
+    self.assertEquals('"1"', entries['http://a/'][2])
+    self.assertEquals('Thu, 05 Nov 2009 12:00:00 GMT', entries['http://b/'][3])
+    self.assertEquals('b', restored.get('http://b/', unused_loader).subject)
+
+  def testRestoresExpiredDocumentsAsStale(self):
+    # Fetched an hour ago, with a lifetime of ten minutes
+    loaded = time.time() - 3600
+    cache = xrdcache.RefreshAheadCache(scan_interval=None)
+    cache.put('http://a/', new_description('a'), unused_loader, '"1"',
+              expires=loaded + 600, loaded=loaded)
+    cache.put('http://b/', new_description('b'), unused_loader,
+              expires=loaded + 600, loaded=loaded)
+    stream = StringIO.StringIO()
+    self.assertEquals(1, snapshot.dump(cache, stream))
+    stream.seek(0)
+    restored = xrdcache.RefreshAheadCache(scan_interval=None)
+    self.assertEquals(1, snapshot.load(stream, restored, unused_loader))
+    revalidations = []
+    def loader(key, etag, last_modified):
+      revalidations.append((key, etag))
+      return None, etag, last_modified, time.time() + 600
+    self.assertEquals('a', restored.get('http://a/', loader).subject)
+    self.assertEquals([('http://a/', '"1"')], revalidations)
+
+  def testRecomputesLifetimeFromFetchTime(self):
+    cache = xrdcache.RefreshAheadCache(scan_interval=None)
+    cache.put('http://a/', new_description('a'), unused_loader,
+              loaded=time.time() - 60)
+    stream = StringIO.StringIO()
+    snapshot.dump(cache, stream)
+    stream.seek(0)
+    restored = xrdcache.RefreshAheadCache(scan_interval=None)
+    self.assertEquals(1, snapshot.load(stream, restored, unused_loader))
+    self.assertEquals('a', restored.get('http://a/', unused_loader).subject)
+
+  def testRejectsOtherFiles(self):
+    cache = xrdcache.RefreshAheadCache(scan_interval=None)
+    self.assertRaises(snapshot.SnapshotError, snapshot.load,
+                      StringIO.StringIO(''), cache, unused_loader)
+    stream = StringIO.StringIO()
+    delimited.write(stream, 'something else')
+    stream.seek(0)
+    self.assertRaises(snapshot.SnapshotError, snapshot.load,
+                      stream, cache, unused_loader)
+
+  def testRejectsTruncatedSnapshots(self):
+    stream = StringIO.StringIO()
+    delimited.write(stream, snapshot.MAGIC)
+    delimited.write(stream, '{"url": "http://a/", "etag": null, '
+                            '"last_modified": null, "expires": null, '
+                            '"loaded": null}')
+    stream.seek(0)
+    cache = xrdcache.RefreshAheadCache(scan_interval=None)
+    self.assertRaises(snapshot.SnapshotError, snapshot.load,
+                      stream, cache, unused_loader)
+
+
+class PrewarmTest(unittest.TestCase):
+
+  def testPrewarm(self):
+    http = webfinger_test.new_http()
+    cache = xrdcache.RefreshAheadCache(scan_interval=None)
+    client = webfinger.Client(http_client=http, xrd_cache=cache)
+    domains = snapshot.read_domains(
+        StringIO.StringIO('# Top domains\nexample.com\n\nEXAMPLE.org\n'))
+    self.assertEquals((2, 1), snapshot.prewarm(client, domains))
+    self.assertEquals(['http://example.com/.well-known/host-meta'],
+                      [entry[0] for entry in cache.entries()])
+    client.lookup('bob@example.com')
+    self.assertEquals(
+        1, http.requested.count('http://example.com/.well-known/host-meta'))
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(SnapshotTest))
+  suite.addTests(unittest.makeSuite(PrewarmTest))
+  return suite
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,191 @@
+#!/usr/bin/python2.5
+#
+# A size-bounded, single-file cache for httplib2 backed by SQLite.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import sqlite3
+import threading
+import time
+
+# The default byte budget for cached values
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Seconds to wait for another process to release the database
+DEFAULT_BUSY_TIMEOUT = 30.0
+
+# Access times are only rewritten when older than this many seconds, so
+# that hot entries don't cost a write on every hit
+ACCESS_GRANULARITY = 60.0
+
+# The running total of value sizes is kept up to date by triggers, so every
+# process sharing the file sees the same total without a table scan.
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS entries (
+         key TEXT PRIMARY KEY,
+         value BLOB NOT NULL,
+         size INTEGER NOT NULL,
+         created REAL NOT NULL,
+         accessed REAL NOT NULL)''',
+    '''CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)''',
+    '''CREATE TABLE IF NOT EXISTS totals (
+         id INTEGER PRIMARY KEY CHECK (id = 0),
+         bytes INTEGER NOT NULL)''',
+    '''INSERT OR IGNORE INTO totals (id, bytes) VALUES (0, 0)''',
+    '''CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries
+         BEGIN UPDATE totals SET bytes = bytes + NEW.size WHERE id = 0; END''',
+    '''CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries
+         BEGIN UPDATE totals SET bytes = bytes - OLD.size WHERE id = 0; END''',
+    '''CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size
+         ON entries BEGIN
+           UPDATE totals SET bytes = bytes + NEW.size - OLD.size WHERE id = 0;
+         END''',
+]
+
+
+class SqliteCache(object):
+  """Stores httplib2 cache entries in a single SQLite database file.
+
+  Implements the get/set/delete interface of httplib2.FileCache. Values
+  are evicted least recently used first once their total size exceeds
+  max_bytes, and expire after ttl seconds if a ttl is given. The file may
+  be shared by several threads and processes; each thread uses its own
+  connection and writers are serialized by SQLite's locking.
+  """
+
+  def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, ttl=None,
+               busy_timeout=DEFAULT_BUSY_TIMEOUT):
+    """Opens (creating if needed) a cache file.
+
+    Args:
+      path: The path of the database file
+      max_bytes: The maximum total size of cached values [optional]
+      ttl: The number of seconds entries live for, or None [optional]
+      busy_timeout: Seconds to wait for a locked database [optional]
+    """
+    self._path = path
+    self._max_bytes = max_bytes
+    self._ttl = ttl
+    self._busy_timeout = busy_timeout
+    self._local = threading.local()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    connection = self._connection()
+    for statement in SCHEMA:
+      connection.execute(statement)
+
+  def get(self, key):
+    """Returns the cached value for key, or None."""
+    connection = self._connection()
+    row = connection.execute(
+        'SELECT value, created, accessed FROM entries WHERE key = ?',
+        (key,)).fetchone()
+    if row is None:
+      self.misses += 1
+      return None
+    value, created, accessed = row
+    now = time.time()
+    if self._ttl is not None and now - created > self._ttl:
+      self.misses += 1
+      connection.execute('DELETE FROM entries WHERE key = ? AND created = ?',
+                         (key, created))
+      return None
+    if now - accessed > ACCESS_GRANULARITY:
+      connection.execute('UPDATE entries SET accessed = ? WHERE key = ?',
+                         (now, key))
+    self.hits += 1
+    return str(value)
+
+  def set(self, key, value):
+    """Stores value for key, evicting old entries to stay within budget."""
+    if len(value) > self._max_bytes:
+      self.delete(key)
+      return
+    connection = self._connection()
+    now = time.time()
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+      cursor = connection.execute(
+          '''UPDATE entries SET value = ?, size = ?, created = ?, accessed = ?
+             WHERE key = ?''',
+          (sqlite3.Binary(value), len(value), now, now, key))
+      if cursor.rowcount == 0:
+        connection.execute(
+            '''INSERT INTO entries (key, value, size, created, accessed)
+               VALUES (?, ?, ?, ?, ?)''',
+            (key, sqlite3.Binary(value), len(value), now, now))
+      self._evict(connection, key, now)
+    except:
+      connection.execute('ROLLBACK')
+      raise
+    connection.execute('COMMIT')
+
+  def delete(self, key):
+    """Removes key if present."""
+    self._connection().execute('DELETE FROM entries WHERE key = ?', (key,))
+
+  def size(self):
+    """Returns the total number of bytes of cached values."""
+    return self._connection().execute(
+        'SELECT bytes FROM totals WHERE id = 0').fetchone()[0]
+
+  def stats(self):
+    """Returns a dict of the cache counters for this process."""
+    return {'bytes': self.size(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions}
+
+  def _evict(self, connection, key, now):
+    """Removes expired, then least recently used, entries over budget.
+
+    Args:
+      connection: The connection holding the write transaction
+      key: The key just written, which is never evicted
+      now: The current time
+    """
+    if self._ttl is not None:
+      cursor = connection.execute('DELETE FROM entries WHERE created < ?',
+                                  (now - self._ttl,))
+      self.evictions += max(cursor.rowcount, 0)
+    excess = self.size() - self._max_bytes
+    if excess <= 0:
+      return
+    victims = list()
+    cursor = connection.execute(
+        'SELECT key, size FROM entries WHERE key != ? ORDER BY accessed',
+        (key,))
+    for victim, size in cursor:
+      victims.append((victim,))
+      excess -= size
+      if excess <= 0:
+        break
+    cursor.close()
+    connection.executemany('DELETE FROM entries WHERE key = ?', victims)
+    self.evictions += len(victims)
+
+  def _connection(self):
+    """Returns the SQLite connection for the current thread."""
+    connection = getattr(self._local, 'connection', None)
+    if connection is None:
+      connection = sqlite3.connect(self._path, timeout=self._busy_timeout,
+                                   isolation_level=None)
+      connection.text_factory = str
+      # Let readers proceed while another process is writing
+      connection.execute('PRAGMA journal_mode=WAL')
+      connection.execute('PRAGMA synchronous=NORMAL')
+      self._local.connection = connection
+    return connection
@@ -0,0 +1,77 @@
+#!/usr/bin/python2.5
+#
+# Compares SqliteCache with httplib2.FileCache.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import imports
+
+import httplib2
+import os
+import random
+import shutil
+import sqlitecache
+import sys
+import tempfile
+import time
+
+# A cache entry roughly the size of a host-meta response
+VALUE = 'status: 200\r\ncontent-type: application/xrd+xml\r\n\r\n' + 'x' * 1500
+
+
+def disk_usage(path):
+  """Returns the bytes allocated on disk below path."""
+  total = 0
+  for directory, names, filenames in os.walk(path):
+    for filename in filenames:
+      total += os.stat(os.path.join(directory, filename)).st_blocks * 512
+  return total
+
+
+def measure(name, cache, path, entries, lookups):
+  keys = ['http://host%d.example.com/.well-known/host-meta' % i
+          for i in range(entries)]
+  start = time.time()
+  for key in keys:
+    cache.set(key, VALUE)
+  set_time = (time.time() - start) / entries
+  sample = [random.choice(keys) for i in range(lookups)]
+  start = time.time()
+  for key in sample:
+    assert cache.get(key) == VALUE
+  hit_time = (time.time() - start) / lookups
+  print '%-12s set %7.1f usec  hit %7.1f usec  disk %8.1f KB' % (
+      name, set_time * 1e6, hit_time * 1e6, disk_usage(path) / 1024.0)
+
+
+def main(argv):
+  entries = 5000
+  if len(argv) > 1:
+    entries = int(argv[1])
+  directory = tempfile.mkdtemp()
+  try:
+    file_cache_path = os.path.join(directory, 'filecache')
+    measure('FileCache', httplib2.FileCache(file_cache_path),
+            file_cache_path, entries, entries)
+    sqlite_path = os.path.join(directory, 'sqlitecache')
+    os.mkdir(sqlite_path)
+    measure('SqliteCache',
+            sqlitecache.SqliteCache(os.path.join(sqlite_path, 'cache.db')),
+            sqlite_path, entries, entries)
+  finally:
+    shutil.rmtree(directory)
+
+if __name__ == "__main__":
+  main(sys.argv)
@@ -0,0 +1,84 @@
+#!/usr/bin/python2.5
+#
+# Tests the SQLite cache backend.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import shutil
+import sqlitecache
+import tempfile
+import time
+import unittest
+
+class SqliteCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self._directory = tempfile.mkdtemp()
+    self._path = os.path.join(self._directory, 'cache.db')
+
+  def tearDown(self):
+    shutil.rmtree(self._directory)
+
+  def testGetSetDelete(self):
+    cache = sqlitecache.SqliteCache(self._path)
+    self.assertEquals(None, cache.get('http://example.com/'))
+    cache.set('http://example.com/', 'status: 200\r\n\r\n\x00body')
+    self.assertEquals('status: 200\r\n\r\n\x00body',
+                      cache.get('http://example.com/'))
+    cache.set('http://example.com/', 'replaced')
+    self.assertEquals('replaced', cache.get('http://example.com/'))
+    self.assertEquals(len('replaced'), cache.size())
+    cache.delete('http://example.com/')
+    self.assertEquals(None, cache.get('http://example.com/'))
+    self.assertEquals(0, cache.size())
+
+  def testEvictsLeastRecentlyUsed(self):
+    cache = sqlitecache.SqliteCache(self._path, max_bytes=25)
+    cache.set('a', 'x' * 10)
+    time.sleep(0.01)
+    cache.set('b', 'x' * 10)
+    time.sleep(0.01)
+    cache.set('c', 'x' * 10)
+    self.assertEquals(None, cache.get('a'))
+    self.assertEquals('x' * 10, cache.get('b'))
+    self.assertEquals('x' * 10, cache.get('c'))
+    self.assertTrue(cache.size() <= 25)
+
+  def testOversizeValuesAreNotStored(self):
+    cache = sqlitecache.SqliteCache(self._path, max_bytes=5)
+    cache.set('a', 'x' * 10)
+    self.assertEquals(None, cache.get('a'))
+
+  def testExpiry(self):
+    cache = sqlitecache.SqliteCache(self._path, ttl=0.01)
+    cache.set('a', 'value')
+    time.sleep(0.02)
+    self.assertEquals(None, cache.get('a'))
+
+  def testSharedFile(self):
+    writer = sqlitecache.SqliteCache(self._path)
+    reader = sqlitecache.SqliteCache(self._path)
+    writer.set('a', 'value')
+    self.assertEquals('value', reader.get('a'))
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(SqliteCacheTest))
+  return suite
+
+if __name__ == '__main__':
+  unittest.main()
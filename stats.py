@@ -0,0 +1,367 @@
+#!/usr/bin/python2.5
+#
+# Process-wide counters and latency histograms.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import bisect
+import cgi
+import re
+import threading
+import time
+
+# The upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+# Characters not allowed in Prometheus metric names
+UNSAFE_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_]')
+
+
+class _Shard(object):
+  """The counters and histograms recorded by one thread.
+
+  Only the owning thread writes to a shard, so recording takes no lock.
+  Readers copy the dicts, which the interpreter lock makes atomic.
+  """
+
+  def __init__(self, thread):
+    self.thread = thread
+    self.counters = dict()
+    self.histograms = dict()
+
+
+class Registry(object):
+  """Collects counters, histograms and the stats of other components.
+
+  Counters and histograms are identified by a name and keyword labels.
+  Each thread records into its own shard, and shards are only combined
+  when a snapshot is taken, so recording on the hot path is cheap and
+  contention-free. When disabled, recording does nothing at all.
+  """
+
+  def __init__(self, enabled=True, buckets=DEFAULT_BUCKETS):
+    """Constructs a new registry.
+
+    Args:
+      enabled: Whether to record anything [optional]
+      buckets: The upper bounds of histogram buckets [optional]
+    """
+    self.enabled = enabled
+    self._buckets = tuple(buckets)
+    self._local = threading.local()
+    self._lock = threading.Lock()
+    self._shards = list()
+    self._retired = _Shard(None)
+    self._fold_at = 64
+    self._components = list()
+
+  def increment(self, name, value=1, **labels):
+    """Adds value to a counter."""
+    if not self.enabled:
+      return
+    counters = self._shard().counters
+    key = (name, tuple(sorted(labels.items())))
+    counters[key] = counters.get(key, 0) + value
+
+  def observe(self, name, value, **labels):
+    """Records one value, usually a latency in seconds, in a histogram."""
+    if not self.enabled:
+      return
+    histograms = self._shard().histograms
+    key = (name, tuple(sorted(labels.items())))
+    histogram = histograms.get(key)
+    if histogram is None:
+      # Bucket counts, then the overflow count, the count and the sum
+      histogram = histograms[key] = [0] * (len(self._buckets) + 2) + [0.0]
+    histogram[bisect.bisect_left(self._buckets, value)] += 1
+    histogram[-2] += 1
+    histogram[-1] += value
+
+  def timer(self, name, **labels):
+    """Returns a function that, when called, observes the time since now."""
+    if not self.enabled:
+      return _ignore
+    start = time.time()
+    def stop():
+      self.observe(name, time.time() - start, **labels)
+    return stop
+
+  def register(self, component, function):
+    """Adds a component whose stats are included in every snapshot.
+
+    Args:
+      component: The name of the component
+      function: A callable returning a dict of numbers, such as the stats
+        method of an LruCache or TieredCache
+    """
+    self._lock.acquire()
+    try:
+      self._components.append((component, function))
+    finally:
+      self._lock.release()
+
+  def snapshot(self):
+    """Returns the current values of everything recorded.
+
+    Returns:
+      A dict with 'counters' and 'histograms' maps from (name, labels) keys
+      to values, and 'components' mapping component names to their stats.
+      Histogram values are dicts of cumulative 'buckets' (a list of
+      (upper bound, count) pairs), 'count' and 'sum'.
+    """
+    self._lock.acquire()
+    try:
+      self._fold_dead_shards()
+      shards = [self._retired] + list(self._shards)
+      components = list(self._components)
+    finally:
+      self._lock.release()
+    counters = dict()
+    histograms = dict()
+    for shard in shards:
+      for key, value in dict(shard.counters).items():
+        counters[key] = counters.get(key, 0) + value
+      for key, histogram in dict(shard.histograms).items():
+        _add_histogram(histograms, key, list(histogram))
+    for key, histogram in histograms.items():
+      buckets = list()
+      total = 0
+      for bound, count in zip(self._buckets + (float('inf'),), histogram):
+        total += count
+        buckets.append((bound, total))
+      histograms[key] = {'buckets': buckets, 'count': histogram[-2],
+                         'sum': histogram[-1]}
+    component_stats = dict()
+    for component, function in components:
+      try:
+        component_stats[component] = dict(function())
+      except Exception, e:
+        component_stats[component] = {'error': str(e)}
+    return {'counters': counters, 'histograms': histograms,
+            'components': component_stats}
+
+  def _shard(self):
+    shard = getattr(self._local, 'shard', None)
+    if shard is None:
+      shard = self._local.shard = _Shard(threading.currentThread())
+      self._lock.acquire()
+      try:
+        self._shards.append(shard)
+        if len(self._shards) >= self._fold_at:
+          self._fold_dead_shards()
+          self._fold_at = max(64, len(self._shards) * 2)
+      finally:
+        self._lock.release()
+    return shard
+
+  def _fold_dead_shards(self):
+    """Merges the shards of finished threads into one, bounding memory.
+
+    Must be called with the lock held.
+    """
+    live = list()
+    for shard in self._shards:
+      if shard.thread.isAlive():
+        live.append(shard)
+        continue
+      for key, value in shard.counters.items():
+        self._retired.counters[key] = (
+            self._retired.counters.get(key, 0) + value)
+      for key, histogram in shard.histograms.items():
+        _add_histogram(self._retired.histograms, key, histogram)
+    self._shards = live
+
+
+def _ignore():
+  pass
+
+
+def _add_histogram(histograms, key, histogram):
+  total = histograms.get(key)
+  if total is None:
+    histograms[key] = list(histogram)
+  else:
+    for i in range(len(histogram)):
+      total[i] += histogram[i]
+
+
+def series_name(name, labels):
+  """Formats a name and its labels the way Prometheus does.
+
+  Args:
+    name: The metric name
+    labels: A tuple of (label, value) pairs
+  """
+  if not labels:
+    return name
+  pairs = ['%s="%s"' % (label, _escape(value)) for label, value in labels]
+  return '%s{%s}' % (name, ','.join(pairs))
+
+
+def to_json_object(snapshot):
+  """Converts a snapshot to an object ready for JSON encoding."""
+  histograms = dict()
+  for (name, labels), histogram in snapshot['histograms'].items():
+    histograms[series_name(name, labels)] = {
+        'count': histogram['count'],
+        'sum': histogram['sum'],
+        'buckets': [[_format_bound(bound), count]
+                    for bound, count in histogram['buckets']]}
+  counters = dict()
+  for (name, labels), value in snapshot['counters'].items():
+    counters[series_name(name, labels)] = value
+  return {'counters': counters, 'histograms': histograms,
+          'components': snapshot['components']}
+
+
+def to_prometheus(snapshot, prefix='webfinger_'):
+  """Converts a snapshot to the Prometheus text exposition format.
+
+  Counters become counters, histograms become histograms and the numeric
+  component stats become gauges named after the component and stat.
+
+  Args:
+    snapshot: A dict as returned by Registry.snapshot
+    prefix: Prepended to every metric name [optional]
+  Returns:
+    The text, one sample per line.
+  """
+  lines = list()
+  typed = set()
+  def declare(name, type):
+    if name not in typed:
+      typed.add(name)
+      lines.append('# TYPE %s %s' % (name, type))
+  for (name, labels), value in sorted(snapshot['counters'].items()):
+    name = _metric_name(prefix + name)
+    declare(name, 'counter')
+    lines.append('%s %s' % (series_name(name, labels), _format_number(value)))
+  for (name, labels), histogram in sorted(snapshot['histograms'].items()):
+    name = _metric_name(prefix + name)
+    declare(name, 'histogram')
+    for bound, count in histogram['buckets']:
+      bucket_labels = labels + (('le', _format_bound(bound)),)
+      lines.append('%s %d' % (series_name(name + '_bucket', bucket_labels),
+                              count))
+    lines.append('%s %s' % (series_name(name + '_sum', labels),
+                            _format_number(histogram['sum'])))
+    lines.append('%s %d' % (series_name(name + '_count', labels),
+                            histogram['count']))
+  for component, values in sorted(snapshot['components'].items()):
+    for stat, value in sorted(values.items()):
+      if isinstance(value, bool) or not isinstance(value, (int, long, float)):
+        continue
+      name = _metric_name('%s%s_%s' % (prefix, component, stat))
+      declare(name, 'gauge')
+      lines.append('%s %s' % (name, _format_number(value)))
+  return '\n'.join(lines) + '\n'
+
+
+def _metric_name(name):
+  return UNSAFE_NAME_CHARS.sub('_', name)
+
+
+def _escape(value):
+  value = unicode(value)
+  return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound):
+  if bound == float('inf'):
+    return '+Inf'
+  return repr(bound)
+
+
+def _format_number(value):
+  if isinstance(value, float):
+    return repr(value)
+  return str(value)
+
+
+class WsgiMiddleware(object):
+  """Counts and times the requests to a WSGI application.
+
+  Requests are labelled by route, format and status class. Paths and
+  formats not listed are labelled 'other', so that arbitrary URLs can not
+  create unbounded numbers of series.
+  """
+
+  def __init__(self, application, routes, formats=(), registry=None):
+    """Wraps an application.
+
+    Args:
+      application: A WSGI application
+      routes: The paths to label individually
+      formats: The values of the format parameter to label
+        individually [optional]
+      registry: A Registry, defaulting to REGISTRY [optional]
+    """
+    self._application = application
+    self._routes = frozenset(routes)
+    self._formats = frozenset(formats)
+    self._registry = registry
+
+  def __call__(self, environ, start_response):
+    registry = self._registry or REGISTRY
+    if not registry.enabled:
+      return self._application(environ, start_response)
+    start = time.time()
+    route = environ.get('PATH_INFO') or '/'
+    if route not in self._routes:
+      route = 'other'
+    format = cgi.parse_qs(environ.get('QUERY_STRING', '')).get(
+        'format', [''])[0]
+    if format and format not in self._formats:
+      format = 'other'
+    statuses = list()
+    def record_status(status, headers, exc_info=None):
+      statuses.append(status)
+      if exc_info is None:
+        return start_response(status, headers)
+      return start_response(status, headers, exc_info)
+    try:
+      return self._application(environ, record_status)
+    finally:
+      status = 'error'
+      if statuses:
+        status = status_class(int(statuses[-1].split()[0]))
+      registry.increment('requests', route=route, format=format or 'default',
+                         status=status)
+      registry.observe('request_seconds', time.time() - start, route=route)
+
+
+def status_class(status):
+  """Returns '2xx', '3xx' and so on for an HTTP status code."""
+  return '%dxx' % (status // 100)
+
+
+# The process-wide registry, disabled until an application enables it
+REGISTRY = Registry(enabled=False)
+
+
+def increment(name, value=1, **labels):
+  """Adds value to a counter in the process-wide registry."""
+  REGISTRY.increment(name, value, **labels)
+
+
+def observe(name, value, **labels):
+  """Records a value in a histogram in the process-wide registry."""
+  REGISTRY.observe(name, value, **labels)
+
+
+def timer(name, **labels):
+  """Starts timing an observation in the process-wide registry."""
+  return REGISTRY.timer(name, **labels)
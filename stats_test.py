@@ -0,0 +1,158 @@
+#!/usr/bin/python2.5
+#
+# Tests the counters and histograms.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import stats
+import threading
+import unittest
+
+
+class RegistryTest(unittest.TestCase):
+
+  def testCounters(self):
+    registry = stats.Registry()
+    registry.increment('fetches', status='2xx')
+    registry.increment('fetches', 2, status='2xx')
+    registry.increment('fetches', status='5xx')
+    counters = registry.snapshot()['counters']
+    self.assertEquals(3, counters[('fetches', (('status', '2xx'),))])
+    self.assertEquals(1, counters[('fetches', (('status', '5xx'),))])
+
+  def testHistograms(self):
+    registry = stats.Registry(buckets=[0.1, 1.0])
+    registry.observe('seconds', 0.05)
+    registry.observe('seconds', 0.5)
+    registry.observe('seconds', 5.0)
+    histogram = registry.snapshot()['histograms'][('seconds', ())]
+    self.assertEquals(3, histogram['count'])
+    self.assertAlmostEquals(5.55, histogram['sum'])
+    self.assertEquals([(0.1, 1), (1.0, 2), (float('inf'), 3)],
+                      histogram['buckets'])
+
+  def testDisabled(self):
+    registry = stats.Registry(enabled=False)
+    registry.increment('fetches')
+    registry.observe('seconds', 1.0)
+    registry.timer('seconds')()
+    snapshot = registry.snapshot()
+    self.assertEquals({}, snapshot['counters'])
+    self.assertEquals({}, snapshot['histograms'])
+
+  def testThreadsAreMerged(self):
+    registry = stats.Registry()
+    def work():
+      for i in range(100):
+        registry.increment('work')
+    threads = [threading.Thread(target=work) for i in range(10)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    registry.increment('work')
+    self.assertEquals(1001, registry.snapshot()['counters'][('work', ())])
+    # The finished threads' shards were folded together
+    self.assertEquals(1, len(registry._shards))
+    self.assertEquals(1001, registry.snapshot()['counters'][('work', ())])
+
+  def testComponents(self):
+    registry = stats.Registry()
+    registry.register('cache', lambda: {'hits': 3})
+    def broken():
+      raise ValueError('broken')
+    registry.register('broken', broken)
+    components = registry.snapshot()['components']
+    self.assertEquals({'hits': 3}, components['cache'])
+    self.assertEquals({'error': 'broken'}, components['broken'])
+
+
+class FormatTest(unittest.TestCase):
+
+  def setUp(self):
+    registry = stats.Registry(buckets=[1.0])
+    registry.increment('fetches', status='2xx')
+    registry.observe('parse_seconds', 0.5, parser='xrd')
+    registry.register('xrd cache', lambda: {'hits': 2, 'name': 'x'})
+    self.snapshot = registry.snapshot()
+
+  def testPrometheus(self):
+    self.assertEquals(
+        '# TYPE webfinger_fetches counter\n'
+        'webfinger_fetches{status="2xx"} 1\n'
+        '# TYPE webfinger_parse_seconds histogram\n'
+        'webfinger_parse_seconds_bucket{parser="xrd",le="1.0"} 1\n'
+        'webfinger_parse_seconds_bucket{parser="xrd",le="+Inf"} 1\n'
+        'webfinger_parse_seconds_sum{parser="xrd"} 0.5\n'
+        'webfinger_parse_seconds_count{parser="xrd"} 1\n'
+        '# TYPE webfinger_xrd_cache_hits gauge\n'
+        'webfinger_xrd_cache_hits 2\n',
+        stats.to_prometheus(self.snapshot))
+
+  def testJson(self):
+    result = stats.to_json_object(self.snapshot)
+    self.assertEquals({'fetches{status="2xx"}': 1}, result['counters'])
+    self.assertEquals(
+        {'count': 1, 'sum': 0.5, 'buckets': [['1.0', 1], ['+Inf', 1]]},
+        result['histograms']['parse_seconds{parser="xrd"}'])
+    self.assertEquals({'hits': 2, 'name': 'x'},
+                      result['components']['xrd cache'])
+
+  def testEscaping(self):
+    self.assertEquals('a{b="\\"c\\"\\\\"}',
+                      stats.series_name('a', (('b', '"c"\\'),)))
+
+
+class WsgiMiddlewareTest(unittest.TestCase):
+
+  def testRecordsRoutesFormatsAndStatuses(self):
+    registry = stats.Registry()
+    def application(environ, start_response):
+      if environ['PATH_INFO'] == '/missing':
+        start_response('404 Not Found', [])
+      else:
+        start_response('200 OK', [])
+      return ['body']
+    middleware = stats.WsgiMiddleware(application, ['/lookup'], ['json'],
+                                      registry=registry)
+    def start_response(status, headers, exc_info=None):
+      pass
+    for path, query in [('/lookup', 'format=json'), ('/lookup', ''),
+                        ('/lookup', 'format=evil'), ('/missing', '')]:
+      self.assertEquals(['body'], middleware(
+          {'PATH_INFO': path, 'QUERY_STRING': query}, start_response))
+    snapshot = registry.snapshot()
+    def count(route, format, status):
+      key = ('requests', (('format', format), ('route', route),
+                          ('status', status)))
+      return snapshot['counters'].get(key)
+    self.assertEquals(1, count('/lookup', 'json', '2xx'))
+    self.assertEquals(1, count('/lookup', 'default', '2xx'))
+    self.assertEquals(1, count('/lookup', 'other', '2xx'))
+    self.assertEquals(1, count('other', 'default', '4xx'))
+    self.assertEquals(
+        3, snapshot['histograms'][('request_seconds',
+                                   (('route', '/lookup'),))]['count'])
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(RegistryTest))
+  suite.addTests(unittest.makeSuite(FormatTest))
+  suite.addTests(unittest.makeSuite(WsgiMiddlewareTest))
+  return suite
+
+if __name__ == '__main__':
+  unittest.main()
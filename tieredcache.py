@@ -0,0 +1,122 @@
+#!/usr/bin/python2.5
+#
+# An in-process LRU cache tier in front of a shared httplib2 cache.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import lru
+import threading
+import time
+
+# The default number of entries held in process
+DEFAULT_MAX_ENTRIES = 1000
+
+# The default number of seconds an entry is served from process memory
+# before the backend is asked again
+DEFAULT_TTL = 30
+
+# The default largest value, in bytes, admitted to the local tier
+DEFAULT_MAX_ADMIT_SIZE = 64 * 1024
+
+
+class TieredCache(object):
+  """Serves httplib2 cache entries from process memory when it can.
+
+  Implements the get/set/delete interface of httplib2.FileCache on top of
+  any backend with the same interface, such as a memcache Client. Reads
+  check a bounded, short-lived local LRU first; writes and deletes go
+  through to the backend. Entries written by other instances become
+  visible here once the local copy expires.
+  """
+
+  def __init__(self, backend, max_entries=DEFAULT_MAX_ENTRIES,
+               ttl=DEFAULT_TTL, max_admit_size=DEFAULT_MAX_ADMIT_SIZE):
+    """Constructs a new tiered cache.
+
+    Args:
+      backend: An object with get, set and delete methods
+      max_entries: The number of entries held in process [optional]
+      ttl: Seconds a local entry is served for [optional]
+      max_admit_size: The largest value kept locally, or None [optional]
+    """
+    self._backend = backend
+    self._local = lru.LruCache(max_entries)
+    self._ttl = ttl
+    self._max_admit_size = max_admit_size
+    self._lock = threading.Lock()
+    self.local_hits = 0
+    self.backend_hits = 0
+    self.misses = 0
+
+  def get(self, key):
+    """Returns the cached value for key, or None."""
+    entry = self._local.get(key)
+    if entry is not None:
+      value, expires = entry
+      if time.time() < expires:
+        self._increment('local_hits')
+        return value
+      self._local.delete(key)
+    value = self._backend.get(key)
+    if value is None:
+      self._increment('misses')
+      return None
+    self._increment('backend_hits')
+    self._admit(key, value)
+    return value
+
+  def set(self, key, value):
+    """Stores value for key in both tiers."""
+    self._backend.set(key, value)
+    self._admit(key, value)
+
+  def delete(self, key):
+    """Removes key from both tiers."""
+    self._local.delete(key)
+    self._backend.delete(key)
+
+  def stats(self):
+    """Returns a dict of per-tier hit counts and ratios."""
+    local_hits = self.local_hits
+    backend_hits = self.backend_hits
+    misses = self.misses
+    lookups = local_hits + backend_hits + misses
+    backend_lookups = backend_hits + misses
+    stats = {'local_hits': local_hits,
+             'backend_hits': backend_hits,
+             'misses': misses,
+             'local_entries': len(self._local),
+             'local_hit_ratio': 0.0,
+             'backend_hit_ratio': 0.0,
+             'backend_round_trips_saved': local_hits}
+    if lookups:
+      stats['local_hit_ratio'] = float(local_hits) / lookups
+    if backend_lookups:
+      stats['backend_hit_ratio'] = float(backend_hits) / backend_lookups
+    return stats
+
+  def _admit(self, key, value):
+    """Keeps value locally unless it is too large."""
+    if self._max_admit_size is not None and len(value) > self._max_admit_size:
+      self._local.delete(key)
+      return
+    self._local.set(key, (value, time.time() + self._ttl))
+
+  def _increment(self, counter):
+    self._lock.acquire()
+    try:
+      setattr(self, counter, getattr(self, counter) + 1)
+    finally:
+      self._lock.release()
@@ -0,0 +1,87 @@
+#!/usr/bin/python2.5
+#
+# Tests the tiered cache.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import tieredcache
+import time
+import unittest
+
+class DictCache(dict):
+  """A backend with the httplib2 cache interface."""
+
+  def __init__(self):
+    self.gets = 0
+
+  def get(self, key):
+    self.gets += 1
+    return dict.get(self, key)
+
+  def set(self, key, value):
+    self[key] = value
+
+  def delete(self, key):
+    self.pop(key, None)
+
+
+class TieredCacheTest(unittest.TestCase):
+
+  def testLocalTierSavesBackendReads(self):
+    backend = DictCache()
+    backend.set('a', 'value')
+    cache = tieredcache.TieredCache(backend)
+    self.assertEquals('value', cache.get('a'))
+    self.assertEquals('value', cache.get('a'))
+    self.assertEquals(1, backend.gets)
+    stats = cache.stats()
+    self.assertEquals(1, stats['local_hits'])
+    self.assertEquals(1, stats['backend_hits'])
+    self.assertEquals(0.5, stats['local_hit_ratio'])
+
+  def testWriteThrough(self):
+    backend = DictCache()
+    cache = tieredcache.TieredCache(backend)
+    cache.set('a', 'value')
+    self.assertEquals('value', backend.get('a'))
+    self.assertEquals('value', cache.get('a'))
+    cache.delete('a')
+    self.assertEquals(None, backend.get('a'))
+    self.assertEquals(None, cache.get('a'))
+
+  def testLocalEntriesExpire(self):
+    backend = DictCache()
+    cache = tieredcache.TieredCache(backend, ttl=0.01)
+    cache.set('a', 'value')
+    backend.set('a', 'changed')
+    time.sleep(0.02)
+    self.assertEquals('changed', cache.get('a'))
+
+  def testLargeValuesAreNotAdmitted(self):
+    backend = DictCache()
+    cache = tieredcache.TieredCache(backend, max_admit_size=4)
+    cache.set('a', 'value')
+    cache.get('a')
+    self.assertEquals(0, cache.local_hits)
+    self.assertEquals(1, cache.backend_hits)
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(TieredCacheTest))
+  return suite
+
+if __name__ == '__main__':
+  unittest.main()
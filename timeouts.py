@@ -0,0 +1,150 @@
+#!/usr/bin/python2.5
+#
+# Chooses request timeouts for each host from its observed latency.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import lru
+import threading
+
+# The timeout, in seconds, for hosts without enough history
+DEFAULT_TIMEOUT = 10.0
+
+# The range every timeout is clamped to, in seconds
+DEFAULT_MIN_TIMEOUT = 1.0
+DEFAULT_MAX_TIMEOUT = 30.0
+
+# The weight of each new latency in the moving average, and of each new
+# deviation in the moving deviation
+ALPHA = 0.125
+BETA = 0.25
+
+# The number of mean deviations above the mean a timeout allows
+DEFAULT_DEVIATIONS = 4
+
+# The number of latencies required before the estimate is trusted
+MIN_SAMPLES = 3
+
+# The default number of hosts remembered
+DEFAULT_MAX_HOSTS = 10000
+
+
+class _Estimate(object):
+  """The smoothed latency and deviation of one host."""
+
+  __slots__ = ('mean', 'deviation', 'samples', 'backoff')
+
+  def __init__(self):
+    self.mean = 0.0
+    self.deviation = 0.0
+    self.samples = 0
+    self.backoff = 1
+
+
+class AdaptiveTimeouts(object):
+  """Estimates a timeout for each host as TCP estimates its retransmit timer.
+
+  Each host keeps an exponentially weighted moving average of its latency
+  and of the latency's deviation from that average. Its timeout is the
+  average plus some deviations, which sits high in the host's latency
+  distribution, clamped to a fixed range. A timed out request doubles the
+  host's timeout until a request succeeds, so a slow but healthy host is
+  not cut off repeatedly, while a fast host that hangs is given up on
+  quickly.
+
+  A single instance may be shared by many Client instances so that the
+  history outlives any one lookup.
+  """
+
+  def __init__(self, initial=DEFAULT_TIMEOUT, min_timeout=DEFAULT_MIN_TIMEOUT,
+               max_timeout=DEFAULT_MAX_TIMEOUT, deviations=DEFAULT_DEVIATIONS,
+               max_hosts=DEFAULT_MAX_HOSTS):
+    """Constructs a new estimator.
+
+    Args:
+      initial: The timeout for hosts without enough history [optional]
+      min_timeout: The shortest timeout given [optional]
+      max_timeout: The longest timeout given [optional]
+      deviations: The number of mean deviations above the average latency
+        a timeout allows [optional]
+      max_hosts: The number of hosts remembered [optional]
+    """
+    self._initial = initial
+    self._min_timeout = min_timeout
+    self._max_timeout = max_timeout
+    self._deviations = deviations
+    self._hosts = lru.LruCache(max_hosts)
+    self._lock = threading.Lock()
+    self.successes = 0
+    self.timeouts = 0
+
+  def timeout(self, host):
+    """Returns the number of seconds to allow a request to host."""
+    self._lock.acquire()
+    try:
+      estimate = self._hosts.get(host)
+      if estimate is None or estimate.samples < MIN_SAMPLES:
+        timeout = self._initial
+        if estimate is not None:
+          timeout *= estimate.backoff
+      else:
+        timeout = (estimate.mean + self._deviations * estimate.deviation) * (
+            estimate.backoff)
+    finally:
+      self._lock.release()
+    return min(max(timeout, self._min_timeout), self._max_timeout)
+
+  def record(self, host, seconds):
+    """Adds the latency of a completed request to host's history."""
+    self._lock.acquire()
+    try:
+      self.successes += 1
+      estimate = self._estimate(host)
+      if estimate.samples == 0:
+        estimate.mean = seconds
+        estimate.deviation = seconds / 2
+      else:
+        estimate.deviation += BETA * (
+            abs(seconds - estimate.mean) - estimate.deviation)
+        estimate.mean += ALPHA * (seconds - estimate.mean)
+      estimate.samples += 1
+      estimate.backoff = 1
+    finally:
+      self._lock.release()
+
+  def record_timeout(self, host):
+    """Notes that a request to host timed out, doubling its timeout."""
+    self._lock.acquire()
+    try:
+      self.timeouts += 1
+      estimate = self._estimate(host)
+      if estimate.backoff * self._min_timeout < self._max_timeout:
+        estimate.backoff *= 2
+    finally:
+      self._lock.release()
+
+  def stats(self):
+    """Returns a dict of counters."""
+    return {'hosts': len(self._hosts),
+            'successes': self.successes,
+            'timeouts': self.timeouts}
+
+  def _estimate(self, host):
+    """Returns host's estimate, creating it; call with the lock held."""
+    estimate = self._hosts.get(host)
+    if estimate is None:
+      estimate = _Estimate()
+      self._hosts.set(host, estimate)
+    return estimate
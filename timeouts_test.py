@@ -0,0 +1,77 @@
+#!/usr/bin/python2.5
+#
+# Tests the adaptive timeouts.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import timeouts
+import unittest
+
+
+class AdaptiveTimeoutsTest(unittest.TestCase):
+
+  def testInitialTimeoutUntilEnoughSamples(self):
+    estimator = timeouts.AdaptiveTimeouts(initial=10.0)
+    self.assertEquals(10.0, estimator.timeout('example.com'))
+    estimator.record('example.com', 2.0)
+    estimator.record('example.com', 2.0)
+    self.assertEquals(10.0, estimator.timeout('example.com'))
+    estimator.record('example.com', 2.0)
+    self.assertNotEquals(10.0, estimator.timeout('example.com'))
+
+  def testSlowHostsGetLongerTimeouts(self):
+    estimator = timeouts.AdaptiveTimeouts(min_timeout=0.1, max_timeout=60.0)
+    for i in range(20):
+      estimator.record('fast.example.com', 0.1)
+      estimator.record('slow.example.com', 4.0 + (i % 2))
+    fast = estimator.timeout('fast.example.com')
+    slow = estimator.timeout('slow.example.com')
+    self.assertTrue(fast < 0.5, fast)
+    self.assertTrue(5.0 < slow < 10.0, slow)
+
+  def testClamped(self):
+    estimator = timeouts.AdaptiveTimeouts(min_timeout=1.0, max_timeout=5.0)
+    for i in range(5):
+      estimator.record('fast.example.com', 0.01)
+      estimator.record('slow.example.com', 20.0)
+    self.assertEquals(1.0, estimator.timeout('fast.example.com'))
+    self.assertEquals(5.0, estimator.timeout('slow.example.com'))
+
+  def testTimeoutsBackOffUntilSuccess(self):
+    estimator = timeouts.AdaptiveTimeouts(initial=2.0, max_timeout=10.0)
+    estimator.record_timeout('example.com')
+    self.assertEquals(4.0, estimator.timeout('example.com'))
+    for i in range(5):
+      estimator.record_timeout('example.com')
+    self.assertEquals(10.0, estimator.timeout('example.com'))
+    estimator.record('example.com', 1.0)
+    self.assertEquals(2.0, estimator.timeout('example.com'))
+    self.assertEquals({'hosts': 1, 'successes': 1, 'timeouts': 6},
+                      estimator.stats())
+
+  def testHostsAreBounded(self):
+    estimator = timeouts.AdaptiveTimeouts(max_hosts=2)
+    for host in ['a', 'b', 'c']:
+      estimator.record(host, 1.0)
+    self.assertEquals(2, estimator.stats()['hosts'])
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(AdaptiveTimeoutsTest))
+  return suite
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/python2.5
+#
+# Compiles and expands URI templates.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Implements levels 1 and 2 of:
+#
+#   http://tools.ietf.org/html/rfc6570
+#
+# plus comma separated variable lists and the '{%var}' form used by early
+# WebFinger drafts, which is treated like a simple '{var}' expression.
+
+import lru
+import re
+import urllib
+
+# The characters left unencoded by simple expansion
+UNRESERVED = '-._~'
+
+# The characters additionally left unencoded by reserved expansion
+RESERVED = ":/?#[]@!$&'()*+,;="
+
+# The maximum number of compiled templates kept in memory
+MAX_COMPILED_TEMPLATES = 1000
+
+EXPRESSION_RE = re.compile(r'\{([^{}]*)\}')
+
+VARNAME_RE = re.compile(r'^(?:[A-Za-z0-9_]|%[0-9A-Fa-f]{2})'
+                        r'(?:\.?(?:[A-Za-z0-9_]|%[0-9A-Fa-f]{2}))*$')
+
+
+def _quote_unreserved(value):
+  return urllib.quote(value, UNRESERVED)
+
+
+def _quote_reserved(value):
+  return urllib.quote(value, UNRESERVED + RESERVED)
+
+
+# Maps an expression operator to (prefix, quoting function)
+OPERATORS = {
+    '': ('', _quote_unreserved),
+    '%': ('', _quote_unreserved),
+    '+': ('', _quote_reserved),
+    '#': ('#', _quote_reserved),
+}
+
+
+class Template(object):
+  """A URI template parsed into literal and expression segments."""
+
+  def __init__(self, template):
+    """Parses a URI template.
+
+    Expressions with unknown operators or invalid variable names are kept
+    as literal text, as are unbalanced braces.
+
+    Args:
+      template: A URI template string
+    """
+    self.template = template
+    segments = list()
+    position = 0
+    for match in EXPRESSION_RE.finditer(template):
+      expression = self._parse_expression(match.group(1))
+      if expression is None:
+        continue
+      if match.start() > position:
+        segments.append(template[position:match.start()])
+      segments.append(expression)
+      position = match.end()
+    if position < len(template):
+      segments.append(template[position:])
+    self._segments = tuple(segments)
+
+  def _parse_expression(self, expression):
+    """Returns (prefix, quote, names) for an expression, or None."""
+    if expression[:1] in OPERATORS and expression[:1]:
+      operator, expression = expression[:1], expression[1:]
+    else:
+      operator = ''
+    names = tuple(expression.split(','))
+    for name in names:
+      if not VARNAME_RE.match(name):
+        return None
+    prefix, quote = OPERATORS[operator]
+    return (prefix, quote, names)
+
+  def expand(self, variables):
+    """Substitutes variables into the template.
+
+    Args:
+      variables: A dict mapping variable names to string values.  Undefined
+        variables expand to nothing.
+    Returns:
+      The expanded URI string.
+    """
+    parts = list()
+    for segment in self._segments:
+      if segment.__class__ is tuple:
+        prefix, quote, names = segment
+        values = list()
+        for name in names:
+          value = variables.get(name)
+          if value is None:
+            continue
+          if isinstance(value, unicode):
+            value = value.encode('utf-8')
+          values.append(quote(value))
+        if values:
+          parts.append(prefix)
+          parts.append(','.join(values))
+      else:
+        parts.append(segment)
+    return ''.join(parts)
+
+
+_COMPILED = lru.LruCache(MAX_COMPILED_TEMPLATES)
+
+
+def compile(template):
+  """Returns a (shared, cached) Template for a URI template string.
+
+  Args:
+    template: A URI template string
+  Returns:
+    A Template instance.
+  """
+  compiled = _COMPILED.get(template)
+  if compiled is None:
+    compiled = Template(template)
+    _COMPILED.set(template, compiled)
+  return compiled
+
+
+def expand(template, variables):
+  """Expands a URI template string using the compiled template cache.
+
+  Args:
+    template: A URI template string
+    variables: A dict mapping variable names to string values
+  Returns:
+    The expanded URI string.
+  """
+  return compile(template).expand(variables)
@@ -0,0 +1,60 @@
+#!/usr/bin/python2.5
+#
+# Compares compiled URI template expansion with string replacement.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import sys
+import timeit
+import uritemplate
+import urllib
+
+TEMPLATES = [
+    'http://www.google.com/s2/webfinger/?q={%id}',
+    'http://example.com/describe?uri={uri}',
+    'http://example.com/user/{id}/profile',
+]
+
+ID = 'acct:bob@example.com'
+
+
+def replace_loop(template, id):
+  """The expansion used before templates were compiled."""
+  for variable in ['{uri}', '{%uri}', '{id}', '{%id}']:
+    template = template.replace(variable, urllib.quote(id))
+  return template
+
+
+def compiled(template, id):
+  return uritemplate.compile(template).expand({'uri': id, 'id': id})
+
+
+def run(function, number):
+  timer = timeit.Timer(lambda: [function(t, ID) for t in TEMPLATES])
+  return min(timer.repeat(3, number)) / (number * len(TEMPLATES))
+
+
+def main(argv):
+  number = 10000
+  if len(argv) > 1:
+    number = int(argv[1])
+  for template in TEMPLATES:
+    assert replace_loop(template, ID) == compiled(template, ID)
+  for name, function in [('replace loop', replace_loop),
+                         ('compiled', compiled)]:
+    print '%-14s %.2f usec per expansion' % (name, run(function, number) * 1e6)
+
+if __name__ == "__main__":
+  main(sys.argv)
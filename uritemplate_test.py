@@ -0,0 +1,78 @@
+#!/usr/bin/python2.5
+#
+# Tests the URI template compiler.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import unittest
+import uritemplate
+
+VARIABLES = {'id': 'acct:bob@example.com',
+             'path': '/foo/bar',
+             'x': '1024',
+             'y': '768',
+             'empty': ''}
+
+class TemplateTest(unittest.TestCase):
+
+  def assertExpands(self, expected, template):
+    self.assertEquals(expected, uritemplate.expand(template, VARIABLES))
+
+  def testLiteral(self):
+    self.assertExpands('http://example.com/', 'http://example.com/')
+
+  def testSimple(self):
+    self.assertExpands('http://example.com/?q=acct%3Abob%40example.com',
+                       'http://example.com/?q={id}')
+    self.assertExpands('%2Ffoo%2Fbar', '{path}')
+
+  def testLegacyPercent(self):
+    self.assertExpands('http://example.com/acct%3Abob%40example.com',
+                       'http://example.com/{%id}')
+
+  def testReserved(self):
+    self.assertExpands('http://example.com/foo/bar', 'http://example.com{+path}')
+
+  def testFragment(self):
+    self.assertExpands('#/foo/bar', '{#path}')
+    self.assertExpands('', '{#undefined}')
+
+  def testLists(self):
+    self.assertExpands('map?1024,768', 'map?{x,y}')
+    self.assertExpands('map?1024', 'map?{x,undefined}')
+
+  def testEmptyAndUndefined(self):
+    self.assertExpands('a', 'a{empty}')
+    self.assertExpands('a', 'a{undefined}')
+
+  def testInvalidExpressionsAreLiteral(self):
+    self.assertExpands('http://fake.com/tpl/{$id}', 'http://fake.com/tpl/{$id}')
+    self.assertExpands('{a b}{', '{a b}{')
+
+  def testUnicode(self):
+    self.assertEquals('caf%C3%A9',
+                      uritemplate.expand('{v}', {'v': u'caf\xe9'}))
+
+  def testCompileIsCached(self):
+    self.assertTrue(uritemplate.compile('{id}') is uritemplate.compile('{id}'))
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(TemplateTest))
+  return suite
+
+if __name__ == '__main__':
+  unittest.main()
@@ -18,13 +18,37 @@
 
 import imports
 
+import Queue
+import StringIO
+import boundedhttp
+import compactxrd
+import delimited
+import dnscache
 import email.utils
+import functools
 import httplib2
 import logging
+import lru
+import optparse
+import os
 import re
+import scheduler
+import singleflight
+import socket
+import stats
 import sys
-import urllib
+import threading
+import time
+import timeouts
+import uritemplate
+import urlparse
 import xrd
+import xrdcache
+
+try:
+  import simplejson as json
+except ImportError:
+  import json
 
 # A simplified version of RFC2822 addr-spec parsing
 ATEXT = r'[\w\!\#\$\%\&\'\*\+\-\/\=\?\^\_\`\{\|\}\~]'
@@ -36,6 +60,15 @@ DOMAIN = DOT_ATOM
 ADDR_SPEC = ''.join(['(', LOCAL_PART, ')', '@', '(', DOMAIN,  ')'])
 ADDR_SPEC_RE = re.compile(ADDR_SPEC)
 
+# The common 'user@host' shape, matched without calling parseaddr
+SIMPLE_ADDR_SPEC_RE = re.compile(''.join(['^', ADDR_SPEC, '$']))
+
+# The maximum number of parsed identifiers remembered
+MAX_PARSED_IDS = 10000
+
+# The default number of concurrent lookups made by Client.lookup_many
+DEFAULT_MAX_WORKERS = 10
+
 # The URL template for domain-level XRD documents
 DOMAIN_LEVEL_XRD_TEMPLATE = 'http://%s/.well-known/host-meta'
 
@@ -58,31 +91,309 @@ class WebfingerError(Exception):
   """Raised if services found are not valid WebFinger documents."""
   pass
 
+_PARSED_IDS = lru.LruCache(MAX_PARSED_IDS)
+
+
+def parse_id(id):
+  """Treats an identifier as a RFC2822 addr-spec and splits it.
+
+  Plain 'user@host' ids are matched directly; anything else (display
+  names, angle brackets, comments) goes through email.utils.parseaddr.
+  The domain is lowercased and internationalized domains are converted
+  to IDNA so that equivalent ids share cache keys. Results, including
+  failures, are remembered in a bounded LRU cache.
+
+  Args:
+    id: An account identifier (which may or may not start with 'acct:')
+  Returns:
+    The tuple (local_part, domain) if it can be parsed
+  Raises:
+    ParseError if the id can not be parsed
+  """
+  parsed = _PARSED_IDS.get(id)
+  if parsed is None:
+    try:
+      parsed = _parse_id(id)
+    except ParseError, e:
+      parsed = e
+    _PARSED_IDS.set(id, parsed)
+  if isinstance(parsed, ParseError):
+    raise parsed
+  return parsed
+
+
+def parse_ids(ids):
+  """Lazily parses many identifiers.
+
+  Args:
+    ids: An iterable of account identifiers
+  Returns:
+    A generator yielding a (local_part, domain) tuple for each id, or the
+    ParseError instance for ids that can not be parsed.
+  """
+  for id in ids:
+    try:
+      yield parse_id(id)
+    except ParseError, e:
+      yield e
+
+
+def _parse_id(id):
+  """Splits an identifier without consulting the cache."""
+  # Strip any account prefix
+  if id.startswith('acct://'):
+    addr_spec = id[7:]
+  elif id.startswith('acct:'):
+    addr_spec = id[5:]
+  else:
+    addr_spec = id
+  addr_spec = _to_idna(addr_spec)
+  match = SIMPLE_ADDR_SPEC_RE.match(addr_spec)
+  if not match:
+    realname, addr_spec = email.utils.parseaddr(addr_spec)
+    if not addr_spec:
+      raise ParseError('Could not parse %s for addr-spec' % id)
+    match = ADDR_SPEC_RE.match(addr_spec)
+    if not match:
+      raise ParseError('Could not parse %s for local_part, domain' % id)
+  return match.group(1), match.group(2).lower()
+
+
+def _to_idna(addr_spec):
+  """Converts a non-ASCII domain in a unicode addr-spec to IDNA."""
+  if not isinstance(addr_spec, unicode) or '@' not in addr_spec:
+    return addr_spec
+  local_part, domain = addr_spec.rsplit('@', 1)
+  try:
+    domain.encode('ascii')
+    return addr_spec
+  except UnicodeError:
+    pass
+  try:
+    return u'%s@%s' % (local_part, domain.encode('idna'))
+  except UnicodeError:
+    raise ParseError('Could not convert %s to IDNA' % domain)
+
+
+def map_concurrently(function, items, max_workers):
+  """Calls function on each item using a pool of worker threads.
+
+  Args:
+    function: A callable taking one item
+    items: An iterable of items, consumed lazily by the workers
+    max_workers: The number of worker threads
+  Returns:
+    A generator yielding (item, result, error) tuples in completion order.
+  """
+  items = iter(items)
+  items_lock = threading.Lock()
+  results = Queue.Queue()
+  stopped = threading.Event()
+  def work():
+    try:
+      while not stopped.isSet():
+        items_lock.acquire()
+        try:
+          try:
+            item = items.next()
+          except StopIteration:
+            return
+        finally:
+          items_lock.release()
+        try:
+          results.put((item, function(item), None))
+        except Exception, e:
+          results.put((item, None, e))
+    finally:
+      results.put(None)
+  workers = max(1, max_workers)
+  for i in range(workers):
+    thread = threading.Thread(target=work)
+    thread.setDaemon(True)
+    thread.start()
+  try:
+    while workers:
+      result = results.get()
+      if result is None:
+        workers -= 1
+      else:
+        yield result
+  finally:
+    # Stop handing out work if the caller abandons the generator
+    stopped.set()
+
+
+class ThreadLocalHttp(object):
+  """A httplib2-like client that gives each thread its own instance.
+
+  httplib2.Http keeps a per-host connection table that is not safe to
+  share between threads, so concurrent lookups should use one of these.
+  """
+
+  def __init__(self, factory=httplib2.Http):
+    """Construct a new per-thread HTTP client.
+
+    Args:
+      factory: A callable returning a new httplib2-like instance [optional]
+    """
+    self._factory = factory
+    self._local = threading.local()
+
+  def get(self):
+    """Returns the httplib2-like instance for the current thread."""
+    http_client = getattr(self._local, 'http_client', None)
+    if http_client is None:
+      http_client = self._local.http_client = self._factory()
+    return http_client
+
+  def request(self, *args, **kwargs):
+    return self.get().request(*args, **kwargs)
+
+
 class Client(object):
 
-  def __init__(self, http_client=None, xrd_parser=None):
+  def __init__(self, http_client=None, xrd_parser=None, hedger=None,
+               single_flight=None, scheduler=None, xrd_cache=None,
+               timeouts=None):
     """Construct a new WebFinger client.
 
     Args:
       http_client: A httplib2-like instance [optional]
       xrd_parser: An XRD parser [optional]
+      hedger: A hedge.Hedger used to race links that have both a
+        template and an href instead of fetching both [optional]
+      single_flight: A singleflight.Group shared between clients so that
+        concurrent identical lookups and fetches run only once [optional]
+      scheduler: A scheduler.HostScheduler shared between clients that
+        limits the concurrency and request rate for each host [optional]
+      xrd_cache: An xrdcache.RefreshAheadCache shared between clients that
+        holds parsed host-meta and lrdd documents and refreshes hot ones in
+        the background [optional]
+      timeouts: A timeouts.AdaptiveTimeouts shared between clients that
+        sets the timeout of each request from its host's latency history;
+        it is applied to the per-thread clients of a ThreadLocalHttp, or
+        to http_client itself, which then must not be shared between
+        threads [optional]
     """
     if http_client:
       self._http_client = http_client
     else:
-      self._http_client = httplib2.Http()
+      self._http_client = ThreadLocalHttp()
     if xrd_parser:
       self._xrd_parser = xrd_parser
     else:
       self._xrd_parser = xrd.Parser()
+    self._hedger = hedger
+    self._single_flight = single_flight
+    self._scheduler = scheduler
+    self._xrd_cache = xrd_cache
+    self._timeouts = timeouts
 
   def lookup(self, id):
     """Look up a webfinger resource by (email-like) id.
 
     Args:
       id: An account identifier (which may or may not start with 'acct:')
+    Returns:
+      A list of discovered xrd_pb2.Xrd instances.  When hedging, links
+      with both a template and an href contribute a single instance.
+    Raises:
+      FetchError if a URL can not be retrieved.
+      ParseError if a description can not be parsed.
+    """
+    local_part, domain = self._parse_id(id)
+    webfinger_id = 'acct:%s@%s' % (local_part, domain)
+    return self._shared_lookup(webfinger_id, domain)
+
+  def lookup_uri(self, uri):
+    """Look up a webfinger resource by account id or http(s) URL.
+
+    A URL, such as a profile page found among a description's aliases, is
+    looked up through the lrdd links of its own host.
+
+    Args:
+      uri: An account identifier or an http or https URL
     Returns:
       A list of discovered xrd_pb2.Xrd instances.
+    Raises:
+      FetchError if a URL can not be retrieved.
+      ParseError if the uri or a description can not be parsed.
+    """
+    scheme, netloc = urlparse.urlparse(uri)[:2]
+    if scheme.lower() not in ['http', 'https']:
+      return self.lookup(uri)
+    domain = netloc.split('@')[-1].lower()
+    if not domain:
+      raise ParseError('Could not parse %s for a host' % uri)
+    return self._shared_lookup(uri, domain)
+
+  def _shared_lookup(self, webfinger_id, domain):
+    """Calls _lookup, sharing the work with identical concurrent calls."""
+    if self._single_flight:
+      # Copy the shared list so callers can't affect each other
+      return list(self._single_flight.do(
+          ('id', webfinger_id), self._lookup, webfinger_id, domain))
+    return self._lookup(webfinger_id, domain)
+
+  def lookup_many(self, ids, max_workers=DEFAULT_MAX_WORKERS):
+    """Looks up many ids concurrently.
+
+    The host-meta document of each domain is fetched and parsed once for
+    the whole batch, however many of the ids share it.
+
+    Args:
+      ids: An iterable of account identifiers
+      max_workers: The maximum number of concurrent lookups [optional]
+    Returns:
+      A generator yielding an (id, descriptions, error) tuple for each id
+      as soon as its lookup finishes, where exactly one of descriptions
+      (a list of xrd_pb2.Xrd instances) and error (an exception) is None.
+    """
+    domain_links = dict()
+    domain_group = singleflight.Group()
+    def get_links(domain):
+      if domain not in domain_links:
+        try:
+          domain_links[domain] = (
+              self._get_webfinger_service_links(domain), None)
+        except Exception, e:
+          domain_links[domain] = (None, e)
+      links, error = domain_links[domain]
+      if error is not None:
+        raise error
+      return links
+    def lookup(id):
+      local_part, domain = self._parse_id(id)
+      webfinger_id = 'acct:%s@%s' % (local_part, domain)
+      links = domain_group.do(domain, get_links, domain)
+      return self._lookup(webfinger_id, domain, links)
+    return map_concurrently(lookup, ids, max_workers)
+
+  def _lookup(self, webfinger_id, domain, links=None):
+    """Fetches the service descriptions for a normalized account id.
+
+    Args:
+      webfinger_id: An 'acct:' account identifier
+      domain: The domain of the account identifier
+      links: The domain's lrdd links, if already known [optional]
+    Returns:
+      A list of discovered xrd_pb2.Xrd instances.
+    """
+    if links is None:
+      links = self._get_webfinger_service_links(domain)
+    return list(self._iter_descriptions(webfinger_id, links))
+
+  def iter_lookup(self, id):
+    """Look up a webfinger resource, yielding descriptions as they arrive.
+
+    The host-meta document is fetched before this returns, so errors
+    finding the lookup services are raised here; each service description
+    is then fetched and parsed only as the generator is advanced.
+
+    Args:
+      id: An account identifier (which may or may not start with 'acct:')
+    Returns:
+      A generator of discovered xrd_pb2.Xrd instances.
     Raises:
       FetchError if a URL can not be retrieved.
       ParseError if a description can not be parsed.
@@ -90,19 +401,61 @@ class Client(object):
     local_part, domain = self._parse_id(id)
     webfinger_id = 'acct:%s@%s' % (local_part, domain)
     links = self._get_webfinger_service_links(domain)
-    service_descriptions = list()
+    return self._iter_descriptions(webfinger_id, links)
+
+  def prewarm(self, domains, max_workers=DEFAULT_MAX_WORKERS):
+    """Fetches the host-meta documents of many domains concurrently.
+
+    This is only useful with an xrd_cache, which keeps the documents.
+
+    Args:
+      domains: An iterable of domain names
+      max_workers: The maximum number of concurrent fetches [optional]
+    Returns:
+      A generator yielding a (domain, links, error) tuple for each domain
+      as soon as its fetch finishes, as for lookup_many.
+    """
+    return map_concurrently(
+        self._get_webfinger_service_links, domains, max_workers)
+
+  def _iter_descriptions(self, webfinger_id, links):
+    """Fetches the service description behind each lrdd link in turn.
+
+    Args:
+      webfinger_id: An 'acct:' account identifier
+      links: The domain's lrdd links
+    Returns:
+      A generator of xrd_pb2.Xrd instances.
+    """
     for link in links:
+      if self._hedger and link.template and link.href:
+        yield self._hedger.run(
+            functools.partial(
+                self._get_service_description, link.template, webfinger_id),
+            functools.partial(
+                self._get_service_description, link.href, webfinger_id))
+        continue
       if link.template:
-        service_descriptions.append(
-            self._get_service_description(link.template, webfinger_id))
+        yield self._get_service_description(link.template, webfinger_id)
       if link.href:
-        service_descriptions.append(
-            self._get_service_description(link.href, webfinger_id))
-    return service_descriptions
+        yield self._get_service_description(link.href, webfinger_id)
 
   def fetch_and_parse_xrd(self, xrd_url):
+    if self._single_flight:
+      return self._single_flight.do(
+          ('url', xrd_url), self._fetch_and_parse_xrd, xrd_url)
+    return self._fetch_and_parse_xrd(xrd_url)
+
+  def _fetch_and_parse_xrd(self, xrd_url):
     content = self._fetch_url(xrd_url)
-    return self._xrd_parser.parse(content)
+    return self._parse_xrd(content)
+
+  def _parse_xrd(self, content):
+    stop = stats.timer('parse_seconds', parser='xrd')
+    try:
+      return self._xrd_parser.parse(content)
+    finally:
+      stop()
 
   def _get_service_description(self, template, id):
     """Retrieve an XRD or XFN instance from a xrd_pb2.Link.
@@ -116,20 +469,21 @@ class Client(object):
     """
     service_url = self._interpolate_webfinger_template(template, id)
     logging.info('Fetching service url %s' % service_url)
+    if self._xrd_cache:
+      # A fresh message, so callers can't change the cached copy
+      return self._xrd_cache.get(service_url, self.load_xrd).to_pb()
     return self.fetch_and_parse_xrd(service_url)
 
   def _interpolate_webfinger_template(self, template, id):
-    """Replaces occurances of {id} and {%id} within a webfinger template.
+    """Expands {uri}, {id} and other URI template expressions.
 
     Args:
       template: A webfinger URI template
       id: A identity string
     Returns:
-      The template with {id} and {%id} replaced
+      The template with {uri}, {%uri}, {id} and {%id} replaced
     """
-    for variable in ['{uri}', '{%uri}', '{id}', '{%id}']:
-      template = template.replace(variable, urllib.quote(id))
-    return template
+    return uritemplate.compile(template).expand({'uri': id, 'id': id})
 
   def _get_webfinger_service_links(self, domain):
     """Finds potential webfinger service links.
@@ -141,7 +495,10 @@ class Client(object):
     """
     domain_url = DOMAIN_LEVEL_XRD_TEMPLATE % domain
     logging.info('Fetching domain url %s' % domain_url)
-    domain_xrd = self.fetch_and_parse_xrd(domain_url)
+    if self._xrd_cache:
+      domain_xrd = self._xrd_cache.get(domain_url, self.load_xrd)
+    else:
+      domain_xrd = self.fetch_and_parse_xrd(domain_url)
     links = list()
     for link in domain_xrd.links:
       if link.rel == WEBFINGER_SERVICE_REL_VALUE:
@@ -158,18 +515,45 @@ class Client(object):
     Raises:
       ParseError if the id can not be parsed
     """
-    # Strip any account prefix
-    if id.startswith('acct://'):
-      id = id[7:]
-    elif id.startswith('acct:'):
-      id = id[5:]
-    realname, addr_spec = email.utils.parseaddr(id)
-    if not addr_spec:
-      raise ParseError('Could not parse %s for addr-spec' % id)
-    match = ADDR_SPEC_RE.match(addr_spec)
-    if not match:
-      raise ParseError('Could not parse %s for local_part, domain' % id)
-    return match.group(1), match.group(2)
+    return parse_id(id)
+
+  def load_xrd(self, url, etag=None, last_modified=None):
+    """Fetches and parses an XRD document, conditionally if possible.
+
+    This is the loader used with an xrdcache.RefreshAheadCache, which
+    holds the compact form of each document.
+
+    Args:
+      url: The URL of the document
+      etag: The ETag of the cached copy [optional]
+      last_modified: The Last-Modified date of the cached copy [optional]
+    Returns:
+      A tuple of (compactxrd.Xrd or None if not modified, etag,
+      last_modified, expiry time in seconds since the epoch or None)
+    Raises:
+      FetchError if the URL can not be retrieved
+      ParseError if the document can not be parsed
+    """
+    headers = dict()
+    if etag:
+      headers['if-none-match'] = etag
+    if last_modified:
+      headers['if-modified-since'] = last_modified
+    if headers:
+      # Make a caching http client revalidate rather than answer from cache
+      headers['cache-control'] = 'max-age=0'
+    response, content = self._fetch(url, headers)
+    if response.status == 304:
+      return None, etag, last_modified, None
+    if response.status != 200:
+      raise FetchError(
+        'Could not fetch %s. Status %d.' % (url, response.status))
+    if headers and getattr(response, 'fromcache', False):
+      # httplib2 turned a 304 into its cached 200
+      return None, response.get('etag'), response.get('last-modified'), None
+    description = compactxrd.Xrd.from_pb(self._parse_xrd(content))
+    return (description, response.get('etag'), response.get('last-modified'),
+            xrdcache.parse_datetime(description.expires))
 
   def _fetch_url(self, url):
     """Fetch a URL.
@@ -181,21 +565,312 @@ class Client(object):
     Raises:
       FetchError if the URL can not be retrieved
     """
-    try:
-      response, content = self._http_client.request(url)
-    except Exception, e:  # This is hackish
-      raise FetchError('Could not fetch %s. Host down?' % url)
+    response, content = self._fetch(url)
     if response.status != 200:
       raise FetchError(
         'Could not fetch %s. Status %d.' % (url, response.status))
     return content
 
+  def _fetch(self, url, headers=None):
+    """Requests a URL, whatever the response status.
+
+    Args:
+      url: The URL to fetch
+      headers: Extra request headers [optional]
+    Returns:
+      The tuple (response, content)
+    Raises:
+      FetchError if the URL can not be retrieved
+    """
+    scheme, host = urlparse.urlparse(url)[:2]
+    host = host.lower()
+    http_client = self._http_client
+    if self._timeouts:
+      if isinstance(http_client, ThreadLocalHttp):
+        http_client = http_client.get()
+      _set_timeout(http_client, scheme, host, self._timeouts.timeout(host))
+    # Nothing may raise between acquiring the host and the try that
+    # releases it
+    if self._scheduler:
+      self._scheduler.acquire(host)
+    response = None
+    stop = stats.timer('fetch_seconds')
+    start = time.time()
+    try:
+      try:
+        if headers:
+          response, content = http_client.request(url, headers=headers)
+        else:
+          response, content = http_client.request(url)
+      except Exception, e:  # This is hackish
+        if self._timeouts and isinstance(e, socket.timeout):
+          self._timeouts.record_timeout(host)
+        raise FetchError('Could not fetch %s. Host down?' % url)
+    finally:
+      stop()
+      # Responses from the cache, revalidated ones included, say nothing
+      # of the host's latency
+      if (self._timeouts and response is not None and
+          not getattr(response, 'fromcache', False)):
+        self._timeouts.record(host, time.time() - start)
+      if response is None:
+        stats.increment('fetches', status='error')
+      else:
+        stats.increment('fetches', status=stats.status_class(response.status))
+      if self._scheduler:
+        if response is None:
+          self._scheduler.release(host)
+        else:
+          self._scheduler.release(host, response.status,
+                                  response.get('retry-after'))
+    return response, content
+
+
+def _set_timeout(http_client, scheme, host, timeout):
+  """Sets the timeout of the next request to a host.
+
+  httplib2 applies its timeout only to the connections it opens, so the
+  open connection to the host, if any, is changed too.
+
+  Args:
+    http_client: A httplib2-like instance
+    scheme: The scheme of the request
+    host: The host and port of the request, in lower case
+    timeout: The timeout in seconds
+  """
+  http_client.timeout = timeout
+  connections = getattr(http_client, 'connections', None)
+  if not connections:
+    return
+  conn = connections.get('%s:%s' % (scheme, host))
+  if conn is None:
+    return
+  conn.timeout = timeout
+  if conn.sock is not None:
+    try:
+      conn.sock.settimeout(timeout)
+    except socket.error:
+      # A dead socket; httplib2 reconnects with conn.timeout
+      pass
+
+# The number of seconds between progress reports in batch mode
+PROGRESS_INTERVAL = 5.0
+
+USAGE = """Usage webfinger.py id
+       webfinger.py --batch FILE [options]
+
+Batch mode reads one id per line from FILE (or stdin for '-') and writes
+one result per id as JSON lines, or as length-delimited records: the id,
+the error or an empty record, the number of descriptions, then each
+description as a protobuf."""
+
+# The client used by each batch worker process
+_worker_client = None
+
+
+class _BatchHttp(boundedhttp.Http, dnscache.Http):
+  """A size-bounded HTTP client that resolves through a shared Resolver."""
+
+  def __init__(self, resolver, transfer_stats):
+    boundedhttp.Http.__init__(self, stats=transfer_stats)
+    self._use_resolver(resolver, dnscache.DEFAULT_ATTEMPT_DELAY)
+
+
+def _worker_limits(workers, rate=scheduler.DEFAULT_RATE,
+                   max_per_host=scheduler.DEFAULT_MAX_PER_HOST,
+                   burst=scheduler.DEFAULT_BURST):
+  """Divides per-host limits between batch worker processes.
+
+  Args:
+    workers: The number of worker processes
+    rate: The requests per second allowed to each host [optional]
+    max_per_host: The concurrent requests allowed to each host [optional]
+    burst: The requests a host may receive back to back [optional]
+  Returns:
+    A dict of scheduler.HostScheduler arguments for each worker. Every
+    worker may make at least one request to a host at a time, so with
+    more workers than max_per_host or burst, those limits are exceeded.
+  """
+  workers = max(workers, 1)
+  return {'rate': float(rate) / workers,
+          'max_per_host': max(1, max_per_host // workers),
+          'burst': max(1, burst // workers)}
+
+
+def _init_worker(client=None, limits=None):
+  global _worker_client
+  if client is None:
+    if limits is None:
+      limits = _worker_limits(1)
+    resolver = dnscache.Resolver()
+    transfer_stats = boundedhttp.TransferStats()
+    http_client = ThreadLocalHttp(
+        lambda: _BatchHttp(resolver, transfer_stats))
+    client = Client(http_client=http_client,
+                    scheduler=scheduler.HostScheduler(**limits),
+                    xrd_cache=xrdcache.RefreshAheadCache(),
+                    timeouts=timeouts.AdaptiveTimeouts())
+  _worker_client = client
+
+
+def _lookup_for_batch(args):
+  """Looks up one id in a worker, returning output ready to write.
+
+  Args:
+    args: A tuple of (id, output format)
+  Returns:
+    A tuple of (id, list of output strings, error string or None)
+  """
+  id, format = args
+  try:
+    descriptions = _worker_client.lookup(id)
+    error = None
+  except Exception, e:
+    descriptions = []
+    error = str(e)
+  if format == 'json':
+    if error is None:
+      marshaller = xrd.JsonMarshaller()
+      result = {'id': id, 'descriptions': marshaller.to_object(descriptions)}
+    else:
+      result = {'id': id, 'error': error}
+    return id, [json.dumps(result) + '\n'], error
+  buffer = StringIO.StringIO()
+  delimited.write(buffer, id)
+  delimited.write(buffer, error or '')
+  delimited.write(buffer, str(len(descriptions)))
+  for description in descriptions:
+    delimited.write(buffer, description.SerializeToString())
+  return id, [buffer.getvalue()], error
+
+
+def _read_ids(stream, done):
+  """Yields the non-blank, uncommented ids in stream not already done."""
+  for line in stream:
+    id = line.strip()
+    if id and not id.startswith('#') and id not in done:
+      yield id
+
+
+def crawl(ids, output, format='json', workers=4, checkpoint=None,
+          progress=sys.stderr, client=None, rate=scheduler.DEFAULT_RATE,
+          max_per_host=scheduler.DEFAULT_MAX_PER_HOST,
+          burst=scheduler.DEFAULT_BURST):
+  """Looks up many ids using a pool of worker processes.
+
+  Only the ids looked up successfully are checkpointed, so a resumed crawl
+  retries the ones that failed. So that the output holds one record per
+  id across resumes, failures are then reported to progress rather than
+  written to output. Each worker limits its requests to each
+  host with its own scheduler.HostScheduler, and the rate, concurrency
+  and burst limits are divided between the workers. A worker backs off a
+  host that answers 429 or 503 without the others knowing.
+
+  Args:
+    ids: An iterable of account identifiers
+    output: A file-like object the results are written to
+    format: 'json' for JSON lines or 'proto' for delimited records
+    workers: The number of worker processes, or 0 to work in process
+    checkpoint: A file-like object each successful id is appended to
+    progress: A file-like object progress reports are written to
+    client: The Client used when workers is 0 [optional]
+    rate: The requests per second allowed to each host [optional]
+    max_per_host: The concurrent requests allowed to each host [optional]
+    burst: The requests a host may receive back to back [optional]
+  Returns:
+    A tuple of (ids looked up, ids that failed)
+  """
+  work = ((id, format) for id in ids)
+  if workers > 0:
+    import multiprocessing
+    pool = multiprocessing.Pool(
+        workers, _init_worker,
+        (None, _worker_limits(workers, rate, max_per_host, burst)))
+    results = pool.imap_unordered(_lookup_for_batch, work, 16)
+  else:
+    pool = None
+    _init_worker(client, _worker_limits(1, rate, max_per_host, burst))
+    results = (_lookup_for_batch(args) for args in work)
+  start = last_report = time.time()
+  count = failures = 0
+  try:
+    for id, lines, error in results:
+      count += 1
+      if error:
+        failures += 1
+        if checkpoint:
+          progress.write('Failed %s: %s\n' % (id, error))
+          continue
+      for line in lines:
+        output.write(line)
+      if checkpoint:
+        output.flush()
+        checkpoint.write(id + '\n')
+        checkpoint.flush()
+      now = time.time()
+      if now - last_report >= PROGRESS_INTERVAL:
+        last_report = now
+        progress.write('%d ids, %d failed, %.1f ids/s\n' %
+                       (count, failures, count / (now - start)))
+  finally:
+    if pool:
+      pool.terminate()
+  elapsed = max(time.time() - start, 1e-6)
+  progress.write('Done: %d ids, %d failed, %.1f ids/s\n' %
+                 (count, failures, count / elapsed))
+  return count, failures
+
+
 def main(argv):
-  if len(argv) < 2:
-    raise UsageError('Usage webfinger.py id')
-  client = Client()
-  for description in client.lookup(argv[1]):
-    print description
+  parser = optparse.OptionParser(usage=USAGE)
+  parser.add_option('--batch', metavar='FILE',
+                    help="read ids from FILE, or stdin for '-'")
+  parser.add_option('--workers', type='int', default=4,
+                    help='worker processes, 0 for none [default: %default]')
+  parser.add_option('--rate', type='float', default=scheduler.DEFAULT_RATE,
+                    help='requests per second to each host, across all '
+                    'workers [default: %default]')
+  parser.add_option('--max-per-host', type='int',
+                    default=scheduler.DEFAULT_MAX_PER_HOST,
+                    help='concurrent requests to each host, across all '
+                    'workers but at least one per worker [default: %default]')
+  parser.add_option('--format', choices=['json', 'proto'], default='json',
+                    help='json or proto [default: %default]')
+  parser.add_option('--output', metavar='FILE',
+                    help='append results to FILE instead of stdout')
+  parser.add_option('--checkpoint', metavar='FILE',
+                    help='record successful ids in FILE and skip them on '
+                    'resume; failures then go to stderr, not the output')
+  options, args = parser.parse_args(argv[1:])
+  if not options.batch:
+    if len(args) != 1:
+      raise UsageError('Usage webfinger.py id')
+    client = Client()
+    for description in client.lookup(args[0]):
+      print description
+    return
+  done = set()
+  checkpoint = None
+  if options.checkpoint:
+    if os.path.exists(options.checkpoint):
+      done.update([line.strip() for line in open(options.checkpoint)])
+    checkpoint = open(options.checkpoint, 'a')
+  if options.batch == '-':
+    input = sys.stdin
+  else:
+    input = open(options.batch)
+  if options.output:
+    output = open(options.output, 'ab')
+  else:
+    output = sys.stdout
+  try:
+    crawl(_read_ids(input, done), output, options.format, options.workers,
+          checkpoint, rate=options.rate,
+          max_per_host=options.max_per_host)
+  finally:
+    output.flush()
+    if checkpoint:
+      checkpoint.close()
 
 if __name__ == "__main__":
   main(sys.argv)
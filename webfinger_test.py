@@ -0,0 +1,422 @@
+#!/usr/bin/python2.5
+#
+# Tests the WebFinger client.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import StringIO
+import compactxrd
+import delimited
+import hedge
+import scheduler
+import singleflight
+import socket
+import threading
+import time
+import timeouts
+import unittest
+import webfinger
+import xrd_pb2
+import xrdcache
+
+try:
+  import simplejson as json
+except ImportError:
+  import json
+
+HOST_META = '''<XRD xmlns="http://docs.oasis-open.org/ns/xri/xrd-1.0">
+                 <Link rel="lrdd"
+                       template="http://example.com/describe?uri={uri}"
+                       href="http://example.com/describe" />
+               </XRD>'''
+
+TEMPLATE_DESCRIPTION = '''<XRD xmlns="http://docs.oasis-open.org/ns/xri/xrd-1.0">
+                            <Subject>template</Subject>
+                          </XRD>'''
+
+HREF_DESCRIPTION = '''<XRD xmlns="http://docs.oasis-open.org/ns/xri/xrd-1.0">
+                        <Subject>href</Subject>
+                      </XRD>'''
+
+
+class FakeResponse(dict):
+
+  def __init__(self, status, fromcache=False):
+    self.status = status
+    self.fromcache = fromcache
+
+
+class FakeHttp(object):
+  """A httplib2-like client serving canned documents."""
+
+  def __init__(self, documents, delays=None, cached=()):
+    self._documents = documents
+    self._delays = delays or {}
+    self._cached = cached
+    self._lock = threading.Lock()
+    self.requested = list()
+    self.timeouts = list()
+
+  def request(self, url, *args, **kwargs):
+    self._lock.acquire()
+    try:
+      self.requested.append(url)
+      self.timeouts.append(getattr(self, 'timeout', None))
+    finally:
+      self._lock.release()
+    delay = self._delays.get(url, 0)
+    if delay < 0:
+      raise socket.timeout('timed out')
+    time.sleep(delay)
+    if url not in self._documents:
+      return FakeResponse(404), ''
+    return FakeResponse(200, url in self._cached), self._documents[url]
+
+
+def new_http(delays=None):
+  return FakeHttp(
+      {'http://example.com/.well-known/host-meta': HOST_META,
+       'http://example.com/describe?uri=acct%3Abob%40example.com':
+           TEMPLATE_DESCRIPTION,
+       'http://example.com/describe': HREF_DESCRIPTION},
+      delays)
+
+
+class ClientTest(unittest.TestCase):
+
+  def testLookup(self):
+    client = webfinger.Client(http_client=new_http())
+    descriptions = client.lookup('bob@example.com')
+    self.assertEquals(['template', 'href'],
+                      [d.subject for d in descriptions])
+
+  def testIterLookup(self):
+    http = new_http()
+    client = webfinger.Client(http_client=http)
+    descriptions = client.iter_lookup('bob@example.com')
+    self.assertEquals(1, len(http.requested))
+    self.assertEquals('template', descriptions.next().subject)
+    self.assertEquals(2, len(http.requested))
+    self.assertEquals('href', descriptions.next().subject)
+
+  def testIterLookupRaisesHostMetaErrors(self):
+    client = webfinger.Client(http_client=new_http())
+    self.assertRaises(webfinger.FetchError, client.iter_lookup,
+                      'bob@example.org')
+
+  def testLookupMany(self):
+    http = new_http()
+    client = webfinger.Client(http_client=http)
+    results = dict()
+    for id, descriptions, error in client.lookup_many(
+        ['bob@example.com', 'bob@example.com', 'bob', 'bob@example.org']):
+      results.setdefault(id, []).append((descriptions, error))
+    self.assertEquals(2, len(results['bob@example.com']))
+    for descriptions, error in results['bob@example.com']:
+      self.assertEquals(None, error)
+      self.assertEquals(2, len(descriptions))
+    self.assertTrue(isinstance(results['bob'][0][1], webfinger.ParseError))
+    self.assertTrue(
+        isinstance(results['bob@example.org'][0][1], webfinger.FetchError))
+    self.assertEquals(
+        1, http.requested.count('http://example.com/.well-known/host-meta'))
+
+  def testLookupManyWithScheduler(self):
+    http = new_http()
+    host_scheduler = scheduler.HostScheduler(max_per_host=1)
+    client = webfinger.Client(http_client=http, scheduler=host_scheduler)
+    results = list(client.lookup_many(['bob@example.com'] * 3))
+    self.assertEquals([None] * 3, [error for id, d, error in results])
+    self.assertEquals(len(http.requested), host_scheduler.stats()['granted'])
+    self.assertEquals(0, host_scheduler.stats()['active'])
+
+  def testXrdCacheHoldsDocuments(self):
+    http = new_http()
+    cache = xrdcache.RefreshAheadCache(scan_interval=None)
+    client = webfinger.Client(http_client=http, xrd_cache=cache)
+    self.assertEquals(2, len(client.lookup('bob@example.com')))
+    descriptions = client.lookup('bob@example.com')
+    self.assertEquals(3, len(http.requested))
+    self.assertEquals(3, cache.stats()['hits'])
+    # The cache holds compact documents and hands out messages
+    for key, value in [entry[:2] for entry in cache.entries()]:
+      self.assertTrue(isinstance(value, compactxrd.Xrd))
+    self.assertTrue(isinstance(descriptions[0], xrd_pb2.Xrd))
+    descriptions[0].subject = 'changed'
+    self.assertEquals('template',
+                      client.lookup('bob@example.com')[0].subject)
+
+  def testAdaptiveTimeouts(self):
+    http = new_http()
+    estimator = timeouts.AdaptiveTimeouts(initial=5.0, min_timeout=0.5)
+    client = webfinger.Client(
+        http_client=webfinger.ThreadLocalHttp(lambda: http),
+        timeouts=estimator)
+    for i in range(3):
+      client.lookup('bob@example.com')
+    self.assertEquals([5.0] * 3, http.timeouts[:3])
+    # Once it has a history, the fast host gets the shortest timeout
+    self.assertEquals(0.5, http.timeouts[-1])
+    self.assertEquals(9, estimator.stats()['successes'])
+
+  def testTimeoutsBackOff(self):
+    http = FakeHttp({}, {'http://example.com/.well-known/host-meta': -1})
+    estimator = timeouts.AdaptiveTimeouts(initial=5.0)
+    client = webfinger.Client(http_client=http, timeouts=estimator)
+    self.assertRaises(webfinger.FetchError, client.lookup, 'bob@example.com')
+    self.assertRaises(webfinger.FetchError, client.lookup, 'bob@example.com')
+    self.assertEquals([5.0, 10.0], http.timeouts)
+    self.assertEquals(2, estimator.stats()['timeouts'])
+
+  def testCacheHitsAreNotTimed(self):
+    http = FakeHttp({'http://example.com/.well-known/host-meta': HOST_META},
+                    cached=['http://example.com/.well-known/host-meta'])
+    estimator = timeouts.AdaptiveTimeouts()
+    client = webfinger.Client(http_client=http, timeouts=estimator)
+    client.load_xrd('http://example.com/.well-known/host-meta')
+    self.assertEquals(0, estimator.stats()['successes'])
+
+  def testTimeoutsApplyToOpenConnections(self):
+    class FakeConnection(object):
+      timeout = 5.0
+      sock = None
+    http = new_http()
+    connection = FakeConnection()
+    http.connections = {'http:example.com': connection,
+                        'http:example.org': FakeConnection()}
+    webfinger._set_timeout(http, 'http', 'example.com', 1.5)
+    self.assertEquals(1.5, http.timeout)
+    self.assertEquals(1.5, connection.timeout)
+    self.assertEquals(5.0, http.connections['http:example.org'].timeout)
+
+  def testSchedulerIsReleasedOnTimeoutErrors(self):
+    class BrokenTimeouts(timeouts.AdaptiveTimeouts):
+      def timeout(self, host):
+        raise socket.error('dead socket')
+    host_scheduler = scheduler.HostScheduler(max_per_host=1)
+    client = webfinger.Client(http_client=new_http(),
+                              scheduler=host_scheduler,
+                              timeouts=BrokenTimeouts())
+    for i in range(2):
+      self.assertRaises(socket.error, client.lookup, 'bob@example.com')
+    self.assertEquals(0, host_scheduler.stats()['active'])
+
+  def testDeadSocketsKeepTheirTimeout(self):
+    class DeadSocket(object):
+      def settimeout(self, timeout):
+        raise socket.error('Bad file descriptor')
+    class FakeConnection(object):
+      timeout = 5.0
+      sock = DeadSocket()
+    http = new_http()
+    http.connections = {'http:example.com': FakeConnection()}
+    webfinger._set_timeout(http, 'http', 'example.com', 1.5)
+    self.assertEquals(1.5, http.connections['http:example.com'].timeout)
+
+  def testParseId(self):
+    client = webfinger.Client(http_client=new_http())
+    self.assertEquals(('bob', 'example.com'),
+                      client._parse_id('acct:bob@example.com'))
+    self.assertRaises(webfinger.ParseError, client._parse_id, 'bob')
+
+
+class ParseIdTest(unittest.TestCase):
+
+  def testParseId(self):
+    self.assertEquals(('bob', 'example.com'),
+                      webfinger.parse_id('acct:bob@example.com'))
+    self.assertEquals(('bob', 'example.com'),
+                      webfinger.parse_id('acct://bob@example.com'))
+
+  def testParseIdNormalizesDomain(self):
+    self.assertEquals(('Bob', 'example.com'),
+                      webfinger.parse_id('Bob@EXAMPLE.com'))
+    self.assertEquals((u'bob', 'xn--exmple-cua.com'),
+                      webfinger.parse_id(u'bob@ex\xe4mple.com'))
+
+  def testParseIdFallsBackToParseaddr(self):
+    self.assertEquals(('bob', 'example.com'),
+                      webfinger.parse_id('Bob Smith <bob@example.com>'))
+
+  def testParseIdErrorsAreRepeated(self):
+    self.assertRaises(webfinger.ParseError, webfinger.parse_id, 'bob')
+    self.assertRaises(webfinger.ParseError, webfinger.parse_id, 'bob')
+
+  def testParseIds(self):
+    results = list(webfinger.parse_ids(['a@example.com', 'b', 'c@example.org']))
+    self.assertEquals(('a', 'example.com'), results[0])
+    self.assertTrue(isinstance(results[1], webfinger.ParseError))
+    self.assertEquals(('c', 'example.org'), results[2])
+
+
+class HedgeTest(unittest.TestCase):
+
+  def testPrimaryWins(self):
+    hedger = hedge.Hedger(delay=1.0)
+    client = webfinger.Client(http_client=new_http(), hedger=hedger)
+    descriptions = client.lookup('bob@example.com')
+    self.assertEquals(['template'], [d.subject for d in descriptions])
+    self.assertEquals(1, hedger.primary_wins)
+    self.assertEquals(0, hedger.hedged)
+
+  def testSlowPrimaryIsHedged(self):
+    hedger = hedge.Hedger(delay=0.01)
+    http = new_http(
+        {'http://example.com/describe?uri=acct%3Abob%40example.com': 0.5})
+    client = webfinger.Client(http_client=http, hedger=hedger)
+    descriptions = client.lookup('bob@example.com')
+    self.assertEquals(['href'], [d.subject for d in descriptions])
+    self.assertEquals(1, hedger.hedged)
+    self.assertEquals(1, hedger.secondary_wins)
+
+  def testFailedPrimaryFallsBack(self):
+    hedger = hedge.Hedger(delay=1.0)
+    def fail():
+      raise webfinger.FetchError('Host down?')
+    self.assertEquals('ok', hedger.run(fail, lambda: 'ok'))
+    self.assertEquals(1, hedger.fallbacks)
+
+  def testDelayTracksPercentile(self):
+    hedger = hedge.Hedger(delay=1.0, percentile=90)
+    for i in reversed(range(hedge.MIN_SAMPLES)):
+      self.assertEquals(1.0, hedger.delay())
+      hedger.record_latency(float(i * 2))
+    self.assertEquals(18.0, hedger.delay())
+
+
+class SingleFlightTest(unittest.TestCase):
+
+  def testConcurrentLookupsShareFetches(self):
+    group = singleflight.Group()
+    http = new_http({'http://example.com/.well-known/host-meta': 0.2})
+    results = list()
+    def lookup():
+      client = webfinger.Client(http_client=http, single_flight=group)
+      results.append(client.lookup('acct:bob@example.com'))
+    threads = [threading.Thread(target=lookup) for i in range(5)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEquals(5, len(results))
+    self.assertEquals(3, len(http.requested))
+    self.assertEquals(4, group.shared)
+
+  def testErrorsAreShared(self):
+    group = singleflight.Group()
+    def fail():
+      raise webfinger.FetchError('Host down?')
+    self.assertRaises(webfinger.FetchError, group.do, 'key', fail)
+    self.assertEquals('ok', group.do('key', lambda: 'ok'))
+
+
+class CrawlTest(unittest.TestCase):
+
+  def crawl(self, ids, format='json', checkpoint=None, progress=None):
+    output = StringIO.StringIO()
+    client = webfinger.Client(http_client=new_http())
+    result = webfinger.crawl(ids, output, format, workers=0,
+                             checkpoint=checkpoint,
+                             progress=progress or StringIO.StringIO(),
+                             client=client)
+    return result, output.getvalue()
+
+  def testJson(self):
+    result, output = self.crawl(['bob@example.com', 'bob@example.org'])
+    self.assertEquals((2, 1), result)
+    lines = [json.loads(line) for line in output.splitlines()]
+    self.assertEquals('bob@example.com', lines[0]['id'])
+    self.assertEquals(['template', 'href'],
+                      [d['subject'] for d in lines[0]['descriptions']])
+    self.assertEquals('bob@example.org', lines[1]['id'])
+    self.assertTrue('error' in lines[1])
+
+  def testProto(self):
+    result, output = self.crawl(['bob@example.com', 'bob@example.org'],
+                                'proto')
+    records = list(delimited.read(StringIO.StringIO(output)))
+    self.assertEquals(['bob@example.com', '', '2'], records[:3])
+    description = xrd_pb2.Xrd()
+    description.ParseFromString(records[3])
+    self.assertEquals('template', description.subject)
+    self.assertEquals('bob@example.org', records[5])
+    self.assertTrue(records[6])
+    self.assertEquals('0', records[7])
+    self.assertEquals(8, len(records))
+
+  def testResumeRetriesFailures(self):
+    checkpoint = StringIO.StringIO()
+    progress = StringIO.StringIO()
+    result, output = self.crawl(['bob@example.com', 'bob@example.org'],
+                                checkpoint=checkpoint, progress=progress)
+    self.assertEquals((2, 1), result)
+    self.assertEquals('bob@example.com\n', checkpoint.getvalue())
+    self.assertTrue('Failed bob@example.org' in progress.getvalue())
+    done = set(checkpoint.getvalue().splitlines())
+    ids = StringIO.StringIO('bob@example.com\nbob@example.org\n')
+    progress = StringIO.StringIO()
+    result, resumed = self.crawl(webfinger._read_ids(ids, done),
+                                 checkpoint=checkpoint, progress=progress)
+    self.assertEquals((1, 1), result)
+    self.assertTrue('Failed bob@example.org' in progress.getvalue())
+    # One record per id across both runs
+    self.assertEquals(['bob@example.com'],
+                      [json.loads(line)['id']
+                       for line in (output + resumed).splitlines()])
+
+  def testWorkersShareHostLimits(self):
+    pools = list()
+    class FakePool(object):
+      def __init__(self, processes, initializer, initargs):
+        pools.append((processes, initializer, initargs))
+      def imap_unordered(self, function, work, chunksize):
+        return iter([])
+      def terminate(self):
+        pass
+    import multiprocessing
+    original = multiprocessing.Pool
+    multiprocessing.Pool = FakePool
+    try:
+      webfinger.crawl(['bob@example.com'], StringIO.StringIO(), workers=4,
+                      progress=StringIO.StringIO(), rate=10.0,
+                      max_per_host=6, burst=2)
+    finally:
+      multiprocessing.Pool = original
+    processes, initializer, initargs = pools[0]
+    self.assertEquals(4, processes)
+    self.assertEquals(webfinger._init_worker, initializer)
+    self.assertEquals(
+        (None, {'rate': 2.5, 'max_per_host': 1, 'burst': 1}), initargs)
+
+  def testReadIds(self):
+    ids = StringIO.StringIO(
+        '# Accounts\nbob@example.com\n\n  alice@example.com \n'
+        'carol@example.com\n')
+    self.assertEquals(
+        ['bob@example.com', 'alice@example.com'],
+        list(webfinger._read_ids(ids, set(['carol@example.com']))))
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(ClientTest))
+  suite.addTests(unittest.makeSuite(ParseIdTest))
+  suite.addTests(unittest.makeSuite(HedgeTest))
+  suite.addTests(unittest.makeSuite(SingleFlightTest))
+  suite.addTests(unittest.makeSuite(CrawlTest))
+  return suite
+
+if __name__ == '__main__':
+  unittest.main()
@@ -73,6 +73,24 @@ class Parser(object):
     Raises:
       ParseError if the element can not be parsed
     """
+    return self.parse_into(string, xrd_pb2.Xrd())
+
+  def parse_into(self, string, description):
+    """Converts an XML string into an existing xrd_pb2.Xrd instance.
+
+    Every field of description is replaced. Its Link, Property and Title
+    submessages are refilled in place rather than allocated again, so
+    reusing one instance for many documents creates little garbage.
+
+    Args:
+      string: A string containing an XML XRD document.
+      description: The xrd_pb2.Xrd instance to fill
+    Returns:
+      description
+    Raises:
+      ParseError if the element can not be parsed, leaving description
+      unchanged
+    """
     if not string:
       raise ParseError('Empty input string.')
     try:
@@ -81,7 +99,6 @@ class Parser(object):
       raise ParseError('Could not parse %s\nError: %s' % (string, e))
     if document.tag != XRD_QNAME:
       raise ParseError('Root is not an <XRD/> element: %s' % document)
-    description = xrd_pb2.Xrd()
     self._parse_id(document, description)
     self._parse_expires(document, description)
     self._parse_subject(document, description)
@@ -90,6 +107,27 @@ class Parser(object):
     self._parse_links(document, description)
     return description
 
+  def parse_many(self, strings, description=None):
+    """Parses many XML strings into one reused xrd_pb2.Xrd instance.
+
+    Each description yielded is overwritten by the next, so serialize or
+    copy it before asking for another.
+
+    Args:
+      strings: An iterable of strings containing XML XRD documents
+      description: The xrd_pb2.Xrd instance to reuse [optional]
+    Yields:
+      A tuple of (xrd_pb2.Xrd, None), or (None, ParseError) for a string
+      that can not be parsed.
+    """
+    if description is None:
+      description = xrd_pb2.Xrd()
+    for string in strings:
+      try:
+        yield self.parse_into(string, description), None
+      except ParseError, e:
+        yield None, e
+
   def _parse_id(self, xrd_element, description):
     """Finds a xml:id attribute and adds it to the Xrd proto.
 
@@ -97,9 +135,7 @@ class Parser(object):
       xrd_element: An XRD Element
       description: The xrd_pb2.Xrd instance to be added to
     """
-    id_attribute = xrd_element.get(ID_ATTRIBUTE)
-    if id_attribute is not None:
-      description.id = id_attribute
+    _set(description, 'id', xrd_element.get(ID_ATTRIBUTE))
 
   def _parse_expires(self, xrd_element, description):
     """Finds an Expires element and adds it to the Xrd proto.
@@ -108,9 +144,7 @@ class Parser(object):
       xrd_element: An XRD Element
       description: The xrd_pb2.Xrd instance to be added to
     """
-    expires_element = xrd_element.find(EXPIRES_QNAME)
-    if expires_element is not None:
-      description.expires = expires_element.text
+    _set(description, 'expires', xrd_element.findtext(EXPIRES_QNAME))
 
   def _parse_subject(self, xrd_element, description):
     """Finds an Subject element and adds it to the Xrd proto.
@@ -119,9 +153,7 @@ class Parser(object):
       xrd_element: An XRD Element
       description: The xrd_pb2.Xrd instance to be added to
     """
-    subject_element = xrd_element.find(SUBJECT_QNAME)
-    if subject_element is not None:
-      description.subject = subject_element.text
+    _set(description, 'subject', xrd_element.findtext(SUBJECT_QNAME))
 
   def _parse_properties(self, xrd_element, description):
     """Finds Property elements and adds them to the Xrd proto.
@@ -130,14 +162,14 @@ class Parser(object):
       xrd_element: An XRD Element
       description: The xrd_pb2.Xrd instance to be added to
     """
+    count = 0
     for property_element in xrd_element.findall(PROPERTY_QNAME):
-      property_pb = description.properties.add()
+      property_pb = _reuse(description.properties, count)
+      count += 1
       property_pb.nil = (property_element.get(NIL_ATTRIBUTE) == 'true')
-      property_type = property_element.get('type')
-      if property_type != None:
-        property_pb.type = property_type
-      if property_element.text is not None:
-        property_pb.value = property_element.text
+      _set(property_pb, 'type', property_element.get('type'))
+      _set(property_pb, 'value', property_element.text)
+    del description.properties[count:]
 
   def _parse_aliases(self, xrd_element, description):
     """Finds Alias elements and adds them to the Xrd proto.
@@ -146,8 +178,9 @@ class Parser(object):
       xrd_element: An XRD Element
       description: The xrd_pb2.Xrd instance added to
     """
-    for alias_element in xrd_element.findall(ALIAS_QNAME):
-      description.aliases.append(alias_element.text)
+    description.aliases[:] = [
+        alias_element.text
+        for alias_element in xrd_element.findall(ALIAS_QNAME)]
 
   def _parse_links(self, xrd_element, description):
     """Finds Link elements and adds them to the Xrd proto.
@@ -156,22 +189,17 @@ class Parser(object):
       xrd_element: An XRD Element
       description: The xrd_pb2.Xrd instance to be added to
     """
+    count = 0
     for link_element in xrd_element.findall(LINK_QNAME):
-      link = description.links.add()
-      rel = link_element.get('rel')
-      if rel is not None:
-        link.rel = rel
-      type_attribute = link_element.get('type')
-      if type_attribute is not None:
-        link.type = type_attribute
-      href = link_element.get('href')
-      if href is not None:
-        link.href = href
-      template = link_element.get('template')
-      if template is not None:
-        link.template = template
+      link = _reuse(description.links, count)
+      count += 1
+      _set(link, 'rel', link_element.get('rel'))
+      _set(link, 'type', link_element.get('type'))
+      _set(link, 'href', link_element.get('href'))
+      _set(link, 'template', link_element.get('template'))
       self._parse_properties(link_element, link)
       self._parse_titles(link_element, link)
+    del description.links[count:]
 
   def _parse_titles(self, xrd_element, description):
     """Finds Title elements and adds them to the proto.
@@ -180,13 +208,32 @@ class Parser(object):
       xrd_element: An XRD Element
       description: The xrd_pb2.Xrd instance to be added to
     """
+    count = 0
     for title_element in xrd_element.findall(TITLE_QNAME):
-      title = description.titles.add()
-      lang = title_element.get(LANG_ATTRIBUTE)
-      if lang is not None:
-        title.lang = lang
-      if title_element.text is not None:
-        title.value = title_element.text
+      title = _reuse(description.titles, count)
+      count += 1
+      _set(title, 'lang', title_element.get(LANG_ATTRIBUTE))
+      _set(title, 'value', title_element.text)
+    del description.titles[count:]
+
+
+def _set(message, field, value):
+  """Sets a field of a message, or clears it if value is None."""
+  if value is None:
+    message.ClearField(field)
+  else:
+    setattr(message, field, value)
+
+
+def _reuse(container, index):
+  """Returns an element of a repeated message field, adding it if needed.
+
+  An existing element is returned as it is; the caller overwrites every
+  field of it.
+  """
+  if index < len(container):
+    return container[index]
+  return container.add()
 
 
 class JsonMarshaller(object):
@@ -199,17 +246,27 @@ class JsonMarshaller(object):
     self._json = json
 
   def to_json(self, description_or_descriptions, pretty=False):
-    if isinstance(description_or_descriptions, list):
-      output = list()
-      for description in description_or_descriptions:
-        output.append(self._to_object(description))
-    else:
-      output = self._to_object(description_or_descriptions)
+    output = self.to_object(description_or_descriptions)
     if pretty:
       return self._json.dumps(output, indent=2)
     else:
       return self._json.dumps(output)
 
+  def to_object(self, description_or_descriptions):
+    """Converts descriptions to JSON-serializable dicts and lists.
+
+    Args:
+      description_or_descriptions: An xrd_pb2.Xrd or a list of them
+    Returns:
+      A dict, or a list of dicts.
+    """
+    if isinstance(description_or_descriptions, list):
+      output = list()
+      for description in description_or_descriptions:
+        output.append(self._to_object(description))
+      return output
+    return self._to_object(description_or_descriptions)
+
   def _to_object(self, description):
     output = dict()
     if description.id:
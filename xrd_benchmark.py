@@ -0,0 +1,94 @@
+#!/usr/bin/python2.5
+#
+# Compares the garbage made by parsing XRD documents into new messages
+# and into one reused message.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Each run parses the documents and serializes each one at once, as the
+# batch jobs do. Messages are counted as they are constructed. The
+# collector is switched off during a run, so the objects it would have
+# had to find afterwards, and the time it then takes, measure the churn.
+
+import gc
+import sys
+import time
+import xrd
+import xrd_pb2
+
+from compactxrd_benchmark import DOCUMENT
+
+MESSAGE_CLASSES = [xrd_pb2.Xrd, xrd_pb2.Link, xrd_pb2.Property,
+                   xrd_pb2.Title]
+
+
+def count_messages():
+  """Counts the construction of XRD messages.
+
+  Returns:
+    A list whose first element is incremented by each construction.
+  """
+  counter = [0]
+  def counting(original):
+    def init(self, *args, **kwargs):
+      counter[0] += 1
+      original(self, *args, **kwargs)
+    return init
+  for cls in MESSAGE_CLASSES:
+    cls.__init__ = counting(cls.__init__)
+  return counter
+
+
+def parse_each(parser, documents):
+  for document in documents:
+    parser.parse(document).SerializeToString()
+
+
+def parse_many(parser, documents):
+  for description, error in parser.parse_many(documents):
+    description.SerializeToString()
+
+
+def run(name, function, parser, documents, counter):
+  gc.collect()
+  gc.disable()
+  try:
+    counter[0] = 0
+    tracked = len(gc.get_objects())
+    start = time.time()
+    function(parser, documents)
+    elapsed = time.time() - start
+    garbage = len(gc.get_objects()) - tracked
+    start = time.time()
+    gc.collect()
+    pause = time.time() - start
+  finally:
+    gc.enable()
+  print '%-11s %7.1f ms %6d messages %8d objects left %6.1f ms to collect' % (
+      name, elapsed * 1000, counter[0], garbage, pause * 1000)
+
+
+def main(argv):
+  count = 2000
+  if len(argv) > 1:
+    count = int(argv[1])
+  documents = [DOCUMENT % {'n': n} for n in range(count)]
+  parser = xrd.Parser()
+  counter = count_messages()
+  for name, function in [('parse', parse_each), ('parse_many', parse_many)]:
+    run(name, function, parser, documents, counter)
+
+if __name__ == "__main__":
+  main(sys.argv)
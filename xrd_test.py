@@ -195,9 +195,72 @@ class ParserTest(unittest.TestCase):
     self.assertEquals(expected_xrd_json, xrd_json)
 
 
+FULL_DOCUMENT = '''<XRD xmlns="http://docs.oasis-open.org/ns/xri/xrd-1.0"
+                           xml:id="full">
+                        <Subject>acct:full@example.com</Subject>
+                        <Alias>http://example.com/full</Alias>
+                        <Property type="http://example.com/p">1</Property>
+                        <Link rel="a" href="http://example.com/a">
+                          <Title xml:lang="en">A</Title>
+                        </Link>
+                        <Link rel="b" template="http://example.com/{uri}" />
+                      </XRD>'''
+
+SHORT_DOCUMENT = '''<XRD xmlns="http://docs.oasis-open.org/ns/xri/xrd-1.0">
+                         <Subject>acct:short@example.com</Subject>
+                         <Link rel="c" />
+                       </XRD>'''
+
+
+class ParseIntoTest(unittest.TestCase):
+
+  def testRefillsEveryField(self):
+    parser = xrd.Parser()
+    description = parser.parse(FULL_DOCUMENT)
+    link = description.links[0]
+    self.assertTrue(description is parser.parse_into(SHORT_DOCUMENT,
+                                                     description))
+    self.assertEquals(parser.parse(SHORT_DOCUMENT), description)
+    self.assertFalse(description.HasField('id'))
+    self.assertEquals(0, len(description.properties))
+    self.assertEquals(0, len(description.aliases))
+    self.assertEquals(1, len(description.links))
+    self.assertFalse(description.links[0].HasField('href'))
+    self.assertEquals(0, len(description.links[0].titles))
+    # The Link submessage was refilled, not replaced
+    self.assertTrue(link is description.links[0])
+    parser.parse_into(FULL_DOCUMENT, description)
+    self.assertEquals(parser.parse(FULL_DOCUMENT), description)
+
+  def testErrorsLeaveMessageUnchanged(self):
+    parser = xrd.Parser()
+    description = parser.parse(FULL_DOCUMENT)
+    self.assertRaises(xrd.ParseError, parser.parse_into, '<XRD', description)
+    self.assertEquals(parser.parse(FULL_DOCUMENT), description)
+
+  def testParseMany(self):
+    parser = xrd.Parser()
+    subjects = list()
+    errors = 0
+    descriptions = set()
+    for description, error in parser.parse_many(
+        [FULL_DOCUMENT, '', SHORT_DOCUMENT]):
+      if error is None:
+        subjects.append(description.subject)
+        descriptions.add(id(description))
+      else:
+        self.assertTrue(isinstance(error, xrd.ParseError))
+        errors += 1
+    self.assertEquals(['acct:full@example.com', 'acct:short@example.com'],
+                      subjects)
+    self.assertEquals(1, errors)
+    self.assertEquals(1, len(descriptions))
+
+
 def suite():
   suite = unittest.TestSuite()
   suite.addTests(unittest.makeSuite(ParserTest))
+  suite.addTests(unittest.makeSuite(ParseIntoTest))
   suite.addTests(unittest.makeSuite(JsonTest))
   return suite
 
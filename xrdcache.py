@@ -0,0 +1,363 @@
+#!/usr/bin/python2.5
+#
+# Caches parsed XRD documents, refreshing hot ones before they expire.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import Queue
+import calendar
+import logging
+import lru
+import re
+import singleflight
+import threading
+import time
+
+# The lifetime of a document that does not say when it expires, in seconds
+DEFAULT_TTL = 300
+
+# Bounds on the lifetime of any document, whatever its Expires says
+MIN_TTL = 30
+MAX_TTL = 24 * 60 * 60
+
+# The fraction of a lifetime, at its end, during which a hot entry is
+# refreshed in the background
+DEFAULT_REFRESH_FRACTION = 0.2
+
+# The default number of concurrent background refreshes
+DEFAULT_MAX_CONCURRENT = 4
+
+# The default number of documents held
+DEFAULT_MAX_ENTRIES = 10000
+
+# The default seconds between scans for hot entries due a refresh
+DEFAULT_SCAN_INTERVAL = 5.0
+
+# An xs:dateTime, as used by the XRD Expires element
+DATETIME_RE = re.compile(
+    r'^\s*(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.\d+)?'
+    r'(Z|[+-]\d\d:\d\d)?\s*$')
+
+
+def parse_datetime(value):
+  """Converts an xs:dateTime to seconds since the epoch.
+
+  Args:
+    value: A string like '2009-11-05T12:00:00Z'; no timezone means UTC
+  Returns:
+    The time as a float, or None if value can not be parsed.
+  """
+  if not value:
+    return None
+  match = DATETIME_RE.match(value)
+  if not match:
+    return None
+  fields = [int(field) for field in match.groups()[:6]]
+  try:
+    seconds = calendar.timegm(fields + [0, 0, 0])
+  except (ValueError, OverflowError):
+    return None
+  zone = match.group(7)
+  if zone and zone != 'Z':
+    offset = int(zone[1:3]) * 3600 + int(zone[4:6]) * 60
+    if zone[0] == '+':
+      seconds -= offset
+    else:
+      seconds += offset
+  return float(seconds)
+
+
+class _Entry(object):
+  """A cached document and what is needed to revalidate it."""
+
+  __slots__ = ('key', 'value', 'loader', 'etag', 'last_modified',
+               'source_expires', 'loaded', 'expires', 'refresh_at',
+               'accessed', 'refreshing')
+
+  def __init__(self, key, value, loader, etag, last_modified, source_expires,
+               loaded, expires, refresh_at, accessed):
+    self.key = key
+    self.value = value
+    self.loader = loader
+    self.etag = etag
+    self.last_modified = last_modified
+    # The expiry the loader gave, kept for revalidations that don't
+    # return the document
+    self.source_expires = source_expires
+    self.loaded = loaded
+    self.expires = expires
+    self.refresh_at = refresh_at
+    self.accessed = accessed
+    self.refreshing = False
+
+
+class RefreshAheadCache(object):
+  """A cache of parsed documents that keeps recently used ones fresh.
+
+  Values are produced by a loader function, called as
+
+    loader(key, etag, last_modified)
+
+  which returns a tuple of (value, etag, last_modified, expires). The
+  validators are those of the cached copy, or None, so that the loader can
+  make a conditional request; it returns a value of None when the document
+  has not been modified. expires is seconds since the epoch, or None.
+
+  Once an entry is within the last refresh_fraction of its lifetime, the
+  next access, or a periodic scan if it was accessed within hot_window
+  seconds, hands it to a bounded pool of background threads to reload.
+  Meanwhile the cached copy is still served, so hot entries never expire
+  in the request path. Cold entries simply expire.
+
+  With max_concurrent set to 0 no threads are started, as on runtimes that
+  don't allow them outside a request. Entries are then revalidated in the
+  request path once they expire.
+  """
+
+  def __init__(self, ttl=DEFAULT_TTL, refresh_fraction=DEFAULT_REFRESH_FRACTION,
+               hot_window=None, max_concurrent=DEFAULT_MAX_CONCURRENT,
+               max_entries=DEFAULT_MAX_ENTRIES,
+               scan_interval=DEFAULT_SCAN_INTERVAL):
+    """Constructs a new cache.
+
+    Args:
+      ttl: The lifetime of documents with no expiry [optional]
+      refresh_fraction: The end fraction of a lifetime in which hot entries
+        are refreshed [optional]
+      hot_window: Seconds since its last access that an entry counts as
+        hot, defaulting to ttl [optional]
+      max_concurrent: The number of background refresh threads, or 0 for
+        none [optional]
+      max_entries: The number of documents held [optional]
+      scan_interval: Seconds between scans for hot entries due a refresh,
+        or None to refresh only on access [optional]
+    """
+    self._ttl = ttl
+    self._refresh_fraction = refresh_fraction
+    if hot_window is None:
+      hot_window = ttl
+    self._hot_window = hot_window
+    self._max_concurrent = max_concurrent
+    self._scan_interval = scan_interval
+    self._entries = lru.LruCache(max_entries)
+    self._loads = singleflight.Group()
+    self._queue = Queue.Queue()
+    self._lock = threading.Lock()
+    self._started = False
+    self.hits = 0
+    self.misses = 0
+    self.refreshes = 0
+    self.refresh_failures = 0
+    self.not_modified = 0
+
+  def get(self, key, loader):
+    """Returns the value for key, loading it inline only if absent or expired.
+
+    Args:
+      key: The cache key, usually a URL
+      loader: A function as described in the class docstring
+    Returns:
+      The cached or newly loaded value.
+    Raises:
+      Any exception raised by loader
+    """
+    self._start()
+    now = time.time()
+    entry = self._entries.get(key)
+    if entry is not None and now < entry.expires:
+      entry.accessed = now
+      self._count('hits')
+      if now >= entry.refresh_at:
+        self._schedule(entry)
+      return entry.value
+    self._count('misses')
+    return self._loads.do(key, self._load, key, loader).value
+
+  def put(self, key, value, loader, etag=None, last_modified=None,
+          expires=None, loaded=None):
+    """Stores a value loaded elsewhere, such as from a snapshot.
+
+    The entry's lifetime is computed as if it had been loaded at loaded.
+    If that lifetime is already over, the entry is kept as stale: it is not
+    served, but the next read revalidates it with its validators. A stale
+    value without validators is not stored. The entry counts as cold until
+    it is first read.
+
+    Args:
+      key: The cache key
+      value: The value
+      loader: The function used to refresh the value
+      etag: The ETag of the value [optional]
+      last_modified: The Last-Modified date of the value [optional]
+      expires: The expiry time the loader gave, in seconds since the
+        epoch [optional]
+      loaded: When the value was loaded, defaulting to now [optional]
+    Returns:
+      Whether the value was stored.
+    """
+    now = time.time()
+    if loaded is None:
+      loaded = now
+    lifetime_expires, refresh_at = self._lifetime(loaded, expires)
+    if lifetime_expires <= now and not etag and not last_modified:
+      return False
+    self._entries.set(key, _Entry(key, value, loader, etag, last_modified,
+                                  expires, loaded, lifetime_expires,
+                                  refresh_at, 0))
+    return True
+
+  def entries(self):
+    """Returns every entry, stale ones included, least recently used first.
+
+    Returns:
+      A list of (key, value, etag, last_modified, expires, loaded) tuples,
+      where expires is the expiry the loader gave, or None, and loaded is
+      when the value was loaded.
+    """
+    entries = list()
+    for key, entry in self._entries.items():
+      entries.append((key, entry.value, entry.etag, entry.last_modified,
+                      entry.source_expires, entry.loaded))
+    return entries
+
+  def scan(self):
+    """Schedules a refresh of every hot entry that is due one.
+
+    Returns:
+      The number of entries scheduled.
+    """
+    now = time.time()
+    scheduled = 0
+    for key, entry in self._entries.items():
+      if entry.refreshing or now < entry.refresh_at:
+        continue
+      if now - entry.accessed > self._hot_window:
+        continue
+      if self._schedule(entry):
+        scheduled += 1
+    return scheduled
+
+  def stats(self):
+    """Returns a dict of cache and refresh counters."""
+    lookups = self.hits + self.misses
+    stats = {'entries': len(self._entries),
+             'hits': self.hits,
+             'misses': self.misses,
+             'refreshes': self.refreshes,
+             'refresh_failures': self.refresh_failures,
+             'not_modified': self.not_modified,
+             'pending_refreshes': self._queue.qsize(),
+             'hit_ratio': 0.0}
+    if lookups:
+      stats['hit_ratio'] = float(self.hits) / lookups
+    return stats
+
+  def _lifetime(self, now, expires):
+    """Returns the (expires, refresh_at) times for a newly loaded entry."""
+    if expires is None:
+      lifetime = self._ttl
+    else:
+      lifetime = min(max(expires - now, MIN_TTL), MAX_TTL)
+    return now + lifetime, now + lifetime * (1 - self._refresh_fraction)
+
+  def _load(self, key, loader):
+    """Loads key, revalidating the cached copy if there is one."""
+    entry = self._entries.get(key)
+    if entry is None:
+      value, etag, last_modified, expires = loader(key, None, None)
+    else:
+      value, etag, last_modified, expires = loader(
+          key, entry.etag, entry.last_modified)
+    now = time.time()
+    accessed = now
+    if entry is not None:
+      accessed = entry.accessed
+      if value is None:
+        self._count('not_modified')
+        value = entry.value
+        etag = etag or entry.etag
+        last_modified = last_modified or entry.last_modified
+        if expires is None:
+          expires = entry.source_expires
+    lifetime_expires, refresh_at = self._lifetime(now, expires)
+    entry = _Entry(key, value, loader, etag, last_modified, expires, now,
+                   lifetime_expires, refresh_at, accessed)
+    self._entries.set(key, entry)
+    return entry
+
+  def _schedule(self, entry):
+    """Queues entry for a background refresh unless one is pending.
+
+    Returns:
+      True if the entry was queued.
+    """
+    if not self._max_concurrent:
+      return False
+    self._lock.acquire()
+    try:
+      if entry.refreshing:
+        return False
+      entry.refreshing = True
+    finally:
+      self._lock.release()
+    self._queue.put(entry)
+    return True
+
+  def _start(self):
+    """Starts the refresh threads the first time the cache is used."""
+    if self._started:
+      return
+    self._lock.acquire()
+    try:
+      if self._started:
+        return
+      self._started = True
+      targets = [self._refresh] * self._max_concurrent
+      if self._scan_interval:
+        targets.append(self._scan_periodically)
+      for target in targets:
+        thread = threading.Thread(target=target)
+        thread.setDaemon(True)
+        thread.start()
+    finally:
+      self._lock.release()
+
+  def _refresh(self):
+    """Reloads queued entries, one at a time, forever."""
+    while True:
+      entry = self._queue.get()
+      try:
+        self._loads.do(entry.key, self._load, entry.key, entry.loader)
+        self._count('refreshes')
+      except Exception, e:
+        # The cached copy is served until it expires
+        logging.warning('Could not refresh %s: %s' % (entry.key, e))
+        self._count('refresh_failures')
+      entry.refreshing = False
+
+  def _scan_periodically(self):
+    while True:
+      time.sleep(self._scan_interval)
+      try:
+        self.scan()
+      except Exception:
+        logging.exception('Refresh scan failed')
+
+  def _count(self, counter):
+    self._lock.acquire()
+    try:
+      setattr(self, counter, getattr(self, counter) + 1)
+    finally:
+      self._lock.release()
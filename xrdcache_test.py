@@ -0,0 +1,167 @@
+#!/usr/bin/python2.5
+#
+# Tests the refresh-ahead XRD cache.
+#
+# Copyright 2009 DeWitt Clinton
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import threading
+import time
+import unittest
+import xrdcache
+
+
+class FakeLoader(object):
+  """Returns numbered versions of a document, honoring validators."""
+
+  def __init__(self, modified=True, error=None):
+    self.modified = modified
+    self.error = error
+    self.expires = None
+    self.calls = list()
+    self.called = threading.Event()
+
+  def __call__(self, key, etag, last_modified):
+    self.calls.append((key, etag))
+    self.called.set()
+    if self.error:
+      raise self.error
+    if etag and not self.modified:
+      return None, etag, last_modified, None
+    version = len(self.calls)
+    return 'version %d' % version, 'etag-%d' % version, None, self.expires
+
+
+def wait_for(condition, timeout=5.0):
+  deadline = time.time() + timeout
+  while not condition() and time.time() < deadline:
+    time.sleep(0.01)
+  return condition()
+
+
+class ParseDatetimeTest(unittest.TestCase):
+
+  def testUtc(self):
+    self.assertEquals(1257422400.0,
+                      xrdcache.parse_datetime('2009-11-05T12:00:00Z'))
+
+  def testNoZone(self):
+    self.assertEquals(1257422400.0,
+                      xrdcache.parse_datetime('2009-11-05T12:00:00'))
+
+  def testOffset(self):
+    self.assertEquals(1257422400.0,
+                      xrdcache.parse_datetime('2009-11-05T13:30:00.25+01:30'))
+    self.assertEquals(1257422400.0,
+                      xrdcache.parse_datetime('2009-11-05T07:00:00-05:00'))
+
+  def testInvalid(self):
+    self.assertEquals(None, xrdcache.parse_datetime(None))
+    self.assertEquals(None, xrdcache.parse_datetime('tomorrow'))
+    self.assertEquals(None, xrdcache.parse_datetime('2009-13-45T99:00:00Z'))
+
+
+class RefreshAheadCacheTest(unittest.TestCase):
+
+  def testLoadsOnce(self):
+    loader = FakeLoader()
+    cache = xrdcache.RefreshAheadCache(scan_interval=None)
+    self.assertEquals('version 1', cache.get('a', loader))
+    self.assertEquals('version 1', cache.get('a', loader))
+    self.assertEquals(1, len(loader.calls))
+    stats = cache.stats()
+    self.assertEquals(1, stats['hits'])
+    self.assertEquals(1, stats['misses'])
+
+  def testRevalidatesExpiredEntries(self):
+    loader = FakeLoader(modified=False)
+    cache = xrdcache.RefreshAheadCache(ttl=0.05, scan_interval=None)
+    cache.get('a', loader)
+    time.sleep(0.1)
+    self.assertEquals('version 1', cache.get('a', loader))
+    self.assertEquals([('a', None), ('a', 'etag-1')], loader.calls)
+    self.assertEquals(1, cache.stats()['not_modified'])
+
+  def testRevalidationKeepsDocumentExpiry(self):
+    loader = FakeLoader(modified=False)
+    loader.expires = time.time() + 3600
+    cache = xrdcache.RefreshAheadCache(scan_interval=None)
+    cache.get('a', loader)
+    # Expire the cached copy early, to force a revalidation
+    cache._entries.get('a').expires = 0
+    self.assertEquals('version 1', cache.get('a', loader))
+    self.assertEquals(2, len(loader.calls))
+    # The 304 carried no expiry, so the document's own still applies
+    # rather than the default ttl
+    self.assertTrue(cache._entries.get('a').expires > time.time() + 3000)
+
+  def testWithoutThreads(self):
+    loader = FakeLoader(modified=False)
+    cache = xrdcache.RefreshAheadCache(ttl=0.2, refresh_fraction=0.8,
+                                       max_concurrent=0, scan_interval=None)
+    threads = threading.activeCount()
+    cache.get('a', loader)
+    time.sleep(0.1)
+    self.assertEquals('version 1', cache.get('a', loader))
+    self.assertEquals(0, cache.scan())
+    self.assertEquals(threads, threading.activeCount())
+    self.assertEquals(1, len(loader.calls))
+    time.sleep(0.15)
+    self.assertEquals('version 1', cache.get('a', loader))
+    self.assertEquals([('a', None), ('a', 'etag-1')], loader.calls)
+
+  def testRefreshesHotEntriesOnAccess(self):
+    loader = FakeLoader()
+    cache = xrdcache.RefreshAheadCache(ttl=0.5, refresh_fraction=0.8,
+                                       scan_interval=None)
+    cache.get('a', loader)
+    time.sleep(0.15)
+    self.assertEquals('version 1', cache.get('a', loader))
+    self.assert_(wait_for(lambda: cache.stats()['refreshes'] == 1))
+    self.assertEquals('version 2', cache.get('a', loader))
+    self.assertEquals(1, cache.stats()['misses'])
+
+  def testScanRefreshesOnlyHotEntries(self):
+    loader = FakeLoader()
+    cache = xrdcache.RefreshAheadCache(ttl=0.5, refresh_fraction=0.8,
+                                       hot_window=0.1, scan_interval=None)
+    cache.get('hot', loader)
+    cache.get('cold', loader)
+    time.sleep(0.06)
+    cache.get('hot', loader)
+    time.sleep(0.06)
+    self.assertEquals(1, cache.scan())
+    self.assert_(wait_for(lambda: cache.stats()['refreshes'] == 1))
+    self.assertEquals(('hot', 'etag-1'), loader.calls[-1])
+
+  def testKeepsServingWhenRefreshFails(self):
+    loader = FakeLoader()
+    cache = xrdcache.RefreshAheadCache(ttl=0.5, refresh_fraction=0.8,
+                                       scan_interval=None)
+    cache.get('a', loader)
+    time.sleep(0.15)
+    loader.error = Exception('Host down')
+    cache.get('a', loader)
+    self.assert_(wait_for(lambda: cache.stats()['refresh_failures'] == 1))
+    self.assertEquals('version 1', cache.get('a', loader))
+
+
+def suite():
+  suite = unittest.TestSuite()
+  suite.addTests(unittest.makeSuite(ParseDatetimeTest))
+  suite.addTests(unittest.makeSuite(RefreshAheadCacheTest))
+  return suite
+
+if __name__ == '__main__':
+  unittest.main()